@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Room, Complaint, ComplaintImage, Department, Issue_Category
+from .models import Room, Complaint, ComplaintEscalation, ComplaintImage, Department, Issue_Category
 
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
@@ -7,7 +7,7 @@ class RoomAdmin(admin.ModelAdmin):
     list_filter = ('status', 'Block', 'Floor_no', 'ward', 'speciality', 'room_type')
     search_fields = ('room_no', 'bed_no', 'Block', 'ward')
     ordering = ('Block', 'Floor_no', 'room_no')
-    readonly_fields = ('qr_code',)
+    readonly_fields = ('dataenc', 'qr_hash')
 
 class ComplaintImageInline(admin.TabularInline):
     model = ComplaintImage
@@ -26,6 +26,13 @@ class ComplaintAdmin(admin.ModelAdmin):
     ordering = ('-submitted_at',)
     date_hierarchy = 'submitted_at'
 
+@admin.register(ComplaintEscalation)
+class ComplaintEscalationAdmin(admin.ModelAdmin):
+    list_display = ('ticket_id', 'assigned_department', 'priority', 'status', 'due_at', 'escalated_at')
+    list_filter = ('priority', 'assigned_department')
+    search_fields = ('ticket_id',)
+    ordering = ('-escalated_at',)
+
 @admin.register(Department)
 class DepartmentAdmin(admin.ModelAdmin):
     list_display = ('department_code', 'department_name','status')
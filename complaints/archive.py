@@ -0,0 +1,71 @@
+from collections import Counter
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import ArchivedComplaint, ArchivedComplaintImage, Complaint, ComplaintImage
+from .rollups import batched_rollup_updates, complaint_state, move_complaint
+from .storage import add_references, batched_releases, is_content_addressed
+
+ARCHIVABLE_STATUSES = ('resolved', 'closed')
+
+
+def archivable_complaints(older_than_days, now=None):
+    # Resolved or closed, and neither submitted nor resolved within the last `older_than_days`
+    cutoff = (now or timezone.now()) - timedelta(days=older_than_days)
+    return Complaint.objects.filter(
+        Q(resolved_at__isnull=True) | Q(resolved_at__lt=cutoff),
+        status__in=ARCHIVABLE_STATUSES,
+        submitted_at__lt=cutoff,
+    )
+
+
+def archive_complaints(older_than_days, batch_size=500, now=None):
+    """
+    Moves old resolved and closed complaints, with their image rows, from the
+    live tables to the archive, `batch_size` complaints per transaction.
+    Returns the number of complaints archived.
+
+    Their report counts and TAT sketches move to the archived rollup rows, so
+    reports only include them when asked to. Status history and escalations
+    are keyed by ticket_id and are left as they are.
+    """
+    now = now or timezone.now()
+    fields = [field.attname for field in ArchivedComplaint._meta.concrete_fields if field.name != 'archived_at']
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                archivable_complaints(older_than_days, now).select_for_update().order_by('submitted_at')[:batch_size]
+            )
+            if not batch:
+                return archived
+            ticket_ids = [complaint.ticket_id for complaint in batch]
+            images = list(ComplaintImage.objects.filter(complaint_id__in=ticket_ids))
+
+            ArchivedComplaint.objects.bulk_create(
+                ArchivedComplaint(archived_at=now, **{field: getattr(complaint, field) for field in fields})
+                for complaint in batch
+            )
+            ArchivedComplaintImage.objects.bulk_create(
+                ArchivedComplaintImage(
+                    complaint_id=image.complaint_id, image=image.image.name, preview=image.preview.name,
+                    thumbnail=image.thumbnail.name
+                )
+                for image in images
+            )
+            # The archived rows take their own references to the files, before
+            # deleting the live image rows releases theirs
+            names = Counter(
+                field.name for image in images for field in (image.image, image.preview, image.thumbnail)
+                if is_content_addressed(field.name)
+            )
+            for name, count in names.items():
+                add_references(name, count)
+            with batched_rollup_updates(), batched_releases():
+                for complaint in batch:
+                    move_complaint(None, complaint_state(complaint), archived=True)
+                # The delete signals take the complaints out of the live rollups, and
+                # the image rows' references off their files
+                Complaint.objects.filter(pk__in=ticket_ids).delete()
+            archived += len(batch)
@@ -0,0 +1,60 @@
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+
+class IssueCatalog:
+    """
+    In-process map of active issue category names to their department names.
+
+    The catalog is reloaded when the version in the Django cache, shared by
+    every worker, changes (invalidate() is called by the signals in
+    complaints/signals.py), or after ISSUE_CATALOG_MAX_AGE seconds as a safety
+    net.
+    """
+    version_key = 'complaints:issue_catalog_version'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._departments = None
+        self._version = None
+        self._loaded_at = 0.0
+
+    def department_for(self, issue_category_name):
+        return self._get_departments().get(issue_category_name)
+
+    def invalidate(self):
+        # A new random version rather than an increment: incr() isn't atomic on
+        # every backend, and two racing bumps that wrote the same number would
+        # hide the second change from a worker that reloaded in between
+        cache.set(self.version_key, uuid.uuid4().hex, None)
+        self._departments = None
+
+    def _get_departments(self):
+        version = cache.get(self.version_key)
+        departments = self._departments
+        if (
+            departments is None
+            or version != self._version
+            or time.monotonic() - self._loaded_at > settings.ISSUE_CATALOG_MAX_AGE
+        ):
+            with self._lock:
+                departments = self._load()
+                self._departments = departments
+                self._version = version
+                self._loaded_at = time.monotonic()
+        return departments
+
+    def _load(self):
+        from .models import Issue_Category
+
+        return dict(
+            Issue_Category.objects.filter(status='active').values_list(
+                'issue_category_name', 'department__department_name'
+            )
+        )
+
+
+issue_catalog = IssueCatalog()
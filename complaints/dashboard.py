@@ -0,0 +1,119 @@
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import Complaint
+from .sla import ACTIVE_STATUSES
+
+# Upper bounds (in hours) of the open backlog age buckets; the last bucket is open ended
+BACKLOG_AGE_HOURS = (4, 24, 72, 168)
+
+SUMMARY_CACHE_KEY = 'complaints:dashboard_summary'
+
+# Held by the thread refreshing a key, so the other threads of this worker don't
+# all race for the cache lock (cache.add() isn't atomic on the file cache)
+_refresh_locks = {}
+
+
+def dashboard_summary():
+    """
+    Complaint counts by status, priority, department and ward, today's volume
+    and the age of the open backlog, from one grouped pass over the complaints.
+    """
+    now = timezone.now()
+    today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    edges = [now - timedelta(hours=hours) for hours in BACKLOG_AGE_HOURS]
+    labels = [f'{low}-{high}h' for low, high in zip((0, *BACKLOG_AGE_HOURS), BACKLOG_AGE_HOURS)]
+    labels.append(f'{BACKLOG_AGE_HOURS[-1]}h+')
+    backlog = Q(status__in=ACTIVE_STATUSES)
+
+    # One row per department and ward, each counting every figure the dashboard shows
+    columns = {
+        'total': Count('pk'),
+        'today': Count('pk', filter=Q(submitted_at__gte=today)),
+        **{f'status_{value}': Count('pk', filter=Q(status=value)) for value, _ in Complaint.STATUS_CHOICES},
+        **{f'priority_{value}': Count('pk', filter=Q(priority=value)) for value, _ in Complaint.PRIORITY_CHOICES},
+    }
+    for i, label in enumerate(labels):
+        age = backlog
+        if i < len(edges):
+            age &= Q(submitted_at__gt=edges[i])
+        if i:
+            age &= Q(submitted_at__lte=edges[i - 1])
+        columns[f'backlog_{i}'] = Count('pk', filter=age)
+    rows = Complaint.objects.values('assigned_department', 'ward').annotate(**columns).order_by()
+
+    totals = dict.fromkeys(columns, 0)
+    departments = {}
+    wards = {}
+    for row in rows:
+        for name in columns:
+            totals[name] += row[name]
+        for groups, key in ((departments, row['assigned_department'] or ''), (wards, row['ward'])):
+            group = groups.setdefault(key, dict.fromkeys(['total', 'today', 'open_tickets'], 0))
+            group['total'] += row['total']
+            group['today'] += row['today']
+            group['open_tickets'] += sum(row[f'status_{status}'] for status in ACTIVE_STATUSES)
+
+    return {
+        'generated_at': now,
+        'total_tickets': totals['total'],
+        'today': totals['today'],
+        'by_status': {value: totals[f'status_{value}'] for value, _ in Complaint.STATUS_CHOICES},
+        'by_priority': {value: totals[f'priority_{value}'] for value, _ in Complaint.PRIORITY_CHOICES},
+        'by_department': [
+            {'assigned_department': department or None, **counts} for department, counts in sorted(departments.items())
+        ],
+        'by_ward': [{'ward': ward, **counts} for ward, counts in sorted(wards.items())],
+        'backlog_age': [{'bucket': label, 'count': totals[f'backlog_{i}']} for i, label in enumerate(labels)],
+    }
+
+
+def cached(key, ttl, compute, wait=5.0):
+    """
+    Returns compute()'s result, cached in the Django cache for `ttl` seconds.
+
+    When the entry goes stale one caller recomputes it while the others keep
+    serving the stale value, so a burst of requests costs one computation per
+    ttl. Within a worker that is guaranteed by a thread lock. Across workers
+    it goes through a cache.add() lock in the shared cache, which is atomic on
+    Redis but not on the file cache: there, workers that miss at the very same
+    moment may each compute once. Callers that find nothing cached at all wait
+    up to `wait` seconds for that result.
+    """
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+    if entry is not None and entry['fresh_until'] > time.time():
+        return entry['value']
+
+    refresh_lock = _refresh_locks.setdefault(key, threading.Lock())
+    if refresh_lock.acquire(blocking=False):
+        try:
+            if cache.add(lock_key, True, timeout=wait):
+                try:
+                    value = compute()
+                    # Stale values stay around a while longer for the callers that don't hold the lock
+                    cache.set(key, {'value': value, 'fresh_until': time.time() + ttl}, ttl * 10)
+                    return value
+                finally:
+                    cache.delete(lock_key)
+        finally:
+            refresh_lock.release()
+    if entry is not None:
+        return entry['value']
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+    # The lock holder gave up; don't leave the caller without an answer
+    return compute()
+
+
+def get_dashboard_summary():
+    return cached(SUMMARY_CACHE_KEY, settings.DASHBOARD_CACHE_TTL, dashboard_summary)
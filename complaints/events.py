@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from functools import partial
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils.module_loading import import_string
+from rest_framework.utils import encoders
+
+logger = logging.getLogger(__name__)
+
+# Query parameter of the feed -> event field it filters on
+FEED_FILTERS = {'department': 'assigned_department', 'ward': 'ward', 'priority': 'priority'}
+
+
+def complaint_event(status_event, ward):
+    # What the feed sends for a ComplaintStatusEvent; the ward is the complaint's
+    return {
+        'id': status_event.pk,
+        'type': 'created' if status_event.from_status is None else 'status_changed',
+        'ticket_id': status_event.ticket_id,
+        'assigned_department': status_event.assigned_department,
+        'ward': ward,
+        'priority': status_event.priority,
+        'from_status': status_event.from_status,
+        'status': status_event.to_status,
+        'changed_at': status_event.changed_at,
+    }
+
+
+def status_events_after(last_id, limit):
+    """The feed events for ComplaintStatusEvents after `last_id`, oldest first."""
+    from .models import Complaint, ComplaintStatusEvent
+
+    ward = Complaint.objects.filter(ticket_id=OuterRef('ticket_id')).values('ward')[:1]
+    rows = ComplaintStatusEvent.objects.filter(pk__gt=last_id).annotate(ward=Subquery(ward)).order_by('pk')[:limit]
+    return [complaint_event(row, row.ward) for row in rows]
+
+
+def publish_status_event(status_event, ward):
+    # Sent once the status change commits; a failing backend doesn't fail the write
+    transaction.on_commit(partial(get_backend().publish, complaint_event(status_event, ward)), robust=True)
+
+
+class Subscription:
+    """
+    One feed client: the events matching its filters wait in a bounded queue
+    on the client's event loop. A client that lets the queue fill up is cut
+    off (it reconnects and catches up from its Last-Event-ID) rather than
+    holding events in memory.
+    """
+
+    def __init__(self, filters, loop):
+        self.filters = filters
+        self.loop = loop
+        self.queue = asyncio.Queue(settings.COMPLAINT_FEED_MAX_PENDING)
+        self.overflowed = False
+
+    def matches(self, event):
+        return all(event[field] in values for field, values in self.filters.items())
+
+    def put(self, event):
+        # Runs on self.loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventHub:
+    """
+    In-process pub/sub between the threads that publish complaint events and
+    the feed clients waiting on this worker's event loop(s). An idle client
+    costs a waiting coroutine and a queue, nothing more.
+    """
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, filters):
+        subscription = Subscription(filters, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        get_backend().listen()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def dispatch(self, event):
+        # Safe to call from any thread
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.matches(event):
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.put, event)
+                except RuntimeError:
+                    # Its event loop is closed
+                    self.unsubscribe(subscription)
+
+
+hub = EventHub()
+
+
+class LocalBackend:
+    """
+    Delivers events straight to this process's subscribers. Enough for a
+    single worker, and the stand-in the tests use.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, event):
+        self.hub.dispatch(event)
+
+    def listen(self):
+        pass
+
+
+class StatusEventBackend:
+    """
+    Delivers events across workers. Every status change is already written to
+    ComplaintStatusEvent in the same transaction, so publishing takes no extra
+    work: each worker with feed clients tails that table from one thread,
+    one indexed query per COMPLAINT_EVENTS_POLL_INTERVAL however many clients
+    are connected, and hands what it finds to its own subscribers.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.last_id = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, event):
+        pass
+
+    def listen(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='complaint-events', daemon=True)
+                self._thread.start()
+
+    def poll(self):
+        from .models import ComplaintStatusEvent
+
+        if self.last_id is None:
+            # Start from now; clients catch up on older events with Last-Event-ID
+            self.last_id = ComplaintStatusEvent.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            return
+        events = status_events_after(self.last_id, 500)
+        for event in events:
+            self.hub.dispatch(event)
+        if events:
+            self.last_id = events[-1]['id']
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Polling for complaint events failed')
+                connections.close_all()
+            time.sleep(settings.COMPLAINT_EVENTS_POLL_INTERVAL)
+
+
+_backends = {}
+
+
+def get_backend():
+    # One per process for each COMPLAINT_EVENTS_BACKEND
+    path = settings.COMPLAINT_EVENTS_BACKEND
+    if path not in _backends:
+        _backends[path] = import_string(path)(hub)
+    return _backends[path]
+
+
+def format_event(event):
+    data = json.dumps(event, cls=encoders.JSONEncoder)
+    return f'id: {event["id"]}\nevent: {event["type"]}\ndata: {data}\n\n'
+
+
+async def feed_stream(subscription, missed=()):
+    """
+    The Server-Sent Events body for one client: the `missed` events it asked
+    to catch up on, then live ones, with a comment line every
+    COMPLAINT_FEED_HEARTBEAT seconds so proxies keep an idle stream open.
+    """
+    last_id = 0
+    try:
+        # Sent straight away so the client sees the stream open
+        yield ': connected\n\n'
+        for event in missed:
+            if subscription.matches(event):
+                last_id = event['id']
+                yield format_event(event)
+        while not subscription.overflowed:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), settings.COMPLAINT_FEED_HEARTBEAT)
+            except TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            # Skip events already sent while catching up
+            if event['id'] > last_id:
+                yield format_event(event)
+    finally:
+        hub.unsubscribe(subscription)
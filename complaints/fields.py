@@ -0,0 +1,37 @@
+from django.db import models
+from django.utils import timezone
+
+
+class MinuteOfDayField(models.PositiveSmallIntegerField):
+    """
+    Minute of the day (0-1439, in the current time zone) of another datetime
+    field on the model, filled in on save.
+
+    Time-of-day filters on the datetime itself (`__time__gte`) wrap the column
+    in a function and can't use an index; filtering on this stored copy can.
+    Declare it after the source field so auto_now/auto_now_add values are set
+    by the time it is computed.
+    """
+
+    def __init__(self, source, *args, **kwargs):
+        self.source = source
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if kwargs.get('editable') is False:
+            del kwargs['editable']
+        return name, path, [self.source, *args], kwargs
+
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.source)
+        if value is not None:
+            setattr(model_instance, self.attname, minute_of_day(value))
+        return super().pre_save(model_instance, add)
+
+
+def minute_of_day(value):
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.hour * 60 + value.minute
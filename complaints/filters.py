@@ -0,0 +1,64 @@
+from datetime import time
+from django.db.models import Q
+from django_filters import rest_framework as filters
+from .models import Complaint
+
+LAST_MINUTE = 24 * 60 - 1
+
+
+def parse_time_of_day(value, error_message='Invalid time format. Use HH:MM (24-hour)'):
+    try:
+        hour, minute = map(int, value.split(':'))
+        return time(hour, minute)
+    except ValueError:
+        raise ValueError(error_message)
+
+
+def submitted_time_window(start=None, end=None):
+    """
+    Complaints submitted between two times of day (inclusive, to the minute).
+    A window whose start is after its end wraps past midnight, e.g. 22:00-06:00.
+    """
+    start_minute = start.hour * 60 + start.minute if start else 0
+    end_minute = end.hour * 60 + end.minute if end else LAST_MINUTE
+    if start_minute <= end_minute:
+        return Q(submitted_minute__range=(start_minute, end_minute))
+    # Two bounded ranges, so SQLite can search complaint_minute_idx for each side
+    # instead of walking every complaint newest first
+    return Q(submitted_minute__range=(start_minute, LAST_MINUTE)) | Q(submitted_minute__range=(0, end_minute))
+
+
+class SubmittedTimeFilterSet(filters.FilterSet):
+    # ?start_time=22:00&end_time=06:00 selects night shift complaints on any date
+    start_time = filters.TimeFilter(method='filter_submitted_time', label='Submitted from (HH:MM)')
+    end_time = filters.TimeFilter(method='filter_submitted_time', label='Submitted until (HH:MM)')
+
+    def filter_submitted_time(self, queryset, name, value):
+        # Both ends are needed to build the window, see filter_queryset
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        start = self.form.cleaned_data.get('start_time')
+        end = self.form.cleaned_data.get('end_time')
+        if start is not None or end is not None:
+            queryset = queryset.filter(submitted_time_window(start, end))
+        return queryset
+
+
+class ComplaintFilter(SubmittedTimeFilterSet):
+    class Meta:
+        model = Complaint
+        fields = ['status', 'priority', 'issue_type', 'ward', 'block', 'assigned_department']
+
+
+class ReportFilter(SubmittedTimeFilterSet):
+    class Meta:
+        model = Complaint
+        fields = ['assigned_department', 'priority', 'status', 'submitted_at']
+
+
+class TATFilter(SubmittedTimeFilterSet):
+    class Meta:
+        model = Complaint
+        fields = ['priority', 'status']
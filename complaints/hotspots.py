@@ -0,0 +1,50 @@
+from collections import Counter
+from django.db import connections, router
+from django.utils import timezone
+
+# Complaint fields a complaint's hotspot counters are keyed on
+HOTSPOT_FIELDS = ('submitted_at', 'block', 'ward', 'room_number', 'issue_type')
+PERIODS = ('hour', 'day')
+
+# One statement adds a complaint to its hourly and daily rows, creating them as
+# needed (SQLite and PostgreSQL upsert syntax)
+UPSERT_SQL = '''
+INSERT INTO {table} (period, bucket_start, block, ward, room_number, issue_type, count)
+VALUES {values}
+ON CONFLICT (period, bucket_start, block, ward, room_number, issue_type)
+DO UPDATE SET count = {table}.count + excluded.count
+'''
+
+
+def bucket_start(submitted_at, period):
+    # Hours and days start on the local clock, like the report date filters
+    local = timezone.localtime(submitted_at).replace(minute=0, second=0, microsecond=0)
+    return local.replace(hour=0) if period == 'day' else local
+
+
+def hotspot_keys(state):
+    submitted_at, block, ward, room_number, issue_type = state
+    return [(period, bucket_start(submitted_at, period), block, ward, room_number, issue_type) for period in PERIODS]
+
+
+def count_hotspots(states):
+    """{hotspot key: complaints} for (submitted_at, block, ward, room_number, issue_type) tuples."""
+    counts = Counter()
+    for state in states:
+        counts.update(hotspot_keys(state))
+    return counts
+
+
+def add_to_hotspots(complaint):
+    """Counts a new complaint in its hourly and daily hotspot rows."""
+    from .models import ComplaintHotspot
+
+    connection = connections[router.db_for_write(ComplaintHotspot)]
+    keys = hotspot_keys(tuple(getattr(complaint, field) for field in HOTSPOT_FIELDS))
+    params = []
+    for period, start, *location in keys:
+        params += [period, connection.ops.adapt_datetimefield_value(start), *location, 1]
+    table = connection.ops.quote_name(ComplaintHotspot._meta.db_table)
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(keys))
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_SQL.format(table=table, values=values), params)
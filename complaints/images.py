@@ -0,0 +1,99 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def submit_image(image_id):
+    """
+    Queues a ComplaintImage for processing on the worker pool. With
+    IMAGE_PIPELINE_WORKERS = 0 it is processed right away instead.
+    """
+    global _executor
+    if not settings.IMAGE_PIPELINE_WORKERS:
+        return process_image(image_id)
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(settings.IMAGE_PIPELINE_WORKERS, thread_name_prefix='complaint-images')
+    _executor.submit(_run, image_id)
+
+
+def _run(image_id):
+    try:
+        process_image(image_id)
+    except Exception:
+        logger.exception('Processing complaint image %s failed', image_id)
+    finally:
+        # Pool threads keep their own connections; don't leave them open between jobs
+        connections.close_all()
+
+
+def process_image(image_id):
+    """
+    Replaces an uploaded complaint photo with an orientation corrected,
+    downscaled and recompressed JPEG without its metadata (EXIF, GPS), and
+    adds the preview and thumbnail variants. Returns False if the image was
+    already processed or no longer exists.
+    """
+    from .models import ComplaintImage
+
+    image = ComplaintImage.objects.filter(pk=image_id, processed_at__isnull=True).first()
+    if image is None:
+        return False
+    storage = image.image.storage
+    original = image.image.name
+    with image.image.open('rb') as upload:
+        picture = Image.open(upload)
+        # Apply the camera's rotation before the EXIF data carrying it is dropped
+        picture = ImageOps.exif_transpose(picture)
+        picture.load()
+    picture = _flatten(picture)
+
+    stem = os.path.splitext(os.path.basename(original))[0]
+    names = {}
+    for variant, directory in (('image', ''), ('preview', 'previews/'), ('thumbnail', 'thumbnails/')):
+        names[variant] = storage.save(
+            f'complaint_images/{directory}{stem}.jpg', _encode(picture, settings.COMPLAINT_IMAGE_SIZES[variant])
+        )
+
+    updated = ComplaintImage.objects.filter(pk=image.pk, processed_at__isnull=True).update(
+        processed_at=timezone.now(), **names
+    )
+    if not updated:
+        # Deleted (or processed elsewhere) in the meantime
+        for name in names.values():
+            storage.delete(name)
+        return False
+    storage.delete(original)
+    return True
+
+
+def _flatten(picture):
+    # JPEG has no alpha channel or palette: paint transparent areas white
+    if picture.mode in ('RGBA', 'LA') or (picture.mode == 'P' and 'transparency' in picture.info):
+        picture = picture.convert('RGBA')
+        background = Image.new('RGB', picture.size, 'white')
+        background.paste(picture, mask=picture.getchannel('A'))
+        return background
+    return picture.convert('RGB')
+
+
+def _encode(picture, max_size):
+    resized = picture.copy()
+    resized.thumbnail((max_size, max_size), Image.LANCZOS)
+    output = BytesIO()
+    # Saved without exif/icc data, so nothing but the pixels is kept
+    resized.save(output, 'JPEG', quality=settings.COMPLAINT_IMAGE_QUALITY, optimize=True, progressive=True)
+    return ContentFile(output.getvalue())
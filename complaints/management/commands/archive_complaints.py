@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from complaints.archive import archive_complaints
+
+
+class Command(BaseCommand):
+    help = 'Moves resolved and closed complaints older than --older-than-days to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=settings.COMPLAINT_ARCHIVE_AFTER_DAYS,
+            help='Archive complaints submitted and resolved more than this many days ago'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Complaints moved per transaction')
+
+    def handle(self, *args, **options):
+        archived = archive_complaints(options['older_than_days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} complaints'))
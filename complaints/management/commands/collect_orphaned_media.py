@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from complaints.media_gc import collect_orphaned_media
+
+
+class Command(BaseCommand):
+    help = 'Deletes media files that no complaint image row points at any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age-hours', type=float, default=24,
+            help='Leave files saved within this many hours alone (uploads whose rows may not be committed yet)'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Files deleted per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+
+        def progress(files, size):
+            self.stdout.write(f'{verb} {files} files so far ({size} bytes)')
+
+        files, size = collect_orphaned_media(
+            options['min_age_hours'] * 3600, batch_size=options['batch_size'], dry_run=options['dry_run'],
+            progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(f'{verb} {files} orphaned files ({size} bytes)'))
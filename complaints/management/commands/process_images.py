@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from complaints.images import process_image
+from complaints.models import ComplaintImage
+
+
+class Command(BaseCommand):
+    help = 'Processes complaint images the background pipeline has not handled yet (older uploads, or after a restart)'
+
+    def handle(self, *args, **options):
+        pending = ComplaintImage.objects.filter(processed_at__isnull=True).values_list('pk', flat=True)
+        processed = failed = 0
+        for image_id in pending.iterator():
+            try:
+                processed += process_image(image_id)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'Image {image_id}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images ({failed} failed)'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from complaints.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recounts the complaint report rollups from the complaint table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rollup rows written per INSERT')
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup rows'))
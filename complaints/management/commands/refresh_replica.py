@@ -0,0 +1,30 @@
+import os
+import sqlite3
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from complaints.routers import REPLICA, sqlite_path
+
+
+class Command(BaseCommand):
+    help = 'Copies the SQLite database to the replica snapshot file (DATABASE_REPLICA_PATH); run it periodically'
+
+    def handle(self, *args, **options):
+        primary = sqlite_path(connections.settings['default']['NAME'])
+        replica = sqlite_path(connections.settings[REPLICA]['NAME'])
+        if replica == primary:
+            raise CommandError('The replica is the primary database file; set DATABASE_REPLICA_PATH to use a snapshot')
+
+        # Copy a consistent snapshot next to the replica, then swap it in so
+        # report connections never see a half written file
+        temporary = f'{replica}.tmp'
+        source = sqlite3.connect(primary)
+        target = sqlite3.connect(temporary)
+        try:
+            with target:
+                source.backup(target)
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+            source.close()
+        os.replace(temporary, replica)
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {replica}'))
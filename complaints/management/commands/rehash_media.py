@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from complaints.storage import rehash_media
+
+
+class Command(BaseCommand):
+    help = 'Moves media files stored before content addressed storage to their hashed names, merging duplicates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows read per query')
+
+    def handle(self, *args, **options):
+        moved, missing = rehash_media(batch_size=options['batch_size'])
+        for name in missing:
+            self.stderr.write(f'Missing file: {name}')
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} files ({len(missing)} missing)'))
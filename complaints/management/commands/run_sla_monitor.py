@@ -0,0 +1,39 @@
+import logging
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from complaints.sla import scan_sla_breaches
+
+logger = logging.getLogger('complaints.sla')
+
+
+class Command(BaseCommand):
+    help = 'Escalates complaints whose SLA deadline has passed, scanning every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=settings.SLA_MONITOR_INTERVAL, help='Seconds between scans'
+        )
+        parser.add_argument('--once', action='store_true', help='Run a single scan and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            try:
+                breaches = scan_sla_breaches()
+            except Exception:
+                if options['once']:
+                    raise
+                # Keep the monitor alive through a locked or restarting database
+                logger.exception('SLA scan failed')
+            else:
+                self.stdout.write(f'Escalated {len(breaches)} SLA breaches')
+            if options['once']:
+                return
+            try:
+                time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
+            except KeyboardInterrupt:
+                return
+            # Reconnect if the database went away while sleeping
+            close_old_connections()
@@ -0,0 +1,111 @@
+import os
+import time
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from .models import StoredFile
+from .storage import MEDIA_FIELDS
+
+
+def stored_files(root, directory=''):
+    """
+    Yields (name, size, modified) for every file under root, in the same order
+    as the database sorts the names: a directory's entries are visited by name
+    with a '/' appended to subdirectories, so 'a.png' comes before 'a/b.png'.
+    Only one directory listing is held in memory at a time.
+    """
+    with os.scandir(os.path.join(root, directory)) as scan:
+        entries = sorted(
+            ((entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name), entry) for entry in scan
+        )
+    for key, entry in entries:
+        name = f'{directory}{key}'
+        if key.endswith('/'):
+            yield from stored_files(root, name)
+        elif entry.is_file(follow_symlinks=False):
+            stat = entry.stat(follow_symlinks=False)
+            yield name, stat.st_size, stat.st_mtime
+
+
+def referenced_names(names=None):
+    """
+    Every file name a row points at, sorted and without duplicates, streamed
+    from one UNION query. With `names`, only those of them still in use.
+    """
+    selects = []
+    for model_name, fields in MEDIA_FIELDS.items():
+        model = apps.get_model('complaints', model_name)
+        for field in fields:
+            rows = model.objects.exclude(Q(**{f'{field}__isnull': True}) | Q(**{field: ''}))
+            if names is not None:
+                rows = rows.filter(**{f'{field}__in': names})
+            selects.append(rows.annotate(name=F(field)).values_list('name', flat=True))
+    return selects[0].union(*selects[1:]).order_by('name').iterator(chunk_size=2000)
+
+
+def orphaned_files(cutoff):
+    """
+    Yields (name, size) for files under MEDIA_ROOT that no row references and
+    that were last saved before the `cutoff` timestamp. The sorted file walk
+    and the sorted referenced names are merged like a join, so memory stays
+    bounded however many files there are.
+    """
+    referenced = referenced_names()
+    current = next(referenced, None)
+    for name, size, modified in stored_files(default_storage.location):
+        while current is not None and current < name:
+            current = next(referenced, None)
+        if current == name or modified > cutoff:
+            continue
+        yield name, size
+
+
+def collect_orphaned_media(min_age, batch_size=500, dry_run=False, progress=None):
+    """
+    Deletes media files no row references, `batch_size` at a time, together
+    with their reference counts. Files written within the last `min_age`
+    seconds are left alone: an upload is saved before its row is committed.
+    Calls progress(files, size) after every batch. Returns the number of
+    orphaned files and their total size in bytes.
+    """
+    cutoff = time.time() - min_age
+    found = total_size = 0
+    batch = []
+
+    def flush():
+        nonlocal found, total_size
+        if not dry_run:
+            # Skip anything picked up since the scan: a row now points at it, or
+            # a new upload of the same content just saved it again
+            in_use = set(referenced_names([name for name, size in batch]))
+            batch[:] = [
+                (name, size) for name, size in batch
+                if name not in in_use and modified_at(name) <= cutoff
+            ]
+            names = [name for name, size in batch]
+            StoredFile.objects.filter(name__in=names).delete()
+            for name in names:
+                try:
+                    os.remove(default_storage.path(name))
+                except FileNotFoundError:
+                    pass
+        found += len(batch)
+        total_size += sum(size for name, size in batch)
+        batch.clear()
+        if progress is not None:
+            progress(found, total_size)
+
+    for orphan in orphaned_files(cutoff):
+        batch.append(orphan)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return found, total_size
+
+
+def modified_at(name):
+    try:
+        return os.stat(default_storage.path(name)).st_mtime
+    except FileNotFoundError:
+        return 0
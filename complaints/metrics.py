@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name: (help text, histogram buckets)
+REQUEST_METRICS = {
+    'http_request_duration_seconds': ('Wall time spent in the view and middleware', DURATION_BUCKETS),
+    'http_request_db_queries': ('SQL queries run per request', QUERY_COUNT_BUCKETS),
+    'http_request_db_duration_seconds': ('Time spent waiting on SQL queries', DURATION_BUCKETS),
+    'http_request_serializer_duration_seconds': ('Time spent in serializer validation and rendering', DURATION_BUCKETS),
+    'http_response_size_bytes': ('Response body size (not recorded for streaming responses)', SIZE_BUCKETS),
+}
+LABEL_NAMES = ('view', 'method', 'status')
+
+_current = ContextVar('complaints_request_timings', default=None)
+
+
+class RequestTimings:
+    """Per request totals, filled in by the SQL wrapper and the serializer mixin."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.db_queries += 1
+
+    def activate(self):
+        return _current.set(self)
+
+    @staticmethod
+    def deactivate(token):
+        _current.reset(token)
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    execute_wrapper installed on every database connection (complaints/signals.py)
+    that charges each query to the request being timed in the current context.
+    A context var rather than a per-request wrapper, because the async ORM runs
+    a request's queries on another thread's connection.
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+class SerializerTimingMixin:
+    """
+    Adds the time spent validating and representing data to the current
+    request's serializer timing. Nested serializers are counted once, as
+    part of the outermost one.
+    """
+
+    def run_validation(self, *args, **kwargs):
+        return _timed(super().run_validation, *args, **kwargs)
+
+    def to_representation(self, *args, **kwargs):
+        return _timed(super().to_representation, *args, **kwargs)
+
+
+def _timed(method, *args, **kwargs):
+    timings = _current.get()
+    if timings is None or timings.serializing:
+        return method(*args, **kwargs)
+    timings.serializing = True
+    start = time.perf_counter()
+    try:
+        return method(*args, **kwargs)
+    finally:
+        timings.serializer_time += time.perf_counter() - start
+        timings.serializing = False
+
+
+class MetricsRegistry:
+    """
+    In-process histograms of the request metrics, labelled by view, method and status.
+
+    Each worker process writes its totals to its own file in `directory`
+    (at most every `flush_interval` seconds, plus whenever it serves
+    /metrics) and the /metrics endpoint adds up the files of all workers,
+    so it reports the same numbers whichever worker answers the scrape.
+    Without a directory only the current process is reported.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._series = {}
+        self._pid = os.getpid()
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+    def observe(self, labels, values):
+        key = tuple(str(labels[name]) for name in LABEL_NAMES)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: don't report the parent's requests a second time
+                self._series = {}
+                self._pid = os.getpid()
+            for name, value in values.items():
+                series = self._series.get((name, key))
+                if series is None:
+                    # bucket counts, +Inf, sum
+                    series = self._series[(name, key)] = [0] * (len(REQUEST_METRICS[name][1]) + 1) + [0.0]
+                buckets = REQUEST_METRICS[name][1]
+                position = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+                series[position] += 1
+                series[-1] += value
+        self.flush()
+
+    def flush(self, force=False):
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        # Only one thread writes the file; the others carry on with their request
+        if not self._flush_lock.acquire(blocking=force):
+            return
+        try:
+            with self._lock:
+                self._last_flush = now
+                data = [[name, list(labels), series] for (name, labels), series in self._series.items()]
+                pid = self._pid
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f'{pid}.json'
+            temporary = path.with_suffix('.tmp')
+            temporary.write_text(json.dumps(data))
+            # Readers only ever see a complete file
+            os.replace(temporary, path)
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """All series, summed over every worker: {(name, labels): [bucket counts..., sum]}."""
+        if self.directory is None:
+            with self._lock:
+                return {key: list(series) for key, series in self._series.items()}
+
+        self.flush(force=True)
+        merged = {}
+        for path in self.directory.glob('*.json'):
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for name, labels, series in data:
+                if name not in REQUEST_METRICS:
+                    continue
+                total = merged.setdefault((name, tuple(labels)), [0] * len(series))
+                for i, value in enumerate(series):
+                    total[i] += value
+        return merged
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        collected = self.collect()
+        lines = []
+        for name, (help_text, buckets) in REQUEST_METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (series_name, labels), series in sorted(collected.items()):
+                if series_name != name:
+                    continue
+                label_text = ','.join(f'{label}="{_escape(value)}"' for label, value in zip(LABEL_NAMES, labels))
+                cumulative = 0
+                for bound, count in zip([*map(str, buckets), '+Inf'], series[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label_text}}} {series[-1]}')
+                lines.append(f'{name}_count{{{label_text}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+    return _registry
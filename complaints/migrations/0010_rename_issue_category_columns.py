@@ -1,6 +1,40 @@
 from django.db import migrations
 
 
+def get_columns(schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        return [
+            column.name
+            for column in connection.introspection.get_table_description(cursor, 'complaints_issue_category')
+        ]
+
+
+def rename_columns(apps, schema_editor):
+    # Databases built from the migrations already have the snake_case names;
+    # only databases created before the rename still carry the camelCase columns.
+    if 'issueCategoryCode' in get_columns(schema_editor):
+        rename(schema_editor, CAMEL_CASE_COLUMNS)
+
+
+def restore_columns(apps, schema_editor):
+    # Back to the camelCase names the rename started from, as the original RunSQL reverse did
+    if 'issue_category_code' in get_columns(schema_editor):
+        rename(schema_editor, {new: old for old, new in CAMEL_CASE_COLUMNS.items()})
+
+
+# Old column name -> new column name
+CAMEL_CASE_COLUMNS = {
+    'issueCategoryCode': 'issue_category_code',
+    'issueCategoryname': 'issue_category_name',
+}
+
+
+def rename(schema_editor, columns):
+    for old, new in columns.items():
+        schema_editor.execute(f'ALTER TABLE complaints_issue_category RENAME COLUMN "{old}" TO "{new}"')
+
+
 class Migration(migrations.Migration):
 
     dependencies = [
@@ -8,20 +42,5 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RunSQL(
-            # Forward SQL
-            """
-            ALTER TABLE complaints_issue_category 
-            RENAME COLUMN "issueCategoryCode" TO "issue_category_code";
-            ALTER TABLE complaints_issue_category 
-            RENAME COLUMN "issueCategoryname" TO "issue_category_name";
-            """,
-            # Reverse SQL
-            """
-            ALTER TABLE complaints_issue_category 
-            RENAME COLUMN "issue_category_code" TO "issueCategoryCode";
-            ALTER TABLE complaints_issue_category 
-            RENAME COLUMN "issue_category_name" TO "issueCategoryname";
-            """
-        ),
-    ] 
\ No newline at end of file
+        migrations.RunPython(rename_columns, restore_columns),
+    ]
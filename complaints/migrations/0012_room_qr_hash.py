@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0011_alter_complaint_issue_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='qr_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+    ]
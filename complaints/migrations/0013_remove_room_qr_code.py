@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:41
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0012_room_qr_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='room',
+            name='qr_code',
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0014_ticketsequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['room_number', 'bed_number', 'issue_type', 'status'], name='complaint_room_issue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['submitted_at'], name='complaint_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['status', 'submitted_at'], name='complaint_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['priority', 'submitted_at'], name='complaint_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['issue_type', 'submitted_at'], name='complaint_issue_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['ward', 'submitted_at'], name='complaint_ward_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['block', 'submitted_at'], name='complaint_block_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['assigned_department', 'priority', 'status'], name='complaint_department_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(condition=models.Q(('resolved_at__isnull', False)), fields=['status', 'priority', 'submitted_at', 'resolved_at'], name='complaint_resolved_tat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['room_no', 'bed_no', 'Block', 'Floor_no', 'ward', 'speciality', 'room_type'], name='room_location_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_fts_table(apps, schema_editor):
+    # The full-text index only exists on SQLite; other databases fall back to LIKE search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE complaints_complaint_fts '
+        'USING fts5(ticket_id, room_number, bed_number, description)'
+    )
+
+    Complaint = apps.get_model('complaints', 'Complaint')
+    ComplaintSearchEntry = apps.get_model('complaints', 'ComplaintSearchEntry')
+    complaints = Complaint.objects.values_list('ticket_id', 'room_number', 'bed_number', 'description')
+    for ticket_id, room_number, bed_number, description in complaints.iterator():
+        entry = ComplaintSearchEntry.objects.create(complaint_id=ticket_id)
+        schema_editor.execute(
+            'INSERT INTO complaints_complaint_fts (rowid, ticket_id, room_number, bed_number, description) '
+            'VALUES (%s, %s, %s, %s, %s)',
+            [entry.id, ticket_id, room_number, bed_number, description]
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS complaints_complaint_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0015_complaint_room_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintSearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('complaint', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='complaints.complaint')),
+            ],
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:51
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def count_existing_complaints(apps, schema_editor):
+    Complaint = apps.get_model('complaints', 'Complaint')
+    ComplaintRollup = apps.get_model('complaints', 'ComplaintRollup')
+    counts = (
+        Complaint.objects
+        .annotate(day=TruncDate('submitted_at'))
+        .values('day', 'assigned_department', 'priority', 'status')
+        .annotate(total=Count('pk'))
+        .order_by()
+    )
+    totals = {}
+    for row in counts.iterator():
+        key = (row['day'], row['assigned_department'] or '', row['priority'], row['status'])
+        totals[key] = totals.get(key, 0) + row['total']
+    ComplaintRollup.objects.bulk_create(
+        (
+            ComplaintRollup(day=day, assigned_department=department, priority=priority, status=status, count=count)
+            for (day, department, priority, status), count in totals.items()
+        ),
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0016_complaint_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('assigned_department', models.CharField(blank=True, default='', max_length=100)),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High')], max_length=10)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('in_progress', 'In_Progress'), ('resolved', 'Resolved'), ('closed', 'Closed'), ('on_hold', 'On_Hold')], max_length=15)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['assigned_department', 'priority', 'status'], name='complaint_rollup_dept_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'assigned_department', 'priority', 'status'), name='complaint_rollup_unique')],
+            },
+        ),
+        migrations.RunPython(count_existing_complaints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:53
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+from complaints.sketches import QuantileSketch
+
+
+def sketch_resolved_complaints(apps, schema_editor):
+    Complaint = apps.get_model('complaints', 'Complaint')
+    ComplaintTATSketch = apps.get_model('complaints', 'ComplaintTATSketch')
+    rows = {}
+    resolved = Complaint.objects.filter(status='resolved', resolved_at__isnull=False).values_list(
+        'submitted_at', 'assigned_department', 'priority', 'resolved_at'
+    )
+    for submitted_at, department, priority, resolved_at in resolved.iterator():
+        key = (timezone.localdate(submitted_at), department or '', priority)
+        row = rows.setdefault(key, ComplaintTATSketch(
+            day=key[0], assigned_department=key[1], priority=priority, sketch=QuantileSketch()
+        ))
+        seconds = max((resolved_at - submitted_at).total_seconds(), 0.0)
+        row.sketch.add(seconds)
+        row.count += 1
+        row.total_seconds += seconds
+        sla_hours = settings.COMPLAINT_SLA_HOURS.get(priority)
+        if sla_hours is not None and seconds > sla_hours * 3600:
+            row.sla_breaches += 1
+    for row in rows.values():
+        row.sketch = row.sketch.to_json()
+    ComplaintTATSketch.objects.bulk_create(rows.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0017_complaint_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintTATSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('assigned_department', models.CharField(blank=True, default='', max_length=100)),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High')], max_length=10)),
+                ('sketch', models.JSONField(default=dict)),
+                ('count', models.IntegerField(default=0)),
+                ('total_seconds', models.FloatField(default=0)),
+                ('sla_breaches', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['priority', 'day'], name='complaint_tat_priority_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'assigned_department', 'priority'), name='complaint_tat_sketch_unique')],
+            },
+        ),
+        migrations.RunPython(sketch_resolved_complaints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:54
+
+import complaints.fields
+from django.db import migrations, models
+
+
+def fill_submitted_minute(apps, schema_editor):
+    Complaint = apps.get_model('complaints', 'Complaint')
+    batch = []
+    for complaint in Complaint.objects.only('ticket_id', 'submitted_at').iterator(chunk_size=500):
+        complaint.submitted_minute = complaints.fields.minute_of_day(complaint.submitted_at)
+        batch.append(complaint)
+        if len(batch) == 500:
+            Complaint.objects.bulk_update(batch, ['submitted_minute'])
+            batch = []
+    Complaint.objects.bulk_update(batch, ['submitted_minute'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0018_complaint_tat_sketch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='submitted_minute',
+            field=complaints.fields.MinuteOfDayField('submitted_at', null=True),
+        ),
+        migrations.RunPython(fill_submitted_minute, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['submitted_minute', 'submitted_at'], name='complaint_minute_idx'),
+        ),
+    ]
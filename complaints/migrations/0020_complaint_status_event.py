@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:01
+
+from django.db import migrations, models
+
+
+def seed_status_history(apps, schema_editor):
+    # Earlier status changes weren't recorded. Each complaint gets its creation,
+    # plus the resolution for resolved complaints, which is all that is known.
+    Complaint = apps.get_model('complaints', 'Complaint')
+    ComplaintStatusEvent = apps.get_model('complaints', 'ComplaintStatusEvent')
+    events = []
+    complaints = Complaint.objects.values_list(
+        'ticket_id', 'assigned_department', 'priority', 'status', 'submitted_at', 'resolved_at'
+    )
+    for ticket_id, department, priority, status, submitted_at, resolved_at in complaints.iterator():
+        common = {'ticket_id': ticket_id, 'assigned_department': department or '', 'priority': priority}
+        if status == 'resolved' and resolved_at:
+            events.append(ComplaintStatusEvent(from_status=None, to_status='open', changed_at=submitted_at, **common))
+            events.append(ComplaintStatusEvent(from_status='open', to_status='resolved', changed_at=resolved_at, **common))
+        else:
+            events.append(ComplaintStatusEvent(from_status=None, to_status=status, changed_at=submitted_at, **common))
+    ComplaintStatusEvent.objects.bulk_create(events, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0019_complaint_submitted_minute'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket_id', models.CharField(max_length=12)),
+                ('assigned_department', models.CharField(blank=True, default='', max_length=100)),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High')], max_length=10)),
+                ('from_status', models.CharField(blank=True, choices=[('open', 'Open'), ('in_progress', 'In_Progress'), ('resolved', 'Resolved'), ('closed', 'Closed'), ('on_hold', 'On_Hold')], max_length=15, null=True)),
+                ('to_status', models.CharField(choices=[('open', 'Open'), ('in_progress', 'In_Progress'), ('resolved', 'Resolved'), ('closed', 'Closed'), ('on_hold', 'On_Hold')], max_length=15)),
+                ('changed_at', models.DateTimeField()),
+                ('remarks', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ticket_id', 'changed_at'], name='status_event_ticket_idx'), models.Index(fields=['changed_at'], name='status_event_changed_idx')],
+            },
+        ),
+        migrations.RunPython(seed_status_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0020_complaint_status_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintEscalation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket_id', models.CharField(max_length=12, unique=True)),
+                ('assigned_department', models.CharField(blank=True, default='', max_length=100)),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High')], max_length=10)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('in_progress', 'In_Progress'), ('resolved', 'Resolved'), ('closed', 'Closed'), ('on_hold', 'On_Hold')], max_length=15)),
+                ('submitted_at', models.DateTimeField()),
+                ('due_at', models.DateTimeField()),
+                ('escalated_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScanWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('position', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['status', 'priority', 'submitted_at'], name='complaint_sla_scan_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaintescalation',
+            index=models.Index(fields=['escalated_at'], name='complaint_escalated_idx'),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:11
+
+import complaints.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0021_complaint_sla_monitor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedComplaint',
+            fields=[
+                ('ticket_id', models.CharField(editable=False, max_length=12, primary_key=True, serialize=False)),
+                ('submitted_minute', complaints.fields.MinuteOfDayField('submitted_at', null=True)),
+                ('bed_number', models.CharField(max_length=20)),
+                ('block', models.CharField(max_length=50)),
+                ('room_number', models.CharField(max_length=20)),
+                ('floor', models.CharField(max_length=20)),
+                ('ward', models.CharField(max_length=50)),
+                ('speciality', models.CharField(max_length=100)),
+                ('room_type', models.CharField(max_length=50)),
+                ('room_status', models.CharField(max_length=10)),
+                ('issue_type', models.CharField(max_length=50)),
+                ('description', models.TextField()),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High')], max_length=10)),
+                ('submitted_by', models.CharField(default='Patient', max_length=100)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('in_progress', 'In_Progress'), ('resolved', 'Resolved'), ('closed', 'Closed'), ('on_hold', 'On_Hold')], default='open', max_length=15)),
+                ('assigned_department', models.CharField(blank=True, max_length=100, null=True)),
+                ('resolved_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('remarks', models.TextField(blank=True, null=True)),
+                ('submitted_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedComplaintImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='complaint_images/')),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='complaintrollup',
+            name='complaint_rollup_unique',
+        ),
+        migrations.RemoveConstraint(
+            model_name='complainttatsketch',
+            name='complaint_tat_sketch_unique',
+        ),
+        migrations.AddField(
+            model_name='complaintrollup',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='complainttatsketch',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name='complaintrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'assigned_department', 'priority', 'status', 'archived'), name='complaint_rollup_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='complainttatsketch',
+            constraint=models.UniqueConstraint(fields=('day', 'assigned_department', 'priority', 'archived'), name='complaint_tat_sketch_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomplaint',
+            index=models.Index(fields=['submitted_at'], name='archived_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomplaint',
+            index=models.Index(fields=['priority', 'submitted_at'], name='archived_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomplaint',
+            index=models.Index(fields=['submitted_minute', 'submitted_at'], name='archived_minute_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomplaint',
+            index=models.Index(fields=['assigned_department', 'priority', 'status'], name='archived_department_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedcomplaintimage',
+            name='complaint',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='complaints.archivedcomplaint'),
+        ),
+    ]
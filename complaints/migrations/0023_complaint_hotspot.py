@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:16
+
+from django.db import migrations, models
+from complaints.hotspots import HOTSPOT_FIELDS, count_hotspots
+
+
+def count_existing_complaints(apps, schema_editor):
+    ComplaintHotspot = apps.get_model('complaints', 'ComplaintHotspot')
+    counts = {}
+    for model in ('Complaint', 'ArchivedComplaint'):
+        complaints = apps.get_model('complaints', model).objects.values_list(*HOTSPOT_FIELDS)
+        for key, count in count_hotspots(complaints.iterator()).items():
+            counts[key] = counts.get(key, 0) + count
+    ComplaintHotspot.objects.bulk_create(
+        (
+            ComplaintHotspot(
+                period=period, bucket_start=start, block=block, ward=ward, room_number=room_number,
+                issue_type=issue_type, count=count
+            )
+            for (period, start, block, ward, room_number, issue_type), count in counts.items()
+        ),
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0022_complaint_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintHotspot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('block', models.CharField(max_length=50)),
+                ('ward', models.CharField(max_length=50)),
+                ('room_number', models.CharField(max_length=20)),
+                ('issue_type', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket_start', 'block', 'ward', 'room_number', 'issue_type'), name='complaint_hotspot_unique')],
+            },
+        ),
+        migrations.RunPython(count_existing_complaints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0023_complaint_hotspot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedcomplaintimage',
+            name='preview',
+            field=models.ImageField(blank=True, null=True, upload_to='complaint_images/previews/'),
+        ),
+        migrations.AddField(
+            model_name='archivedcomplaintimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='complaint_images/thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='complaintimage',
+            name='preview',
+            field=models.ImageField(blank=True, null=True, upload_to='complaint_images/previews/'),
+        ),
+        migrations.AddField(
+            model_name='complaintimage',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='complaintimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='complaint_images/thumbnails/'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0024_complaint_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField(default=0)),
+                ('references', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='archivedcomplaintimage',
+            name='image',
+            field=models.ImageField(max_length=255, upload_to='complaint_images/'),
+        ),
+        migrations.AlterField(
+            model_name='archivedcomplaintimage',
+            name='preview',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to='complaint_images/previews/'),
+        ),
+        migrations.AlterField(
+            model_name='archivedcomplaintimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to='complaint_images/thumbnails/'),
+        ),
+        migrations.AlterField(
+            model_name='complaintimage',
+            name='image',
+            field=models.ImageField(max_length=255, upload_to='complaint_images/'),
+        ),
+        migrations.AlterField(
+            model_name='complaintimage',
+            name='preview',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to='complaint_images/previews/'),
+        ),
+        migrations.AlterField(
+            model_name='complaintimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to='complaint_images/thumbnails/'),
+        ),
+    ]
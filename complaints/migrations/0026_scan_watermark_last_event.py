@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0025_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanwatermark',
+            name='last_event_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
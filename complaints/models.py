@@ -1,14 +1,14 @@
-from django.db import models
-import qrcode
-from io import BytesIO
-from django.core.files import File
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
 from PIL import Image
-import uuid
 import base64
 import json
-import hmac
-import hashlib
-from django.conf import settings
+from .fields import MinuteOfDayField
+from .hotspots import add_to_hotspots
+from .qr import build_qr_url, payload_hash
+from .rollups import ROLLUP_FIELDS, complaint_state, move_complaint, stored_state
+from .status_history import record_status_change
+from .ticket_ids import get_ticket_id_allocator
 
 # Create your models here.
 class Room(models.Model):
@@ -23,10 +23,19 @@ class Room(models.Model):
     room_type = models.CharField(max_length=20)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='inactive')
     
-    # QR Code
-    qr_code = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
+    # QR Code (rendered on demand by RoomViewSet.qr)
     dataenc = models.CharField(max_length=500, blank=True, null=True)  # Store base64 encoded data
+    qr_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)  # Hash of the signed QR payload
     
+    class Meta:
+        indexes = [
+            # Room lookups by all location fields (complaint validation, uniqueness checks)
+            models.Index(
+                fields=['room_no', 'bed_no', 'Block', 'Floor_no', 'ward', 'speciality', 'room_type'],
+                name='room_location_idx'
+            ),
+        ]
+
     def __str__(self):
         return f"Room {self.room_no} - Bed {self.bed_no} - {self.Block}"
     
@@ -46,48 +55,31 @@ class Room(models.Model):
         json_data = json.dumps(room_data)
         return base64.b64encode(json_data.encode()).decode()
     
-    def save(self, *args, **kwargs):
-        # Generate base64 encoded data
+    def refresh_qr_payload(self):
+        # Generate base64 encoded data and the hash of the signed QR payload
         self.dataenc = self.get_room_data()
-        
-        # Generate HMAC signature
-        signature = hmac.new(
-            settings.QR_CODE_SECRET_KEY.encode('utf-8'),
-            self.dataenc.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-
-        # Generate QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        # Add the URL with encoded data and signature
-        qr_data = f"http://localhost:3000/ComplaintForm?data={self.dataenc}&signature={signature}"
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        # Create QR code image
-        qr_image = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save QR code to model
-        buffer = BytesIO()
-        qr_image.save(buffer, format='PNG')
-        filename = f'qr_code_{self.room_no}_{self.bed_no}.png'
-        self.qr_code.save(filename, File(buffer), save=False)
-        
+        self.qr_hash = payload_hash(build_qr_url(self.dataenc))
+
+    def save(self, *args, **kwargs):
+        self.refresh_qr_payload()
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'dataenc', 'qr_hash'}
+
         super().save(*args, **kwargs)
 
 
-class Complaint(models.Model):
+class BaseComplaint(models.Model):
+    # Columns shared by live complaints and the archive
     PRIORITY_CHOICES = [('low', 'Low'), ('medium', 'Medium'), ('high', 'High')]
     STATUS_CHOICES = [('open', 'Open'), ('in_progress', 'In_Progress'), ('resolved', 'Resolved'),('closed','Closed'),('on_hold','On_Hold')]
 
     # Make ticket_id the primary key
     ticket_id = models.CharField(max_length=12, primary_key=True, editable=False)
     submitted_at = models.DateTimeField(auto_now_add=True)
+    # Minute of the day the complaint came in, for index friendly shift filters
+    submitted_minute = MinuteOfDayField('submitted_at', null=True)
 
     # Room details (copied, not related)
     bed_number = models.CharField(max_length=20)
@@ -112,22 +104,267 @@ class Complaint(models.Model):
     resolved_at = models.DateTimeField(blank=True, null=True)
     remarks = models.TextField(blank=True, null=True)
 
+    class Meta:
+        abstract = True
+
+
+class Complaint(BaseComplaint):
+    class Meta:
+        indexes = [
+            # Duplicate open complaint check for the same issue in the same room
+            models.Index(fields=['room_number', 'bed_number', 'issue_type', 'status'], name='complaint_room_issue_idx'),
+            # Default list ordering and date filters
+            models.Index(fields=['submitted_at'], name='complaint_submitted_idx'),
+            # Filtered complaint lists, newest first
+            models.Index(fields=['status', 'submitted_at'], name='complaint_status_idx'),
+            models.Index(fields=['priority', 'submitted_at'], name='complaint_priority_idx'),
+            models.Index(fields=['issue_type', 'submitted_at'], name='complaint_issue_type_idx'),
+            models.Index(fields=['ward', 'submitted_at'], name='complaint_ward_idx'),
+            models.Index(fields=['block', 'submitted_at'], name='complaint_block_idx'),
+            # Time of day (shift) windows
+            models.Index(fields=['submitted_minute', 'submitted_at'], name='complaint_minute_idx'),
+            # Department reports
+            models.Index(fields=['assigned_department', 'priority', 'status'], name='complaint_department_idx'),
+            # SLA monitor: unresolved tickets of one priority whose deadline just passed
+            models.Index(fields=['status', 'priority', 'submitted_at'], name='complaint_sla_scan_idx'),
+            # TAT calculations only ever look at resolved tickets
+            models.Index(
+                fields=['status', 'priority', 'submitted_at', 'resolved_at'],
+                name='complaint_resolved_tat_idx',
+                condition=models.Q(resolved_at__isnull=False)
+            ),
+        ]
+
     def save(self, *args, **kwargs):
-        if not self.ticket_id:
-            # Generate ticket ID
-            self.ticket_id = "SVN" + str(uuid.uuid4().int)[:5].zfill(5)
-        super().save(*args, **kwargs)
+        if self.ticket_id:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and not set(update_fields) & set(ROLLUP_FIELDS):
+                return super().save(*args, **kwargs)
+            # Keep the report rollups, TAT sketches and status history in step with
+            # status (and priority/department) changes
+            with transaction.atomic():
+                old_state = stored_state(self.ticket_id)
+                super().save(*args, **kwargs)
+                move_complaint(old_state, complaint_state(self))
+                record_status_change(self, old_state[ROLLUP_FIELDS.index('status')] if old_state else None)
+            return
+
+        # Generate ticket ID. A new ticket is always an INSERT, so an ID that is
+        # already taken fails loudly instead of overwriting the existing complaint.
+        kwargs.pop('force_insert', None)
+        allocator = get_ticket_id_allocator()
+        for attempt in range(settings.TICKET_ID_MAX_ATTEMPTS):
+            self.ticket_id = allocator.allocate()
+            try:
+                with transaction.atomic():
+                    super().save(*args, force_insert=True, **kwargs)
+                    move_complaint(None, complaint_state(self))
+                    add_to_hotspots(self)
+                    return record_status_change(self, None)
+            except IntegrityError:
+                if attempt == settings.TICKET_ID_MAX_ATTEMPTS - 1 or not Complaint.objects.filter(pk=self.ticket_id).exists():
+                    self.ticket_id = None
+                    raise
+                # The leased block overlaps existing tickets, move on to a fresh one
+                allocator.discard()
 
     def __str__(self):
         return f"Ticket {self.ticket_id} - Room {self.room_number} ({self.ward})"
     
 
+class ArchivedComplaint(BaseComplaint):
+    # Resolved and closed complaints moved out of the live table by
+    # `manage.py archive_complaints`. Reports read them with ?include_archived=true.
+    submitted_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['submitted_at'], name='archived_submitted_idx'),
+            models.Index(fields=['priority', 'submitted_at'], name='archived_priority_idx'),
+            models.Index(fields=['submitted_minute', 'submitted_at'], name='archived_minute_idx'),
+            models.Index(fields=['assigned_department', 'priority', 'status'], name='archived_department_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived ticket {self.ticket_id} - Room {self.room_number} ({self.ward})"
+
+
+class ArchivedComplaintImage(models.Model):
+    # The image files stay where they are; only the rows move with the complaint
+    complaint = models.ForeignKey('ArchivedComplaint', related_name='images', on_delete=models.CASCADE)
+    image = models.ImageField(upload_to='complaint_images/', max_length=255)
+    preview = models.ImageField(upload_to='complaint_images/previews/', max_length=255, blank=True, null=True)
+    thumbnail = models.ImageField(upload_to='complaint_images/thumbnails/', max_length=255, blank=True, null=True)
+
+    def __str__(self):
+        return f"Image for archived Complaint {self.complaint_id}"
+
+
+class ComplaintRollup(models.Model):
+    # Complaint counts per day, department, priority and status, kept up to date
+    # by Complaint.save() and rebuilt with `manage.py rebuild_rollups`
+    day = models.DateField()
+    assigned_department = models.CharField(max_length=100, blank=True, default='')
+    priority = models.CharField(max_length=10, choices=Complaint.PRIORITY_CHOICES)
+    status = models.CharField(max_length=15, choices=Complaint.STATUS_CHOICES)
+    # Counts of archived complaints are kept apart from the live ones
+    archived = models.BooleanField(default=False)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'assigned_department', 'priority', 'status', 'archived'],
+                name='complaint_rollup_unique'
+            ),
+        ]
+        indexes = [
+            # Department reports
+            models.Index(fields=['assigned_department', 'priority', 'status'], name='complaint_rollup_dept_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.assigned_department} {self.priority} {self.status}: {self.count}"
+
+
+class ComplaintTATSketch(models.Model):
+    # Turnaround times of the complaints resolved so far, per submission day,
+    # department and priority (see complaints/sketches.py)
+    day = models.DateField()
+    assigned_department = models.CharField(max_length=100, blank=True, default='')
+    priority = models.CharField(max_length=10, choices=Complaint.PRIORITY_CHOICES)
+    archived = models.BooleanField(default=False)
+    sketch = models.JSONField(default=dict)
+    count = models.IntegerField(default=0)
+    total_seconds = models.FloatField(default=0)
+    sla_breaches = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'assigned_department', 'priority', 'archived'], name='complaint_tat_sketch_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['priority', 'day'], name='complaint_tat_priority_idx'),
+        ]
+
+    def __str__(self):
+        return f"TAT {self.day} {self.assigned_department} {self.priority} ({self.count})"
+
+
+class ComplaintHotspot(models.Model):
+    # Complaints filed per hour (and per day) for each room and issue type, added
+    # to as complaints are created and rebuilt with `manage.py rebuild_rollups`.
+    # Archiving or changing a complaint doesn't change where it was filed.
+    PERIOD_CHOICES = [('hour', 'Hour'), ('day', 'Day')]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField()
+    block = models.CharField(max_length=50)
+    ward = models.CharField(max_length=50)
+    room_number = models.CharField(max_length=20)
+    issue_type = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'bucket_start', 'block', 'ward', 'room_number', 'issue_type'],
+                name='complaint_hotspot_unique'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.bucket_start} {self.block}/{self.ward}/{self.room_number} {self.issue_type}: {self.count}"
+
+
+class ComplaintStatusEvent(models.Model):
+    # Append-only status history, written in the same transaction as the change.
+    # Keyed by ticket_id rather than a foreign key so the history outlives the
+    # complaint row, with the department and priority as they were at the time.
+    ticket_id = models.CharField(max_length=12)
+    assigned_department = models.CharField(max_length=100, blank=True, default='')
+    priority = models.CharField(max_length=10, choices=Complaint.PRIORITY_CHOICES)
+    from_status = models.CharField(max_length=15, choices=Complaint.STATUS_CHOICES, blank=True, null=True)
+    to_status = models.CharField(max_length=15, choices=Complaint.STATUS_CHOICES)
+    changed_at = models.DateTimeField()
+    remarks = models.TextField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # One ticket's history in order (time-in-status window per ticket)
+            models.Index(fields=['ticket_id', 'changed_at'], name='status_event_ticket_idx'),
+            # Date windows
+            models.Index(fields=['changed_at'], name='status_event_changed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ticket_id}: {self.from_status} -> {self.to_status} at {self.changed_at}"
+
+
+class ComplaintEscalation(models.Model):
+    # One row per SLA breach, written by the run_sla_monitor command. The unique
+    # ticket_id is what keeps a breach from being escalated twice.
+    ticket_id = models.CharField(max_length=12, unique=True)
+    assigned_department = models.CharField(max_length=100, blank=True, default='')
+    priority = models.CharField(max_length=10, choices=Complaint.PRIORITY_CHOICES)
+    status = models.CharField(max_length=15, choices=Complaint.STATUS_CHOICES)
+    submitted_at = models.DateTimeField()
+    due_at = models.DateTimeField()
+    escalated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['escalated_at'], name='complaint_escalated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ticket_id} breached its {self.priority} SLA at {self.due_at}"
+
+
+class ScanWatermark(models.Model):
+    # How far a periodic scan got, so the next run only looks at what came after
+    name = models.CharField(max_length=50, primary_key=True)
+    position = models.DateTimeField(blank=True, null=True)
+    # Last ComplaintStatusEvent id already looked at. Ids follow commit order,
+    # which changed_at doesn't for a transaction that commits late.
+    last_event_id = models.BigIntegerField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+
+
+class StoredFile(models.Model):
+    # A media file saved by ContentAddressedStorage (complaints/storage.py), named
+    # by its content hash, and how many saves of that content are still in use
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.BigIntegerField(default=0)
+    references = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.references} references)"
+
+
+class ComplaintSearchEntry(models.Model):
+    # Gives each complaint a stable integer id to use as the full-text index rowid
+    complaint = models.OneToOneField('Complaint', related_name='search_entry', on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"Search entry for Complaint {self.complaint_id}"
+
+
 class ComplaintImage(models.Model):
     complaint = models.ForeignKey('Complaint', related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='complaint_images/')
+    image = models.ImageField(upload_to='complaint_images/', max_length=255)
+    # Filled in by the image pipeline (complaints/images.py) after the upload is committed
+    preview = models.ImageField(upload_to='complaint_images/previews/', max_length=255, blank=True, null=True)
+    thumbnail = models.ImageField(upload_to='complaint_images/thumbnails/', max_length=255, blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
 
     def __str__(self):
-        return f"Image for Complaint {self.complaint.ticket_id}"
+        return f"Image for Complaint {self.complaint_id}"
 
 class Department(models.Model):
     department_code = models.CharField(max_length=6, primary_key=True)
@@ -146,4 +383,12 @@ class Issue_Category(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='inactive')
 
     def __str__(self):
-        return f"{self.issue_category_name} ({self.department.department_name})"
\ No newline at end of file
+        return f"{self.issue_category_name} ({self.department.department_name})"
+
+
+class TicketSequence(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name} ({self.next_value})"
@@ -1,7 +1,150 @@
-from rest_framework.pagination import LimitOffsetPagination
+import json
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, LimitOffsetPagination
+from rest_framework.response import Response
 
 class CustomLimitOffsetPagination(LimitOffsetPagination):
     default_limit = 10  # Default number of items per page
     max_limit = 100     # Maximum number of items allowed per page
     # The 'limit' query parameter can be used to specify the page size
-    # The 'offset' query parameter can be used to specify the starting point 
\ No newline at end of file
+    # The 'offset' query parameter can be used to specify the starting point
+
+
+class ComplaintCursorPagination(CursorPagination):
+    """
+    Keyset pagination on (ordering field, ticket_id).
+
+    DRF's CursorPagination positions its cursor on the first ordering field
+    alone and steps over the rows sharing that value with an offset, which
+    turns back into OFFSET paging on fields like priority or status. Here the
+    cursor holds the last row's value of the ordering field and its ticket_id,
+    and each page filters on that pair, so deep pages cost the same as the
+    first and rows with equal values never move between pages.
+    """
+    ordering = ('-submitted_at', '-ticket_id')
+    tiebreak = 'ticket_id'
+    page_size = 10
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        # Only the first field the client orders by is kept; ticket_id makes it unique
+        field = super().get_ordering(request, queryset, view)[0]
+        if field.lstrip('-') == self.tiebreak:
+            return (field,)
+        return (field, f'-{self.tiebreak}' if field.startswith('-') else self.tiebreak)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        # A previous link walks the ordering backwards from the first row of its page
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.rows_after(ordering, self.decode_position(position)))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def rows_after(self, ordering, values):
+        # (a, b) > (x, y) as a filter, with each field compared in its own direction
+        condition = None
+        for i in reversed(range(len(ordering))):
+            name = ordering[i].lstrip('-')
+            lookup = 'lt' if ordering[i].startswith('-') else 'gt'
+            after = Q(**{f'{name}__{lookup}': values[name]})
+            if condition is not None:
+                after |= Q(**{name: values[name]}) & condition
+            condition = after
+        return condition
+
+    def position_of(self, row):
+        names = [field.lstrip('-') for field in self.ordering]
+        values = row if isinstance(row, dict) else {name: getattr(row, name) for name in names}
+        return json.dumps({name: str(values[name]) for name in names})
+
+    def decode_position(self, position):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        # A cursor from a listing in another order can't be continued in this one
+        if not isinstance(values, dict) or sorted(values) != sorted(field.lstrip('-') for field in self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.position_of(self.page[-1]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.position_of(self.page[0]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+
+class ComplaintPagination(CustomLimitOffsetPagination):
+    """
+    Limit/offset pagination that switches to keyset pagination per request.
+
+    Clients opt in with ?pagination=cursor and then follow the next/previous
+    links. The total count costs a COUNT(*) over the filtered rows, so in
+    cursor mode it is only returned when asked for with ?count=true.
+    """
+    cursor_pagination_class = ComplaintCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        # Grouped report querysets (values/annotate) have no rows to key on
+        if self.wants_cursor(request) and isinstance(queryset, QuerySet) and not queryset.query.values_select:
+            self.cursor_paginator = self.cursor_pagination_class()
+            self.count = queryset.count() if request.query_params.get('count') == 'true' else None
+            self.request = request
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def wants_cursor(self, request):
+        return request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params
+
+    def get_next_link(self):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_next_link()
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_previous_link()
+        return super().get_previous_link()
+
+    def get_paginated_response(self, data):
+        if not self.cursor_paginator:
+            return super().get_paginated_response(data)
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
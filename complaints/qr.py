@@ -0,0 +1,106 @@
+import hmac
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+
+
+QR_IMAGE_CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def sign_payload(dataenc):
+    # HMAC signature of the base64 encoded room data
+    return hmac.new(
+        settings.QR_CODE_SECRET_KEY.encode('utf-8'),
+        dataenc.encode('utf-8'),
+        hashlib.sha256
+    ).hexdigest()
+
+
+def build_qr_url(dataenc):
+    # The URL encoded in the QR code, carrying the room data and its signature
+    signature = sign_payload(dataenc)
+    return f"http://localhost:3000/ComplaintForm?data={dataenc}&signature={signature}"
+
+
+def payload_hash(qr_data):
+    # Content hash of the signed payload, used as the image cache key and ETag
+    return hashlib.sha256(qr_data.encode('utf-8')).hexdigest()
+
+
+def render_qr_image(qr_data, image_format='png', box_size=10, border=4):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+
+    buffer = BytesIO()
+    if image_format == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class QRImageCache:
+    """Thread-safe LRU of rendered QR images, bounded by total size in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def set(self, key, image):
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._images.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._images[key] = image
+            self._size += len(image)
+            # Evict the least recently used images until we fit again
+            while self._size > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._size = 0
+
+
+qr_image_cache = QRImageCache(settings.QR_IMAGE_CACHE_MAX_BYTES)
+
+
+def qr_image_etag(qr_hash, image_format='png', box_size=10, border=4):
+    # The payload hash (Room.qr_hash) plus the rendering options; known without rendering anything
+    return payload_hash(f'{qr_hash}|{image_format}|{box_size}|{border}')
+
+
+def get_qr_image(qr_data, image_format='png', box_size=10, border=4, qr_hash=None):
+    # Returns (etag, image bytes), rendering only on a cache miss
+    etag = qr_image_etag(qr_hash or payload_hash(qr_data), image_format, box_size, border)
+    image = qr_image_cache.get(etag)
+    if image is None:
+        image = render_qr_image(qr_data, image_format, box_size, border)
+        qr_image_cache.set(etag, image)
+    return etag, image
@@ -0,0 +1,84 @@
+import functools
+import logging
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryLog:
+    # execute_wrapper that records every statement sent to the database
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def report(self):
+        return '\n'.join(f'{i}. {sql}' for i, sql in enumerate(self.queries, 1))
+
+
+@contextmanager
+def capture_queries():
+    """Records the queries run on every database connection inside the block."""
+    log = QueryLog()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(log))
+        yield log
+
+
+@contextmanager
+def assert_max_queries(limit, label='block'):
+    """Test helper: fails if the block runs more than `limit` queries."""
+    with capture_queries() as log:
+        yield log
+    if len(log) > limit:
+        raise QueryBudgetExceeded(f'{label} ran {len(log)} queries, budget is {limit}:\n{log.report()}')
+
+
+def query_budget(**budgets):
+    """
+    Class decorator for viewsets declaring the most queries each action may run,
+    e.g. @query_budget(list=3, retrieve=2).
+
+    Every request is counted. Going over budget logs a warning, or raises
+    QueryBudgetExceeded when settings.QUERY_BUDGET_STRICT is on (as in the
+    test suite), so an N+1 query fails the tests instead of reaching
+    production. Queries run while a streaming response is consumed happen
+    after the view returns and are not counted.
+    """
+    def decorate(viewset):
+        viewset.query_budgets = {**getattr(viewset, 'query_budgets', {}), **budgets}
+        dispatch = viewset.dispatch
+
+        @functools.wraps(dispatch)
+        def counted_dispatch(self, request, *args, **kwargs):
+            with capture_queries() as log:
+                response = dispatch(self, request, *args, **kwargs)
+            check_query_budget(self, log)
+            return response
+
+        viewset.dispatch = counted_dispatch
+        return viewset
+    return decorate
+
+
+def check_query_budget(view, log):
+    action = getattr(view, 'action', None)
+    limit = view.query_budgets.get(action)
+    if limit is None or len(log) <= limit:
+        return
+    message = f'{type(view).__name__}.{action} ran {len(log)} queries, budget is {limit}'
+    if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(f'{message}:\n{log.report()}')
+    logger.warning(message)
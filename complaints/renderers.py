@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils import encoders
+
+
+class PassthroughRenderer(BaseRenderer):
+    """Lets actions that return a ready-made HttpResponse (images, files) accept any media type."""
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline delimited JSON. Complaint exports stream these rows; other responses render as one line per object."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(json.dumps(row, cls=encoders.JSONEncoder) + '\n' for row in rows).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    """CSV with a header row. Complaint exports stream these rows; other responses render in one go."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        buffer = io.StringIO()
+        writer = None
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(buffer, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(csv_row(row))
+        return buffer.getvalue().encode(self.charset)
+
+
+def csv_row(row):
+    # Nested values (e.g. a complaint's images) are written as JSON inside the cell
+    return {
+        key: json.dumps(value, cls=encoders.JSONEncoder) if isinstance(value, (list, dict)) else value
+        for key, value in row.items()
+    }
@@ -0,0 +1,336 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .sketches import QuantileSketch
+
+# Complaint fields that decide which rollup rows a complaint is counted in
+ROLLUP_FIELDS = ('submitted_at', 'assigned_department', 'priority', 'status', 'resolved_at')
+
+# Rollup changes collected by batched_rollup_updates(), when one is active
+_batch = ContextVar('complaint_rollup_batch', default=None)
+
+
+def complaint_state(complaint):
+    return tuple(getattr(complaint, field) for field in ROLLUP_FIELDS)
+
+
+def stored_state(ticket_id):
+    # Locks the complaint row (where the database supports it) so concurrent
+    # status changes can't both move the ticket out of the same rollup row
+    from .models import Complaint
+
+    return Complaint.objects.select_for_update().filter(pk=ticket_id).values_list(*ROLLUP_FIELDS).first()
+
+
+def count_key(state, archived=False):
+    # Days are calendar days in the current time zone, like the report date filters.
+    # Complaints without a department are counted under ''.
+    submitted_at, assigned_department, priority, status, resolved_at = state
+    return (timezone.localdate(submitted_at), assigned_department or '', priority, status, archived)
+
+
+def tat_entry(state, archived=False):
+    # Resolved complaints contribute their turnaround time to the day they were submitted
+    submitted_at, assigned_department, priority, status, resolved_at = state
+    if status != 'resolved' or resolved_at is None:
+        return None
+    key = (timezone.localdate(submitted_at), assigned_department or '', priority, archived)
+    return key, max((resolved_at - submitted_at).total_seconds(), 0.0)
+
+
+def sla_breached(priority, seconds):
+    sla_hours = settings.COMPLAINT_SLA_HOURS.get(priority)
+    return sla_hours is not None and seconds > sla_hours * 3600
+
+
+def move_complaint(old_state, new_state, archived=False):
+    """
+    Moves one complaint between rollup rows. Either state may be None for a
+    created or deleted complaint; `archived` picks the archive's rows instead
+    of the live ones.
+    """
+    old_key = count_key(old_state, archived) if old_state else None
+    new_key = count_key(new_state, archived) if new_state else None
+    if old_key != new_key:
+        if old_key is not None:
+            _add(old_key, -1)
+        if new_key is not None:
+            _add(new_key, 1)
+
+    old_tat = tat_entry(old_state, archived) if old_state else None
+    new_tat = tat_entry(new_state, archived) if new_state else None
+    if old_tat != new_tat:
+        if old_tat is not None:
+            _add_tat(old_tat[0], [(old_tat[1], -1)])
+        if new_tat is not None:
+            _add_tat(new_tat[0], [(new_tat[1], 1)])
+
+
+@contextmanager
+def batched_rollup_updates():
+    """
+    Collects the rollup changes made inside the block and writes them when it
+    exits, once per rollup row, instead of once per complaint. For bulk jobs
+    such as archiving; the block must run inside a transaction.
+    """
+    batch = ({}, {})
+    token = _batch.set(batch)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+    counts, tats = batch
+    for key, delta in counts.items():
+        if delta:
+            _add(key, delta)
+    for key, values in tats.items():
+        _add_tat(key, values)
+
+
+def _add(key, delta):
+    from .models import ComplaintRollup
+
+    batch = _batch.get()
+    if batch is not None:
+        batch[0][key] = batch[0].get(key, 0) + delta
+        return
+
+    day, department, priority, status, archived = key
+    rows = ComplaintRollup.objects.filter(
+        day=day, assigned_department=department, priority=priority, status=status, archived=archived
+    )
+    for attempt in range(2):
+        if rows.update(count=F('count') + delta) or delta < 0:
+            return
+        try:
+            with transaction.atomic():
+                ComplaintRollup.objects.create(
+                    day=day, assigned_department=department, priority=priority, status=status, archived=archived,
+                    count=delta
+                )
+            return
+        except IntegrityError:
+            # Another transaction created the row first, add to it instead
+            if attempt:
+                raise
+
+
+def _add_tat(key, values):
+    # values: (turnaround seconds, +1 or -1) pairs
+    from .models import ComplaintTATSketch
+
+    batch = _batch.get()
+    if batch is not None:
+        batch[1].setdefault(key, []).extend(values)
+        return
+
+    day, department, priority, archived = key
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                row = ComplaintTATSketch.objects.select_for_update().filter(
+                    day=day, assigned_department=department, priority=priority, archived=archived
+                ).first()
+                if row is None:
+                    row = ComplaintTATSketch(day=day, assigned_department=department, priority=priority, archived=archived)
+                sketch = QuantileSketch.from_json(row.sketch)
+                for seconds, delta in values:
+                    sketch.add(seconds, delta)
+                    row.count += delta
+                    row.total_seconds += delta * seconds
+                    if sla_breached(priority, seconds):
+                        row.sla_breaches += delta
+                row.sketch = sketch.to_json()
+                row.save()
+            return
+        except IntegrityError:
+            # Another transaction created the row first, update that one
+            if attempt:
+                raise
+
+
+def ticket_counts():
+    # Same open/resolved/total figures the reports used to count over the complaint table
+    return {
+        'open_tickets': Coalesce(Sum('count', filter=Q(status='open')), 0),
+        'resolved_tickets': Coalesce(Sum('count', filter=Q(status='resolved')), 0),
+        'total_tickets': Coalesce(Sum('count'), 0),
+    }
+
+
+def complaint_ticket_counts():
+    # The same figures counted over the complaint table, for filters the rollups can't answer
+    return {
+        'open_tickets': Count('ticket_id', filter=Q(status='open')),
+        'resolved_tickets': Count('ticket_id', filter=Q(status='resolved')),
+        'total_tickets': Count('ticket_id'),
+    }
+
+
+class TATSummary:
+    """Turnaround time statistics for one group of resolved complaints, merged from sketches."""
+
+    def __init__(self):
+        self.sketch = QuantileSketch()
+        self.count = 0
+        self.total_seconds = 0.0
+        self.sla_breaches = 0
+
+    def add_sketch_row(self, row):
+        self.sketch.merge(QuantileSketch.from_json(row.sketch))
+        self.count += row.count
+        self.total_seconds += row.total_seconds
+        self.sla_breaches += row.sla_breaches
+
+    def add_value(self, priority, seconds):
+        self.sketch.add(seconds)
+        self.count += 1
+        self.total_seconds += seconds
+        self.sla_breaches += sla_breached(priority, seconds)
+
+    def as_dict(self):
+        return {
+            'resolved_tickets': self.count,
+            'average_tat': str(timedelta(seconds=self.total_seconds / self.count)) if self.count else '-',
+            'p50_tat': format_tat(self.sketch.quantile(0.5)),
+            'p90_tat': format_tat(self.sketch.quantile(0.9)),
+            'p99_tat': format_tat(self.sketch.quantile(0.99)),
+            'sla_breaches': self.sla_breaches,
+            'histogram': self.sketch.histogram(),
+        }
+
+
+def format_tat(seconds):
+    return '-' if seconds is None else str(timedelta(seconds=round(seconds)))
+
+
+def summarize_tats(groups):
+    """
+    Turns {(department, priority): TATSummary} into the overall summary plus
+    one entry per department and priority.
+    """
+    overall = TATSummary()
+    per_department = []
+    for (department, priority), summary in sorted(groups.items()):
+        overall.sketch.merge(summary.sketch)
+        overall.count += summary.count
+        overall.total_seconds += summary.total_seconds
+        overall.sla_breaches += summary.sla_breaches
+        per_department.append({'assigned_department': department or None, 'priority': priority, **summary.as_dict()})
+    return overall, per_department
+
+
+def tat_stats_from_sketches(sketch_rows):
+    # Merges the stored per-day sketches; reads one row per day, department and priority
+    groups = {}
+    for row in sketch_rows.iterator():
+        groups.setdefault((row.assigned_department, row.priority), TATSummary()).add_sketch_row(row)
+    return summarize_tats(groups)
+
+
+def tat_stats_from_complaints(*querysets):
+    # For filters the daily sketches can't answer (time of day windows). Takes
+    # the live and archived complaints as separate querysets.
+    groups = {}
+    for complaints in querysets:
+        resolved = complaints.filter(status='resolved', resolved_at__isnull=False).values_list(
+            'assigned_department', 'priority', 'submitted_at', 'resolved_at'
+        )
+        for department, priority, submitted_at, resolved_at in resolved.iterator():
+            seconds = max((resolved_at - submitted_at).total_seconds(), 0.0)
+            groups.setdefault((department or '', priority), TATSummary()).add_value(priority, seconds)
+    return summarize_tats(groups)
+
+
+def merge_ticket_counts(*querysets):
+    """
+    Adds up the per department and priority ticket counts of several grouped
+    querysets (the live and archived complaints), in report order.
+    """
+    merged = {}
+    for rows in querysets:
+        for row in rows:
+            key = (row['assigned_department'] or '', row['priority'])
+            total = merged.setdefault(key, dict.fromkeys(complaint_ticket_counts(), 0))
+            for field in total:
+                total[field] += row[field]
+    return [
+        {'assigned_department': department, 'priority': priority, **counts}
+        for (department, priority), counts in sorted(merged.items())
+        if counts['total_tickets']
+    ]
+
+
+def rebuild_rollups(batch_size=500):
+    """
+    Recounts every rollup row, TAT sketch and hotspot counter from the
+    complaint and archive tables. Returns the number of rows written.
+    """
+    from .hotspots import HOTSPOT_FIELDS, count_hotspots
+    from .models import ArchivedComplaint, Complaint, ComplaintHotspot, ComplaintRollup, ComplaintTATSketch
+
+    totals = {}
+    sketch_rows = {}
+    hotspots = {}
+    with transaction.atomic():
+        # Lock the rollup tables first so complaints changed during the rebuild wait for it
+        ComplaintRollup.objects.all().delete()
+        ComplaintTATSketch.objects.all().delete()
+        ComplaintHotspot.objects.all().delete()
+        for model, archived in ((Complaint, False), (ArchivedComplaint, True)):
+            counts = (
+                model.objects
+                .annotate(day=TruncDate('submitted_at'))
+                .values('day', 'assigned_department', 'priority', 'status')
+                .annotate(total=Count('pk'))
+                .order_by()
+            )
+            for row in counts.iterator():
+                key = (row['day'], row['assigned_department'] or '', row['priority'], row['status'], archived)
+                totals[key] = totals.get(key, 0) + row['total']
+
+            resolved = model.objects.filter(status='resolved', resolved_at__isnull=False).values_list(*ROLLUP_FIELDS)
+            for state in resolved.iterator():
+                key, seconds = tat_entry(state, archived)
+                sketch_rows.setdefault(key, TATSummary()).add_value(key[2], seconds)
+
+            for key, count in count_hotspots(model.objects.values_list(*HOTSPOT_FIELDS).iterator()).items():
+                hotspots[key] = hotspots.get(key, 0) + count
+
+        ComplaintRollup.objects.bulk_create(
+            (
+                ComplaintRollup(
+                    day=day, assigned_department=department, priority=priority, status=status, archived=archived,
+                    count=count
+                )
+                for (day, department, priority, status, archived), count in totals.items()
+            ),
+            batch_size=batch_size
+        )
+        ComplaintTATSketch.objects.bulk_create(
+            (
+                ComplaintTATSketch(
+                    day=day, assigned_department=department, priority=priority, archived=archived,
+                    sketch=summary.sketch.to_json(), count=summary.count, total_seconds=summary.total_seconds,
+                    sla_breaches=summary.sla_breaches
+                )
+                for (day, department, priority, archived), summary in sketch_rows.items()
+            ),
+            batch_size=batch_size
+        )
+        ComplaintHotspot.objects.bulk_create(
+            (
+                ComplaintHotspot(
+                    period=period, bucket_start=start, block=block, ward=ward, room_number=room_number,
+                    issue_type=issue_type, count=count
+                )
+                for (period, start, block, ward, room_number, issue_type), count in hotspots.items()
+            ),
+            batch_size=batch_size
+        )
+    return len(totals) + len(sketch_rows) + len(hotspots)
@@ -0,0 +1,87 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+
+REPLICA = 'replica'
+
+_use_replica = ContextVar('complaints_use_replica', default=False)
+
+
+@contextmanager
+def read_from_replica():
+    """ORM reads inside the block go to the replica, while it is fresh enough."""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaReadMixin:
+    """
+    Serves a viewset's GET requests from the read replica, so long report
+    queries don't hold up complaint submissions on the primary. Anything
+    that writes, or has to see its own writes, stays on the primary.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return super().dispatch(request, *args, **kwargs)
+        with read_from_replica():
+            return super().dispatch(request, *args, **kwargs)
+
+
+def replica_lag():
+    """
+    Seconds the replica is behind the primary. A read only connection to the
+    primary's own (WAL mode) SQLite file is never behind; a snapshot file is as
+    old as its last refresh. Lag isn't measured on other databases.
+    """
+    replica = connections.settings[REPLICA]
+    if replica['ENGINE'] != 'django.db.backends.sqlite3' or replica.get('TEST', {}).get('MIRROR'):
+        return 0.0
+    path = sqlite_path(replica['NAME'])
+    if path == sqlite_path(connections.settings['default']['NAME']):
+        return 0.0
+    try:
+        return max(time.time() - os.path.getmtime(path), 0.0)
+    except OSError:
+        return float('inf')
+
+
+def sqlite_path(name):
+    # 'file:/path/db.sqlite3?mode=ro' -> '/path/db.sqlite3'
+    name = str(name)
+    if name.startswith('file:'):
+        name = name[len('file:'):].split('?', 1)[0]
+    return os.path.realpath(name)
+
+
+class ReplicaRouter:
+    """
+    Sends reads made under read_from_replica() to the 'replica' database, unless
+    it is more than DATABASE_REPLICA_MAX_LAG seconds behind. Everything else,
+    writes and migrations included, uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            _use_replica.get()
+            and REPLICA in settings.DATABASES
+            and replica_lag() <= settings.DATABASE_REPLICA_MAX_LAG
+        ):
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
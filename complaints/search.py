@@ -0,0 +1,85 @@
+from django.db import connection
+from rest_framework.filters import SearchFilter
+
+
+class BaseSearchBackend:
+    """Keeps a full-text index of complaints and answers ?search= queries from it."""
+
+    def index(self, complaint, created=False):
+        pass
+
+    def remove(self, entry_id):
+        pass
+
+    def search(self, queryset, terms):
+        # Returns the matching complaints annotated with `search_rank` (lower is better),
+        # or None to fall back to SearchFilter's LIKE based search.
+        return None
+
+
+class SQLiteFTS5SearchBackend(BaseSearchBackend):
+    table = 'complaints_complaint_fts'
+    columns = ['ticket_id', 'room_number', 'bed_number', 'description']
+
+    def index(self, complaint, created=False):
+        from .models import ComplaintSearchEntry
+
+        if created:
+            entry = ComplaintSearchEntry.objects.create(complaint=complaint)
+        else:
+            entry, _ = ComplaintSearchEntry.objects.get_or_create(complaint=complaint)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {self.table} (rowid, {", ".join(self.columns)}) VALUES (%s, %s, %s, %s, %s)',
+                [entry.id] + [getattr(complaint, column) for column in self.columns]
+            )
+
+    def remove(self, entry_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [entry_id])
+
+    def search(self, queryset, terms):
+        from .models import ComplaintSearchEntry
+
+        # Every term must match, as a prefix of a word in any indexed column
+        match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        # Joined rather than looked up per row: SQLite runs the MATCH once and
+        # reads each hit's complaint and bm25() rank off the same row
+        entries = ComplaintSearchEntry._meta.db_table
+        return queryset.extra(
+            select={'search_rank': f'bm25({self.table})'},
+            tables=[entries, self.table],
+            where=[
+                f'{self.table} MATCH %s',
+                f'{self.table}.rowid = {entries}.id',
+                f'{entries}.complaint_id = {queryset.model._meta.db_table}.ticket_id',
+            ],
+            params=[match],
+        )
+
+
+def get_search_backend():
+    if connection.vendor == 'sqlite':
+        return SQLiteFTS5SearchBackend()
+    return BaseSearchBackend()
+
+
+class ComplaintSearchFilter(SearchFilter):
+    """
+    SearchFilter backed by the full-text index where the database has one.
+
+    Results are ranked by relevance unless the client asked for an explicit
+    ?ordering=, so this backend must come after OrderingFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        results = get_search_backend().search(queryset, terms)
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        if not request.query_params.get('ordering'):
+            results = results.order_by('search_rank', '-submitted_at')
+        return results
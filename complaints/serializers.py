@@ -1,24 +1,50 @@
+import asyncio
 import hmac
 import hashlib
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from .models import Room, Complaint, ComplaintImage, Department,Issue_Category
+from .catalog import issue_catalog
+from .storage import add_references
+from .metrics import SerializerTimingMixin
 from django.db import models
 
-class ComplaintImageSerializer(serializers.ModelSerializer):
+
+ROOM_FIELDS = ['bed_number', 'room_number', 'block', 'floor', 'ward', 'speciality', 'room_type']
+
+
+class TimedModelSerializer(SerializerTimingMixin, serializers.ModelSerializer):
+    # Counts towards the serializer time reported by RequestMetricsMiddleware
+    pass
+
+
+class ComplaintImageSerializer(TimedModelSerializer):
     class Meta:
         model = ComplaintImage
-        fields = ['image']  # you can also include 'id' if needed
+        # preview and thumbnail are null until the image pipeline has processed the upload
+        fields = ['image', 'preview', 'thumbnail']
+        read_only_fields = ('preview', 'thumbnail')
 
     def to_internal_value(self, data):
         return super().to_internal_value(data)
 
 
-class RoomSerializer(serializers.ModelSerializer):
+class RoomSerializer(TimedModelSerializer):
+    qr_code = serializers.SerializerMethodField()
+
     class Meta:
         model = Room
         fields = '__all__'
-        read_only_fields = ('qr_code', 'dataenc')
+        read_only_fields = ('dataenc',)
+
+    def get_qr_code(self, obj):
+        # QR images are rendered on demand by RoomViewSet.qr
+        url = f'/api/rooms/{obj.pk}/qr.png/'
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
     def validate(self, data):
         # Get all fields except status
@@ -55,7 +81,13 @@ class RoomSerializer(serializers.ModelSerializer):
         return data
 
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class RoomBulkImportSerializer(RoomSerializer):
+    def validate(self, data):
+        # Uniqueness is checked for the whole batch with a single query in RoomViewSet.bulk_import
+        return data
+
+
+class DepartmentSerializer(TimedModelSerializer):
     department_code = serializers.CharField(required=False)  # Make it optional for updates
 
     class Meta:
@@ -85,7 +117,7 @@ class DepartmentSerializer(serializers.ModelSerializer):
         return value
 
 
-class IssueCatSerializer(serializers.ModelSerializer):
+class IssueCatSerializer(TimedModelSerializer):
     department_name = serializers.CharField(source='department.department_name', read_only=True)
     issue_category_code = serializers.CharField(required=False)  # Updated field name
 
@@ -126,7 +158,7 @@ class IssueCatSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Cannot assign issue category to an inactive department")
         return value
 
-class ComplaintCreateSerializer(serializers.ModelSerializer):
+class ComplaintCreateSerializer(TimedModelSerializer):
     images = ComplaintImageSerializer(many=True,write_only=True,required=False)
     
     # Add fields to receive QR data and signature from frontend
@@ -138,6 +170,8 @@ class ComplaintCreateSerializer(serializers.ModelSerializer):
         images_data = self.context['request'].FILES.getlist('images')
         # Remove 'images' from validated_data as it's not processed by the serializer field
         validated_data.pop('images', None) 
+        # (name, upload) of the files the async submission view has already stored
+        stored_images = validated_data.pop('stored_images', None)
         
         # Remove QR data and signature as they are for validation only
         validated_data.pop('qr_data_from_qr', None)
@@ -145,43 +179,120 @@ class ComplaintCreateSerializer(serializers.ModelSerializer):
 
         complaint = Complaint.objects.create(**validated_data)
 
+        if stored_images is not None:
+            for name, image_file in stored_images:
+                add_references(name, 1, size=image_file.size)
+                # Written back if the last other reference was deleted since it was stored
+                default_storage.put(name, image_file)
+                ComplaintImage.objects.create(complaint=complaint, image=name)
+            return complaint
+
         for image_file in images_data:
             ComplaintImage.objects.create(complaint=complaint, image=image_file)
 
         return complaint
 
-    def validate(self, data):
-        # Get the issue type from the data
+    def validation_queries(self, data):
+        # The room lookup and the duplicate check validate() runs (None where it skips one)
+        rooms = duplicates = None
+        if any(field in data for field in ROOM_FIELDS):
+            rooms = Room.objects.filter(
+                bed_no=data['bed_number'],
+                room_no=data['room_number'],
+                Block=data['block'],
+                Floor_no=data['floor'],
+                ward=data['ward'],
+                speciality=data['speciality'],
+                room_type=data['room_type']
+            )
         issue_type = data.get('issue_type')
-        
-        # Find the corresponding issue category and get its department
+        if issue_type and all(field in data for field in ROOM_FIELDS):
+            duplicates = Complaint.objects.filter(
+                issue_type=issue_type,
+                bed_number=data['bed_number'],
+                room_number=data['room_number'],
+                block=data['block'],
+                floor=data['floor'],
+                ward=data['ward'],
+                speciality=data['speciality'],
+                room_type=data['room_type'],
+                status__in=['open', 'in_progress']  # Check for open or in-progress status
+            )
+        return rooms, duplicates
+
+    def validate(self, data):
+        rooms, duplicates = self.validation_queries(data)
+        room = None
+        if rooms is not None:
+            try:
+                room = rooms.get()
+            except Room.DoesNotExist:
+                pass
+        return self.check(
+            data,
+            issue_catalog.department_for(data.get('issue_type')),
+            rooms is not None,
+            room,
+            duplicates is not None and duplicates.exists()
+        )
+
+    async def avalidate(self, data):
+        # validate(), with the catalog, room and duplicate lookups run side by side
+        rooms, duplicates = self.validation_queries(data)
+
+        async def get_room():
+            try:
+                return await rooms.aget()
+            except Room.DoesNotExist:
+                return None
+
+        async def nothing():
+            return None
+
+        department_name, room, duplicate = await asyncio.gather(
+            sync_to_async(issue_catalog.department_for)(data.get('issue_type')),
+            get_room() if rooms is not None else nothing(),
+            duplicates.aexists() if duplicates is not None else nothing(),
+        )
+        return self.check(data, department_name, rooms is not None, room, bool(duplicate))
+
+    async def ais_valid(self):
+        """
+        is_valid() for the async submission view, through avalidate(). The
+        errors come out exactly as is_valid() would report them.
+        """
         try:
-            issue_category = Issue_Category.objects.get(issue_category_name=issue_type, status='active')
-            # Set the assigned department automatically
-            data['assigned_department'] = issue_category.department.department_name
-        except Issue_Category.DoesNotExist:
+            value = self.to_internal_value(self.initial_data)
+            try:
+                self.run_validators(value)
+                value = await self.avalidate(value)
+            except (serializers.ValidationError, DjangoValidationError) as exc:
+                raise serializers.ValidationError(detail=serializers.as_serializer_error(exc))
+        except serializers.ValidationError as exc:
+            self._validated_data = {}
+            self._errors = exc.detail
+        else:
+            self._validated_data = value
+            self._errors = {}
+        return not self._errors
+
+    def check(self, data, department_name, room_given, room, duplicate):
+        # The department of the active issue category, from the in-process catalog
+        if department_name is None:
             raise serializers.ValidationError({
                 'issue_type': 'Invalid or inactive issue category. Please select a valid issue category.'
             })
+        # Set the assigned department automatically
+        data['assigned_department'] = department_name
 
         # Perform existing room validation
-        if any(field in data for field in ['bed_number', 'room_number', 'block', 'floor', 'ward', 'speciality', 'room_type']):
-            try:
-                room = Room.objects.get(
-                    bed_no=data['bed_number'],
-                    room_no=data['room_number'],
-                    Block=data['block'],
-                    Floor_no=data['floor'],
-                    ward=data['ward'],
-                    speciality=data['speciality'],
-                    room_type=data['room_type']
-                )
-                if room.status != 'active':
-                    raise serializers.ValidationError("The specified room is not active")
-                # Update room_status to match room's status
-                data['room_status'] = room.status
-            except Room.DoesNotExist:
+        if room_given:
+            if room is None:
                 raise serializers.ValidationError("Room not found with the provided details")
+            if room.status != 'active':
+                raise serializers.ValidationError("The specified room is not active")
+            # Update room_status to match room's status
+            data['room_status'] = room.status
         
         # HMAC Verification Logic
         qr_data_from_qr = self.initial_data.get('qr_data_from_qr')
@@ -204,23 +315,10 @@ class ComplaintCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({'qr_code': 'QR data or signature missing for QR-based complaint submission.'})
 
         # New validation: Prevent duplicate open/in-progress complaints for the same issue in the same room
-        if issue_type and all(field in data for field in ['bed_number', 'room_number', 'block', 'floor', 'ward', 'speciality', 'room_type']):
-            existing_complaint = Complaint.objects.filter(
-                issue_type=issue_type,
-                bed_number=data['bed_number'],
-                room_number=data['room_number'],
-                block=data['block'],
-                floor=data['floor'],
-                ward=data['ward'],
-                speciality=data['speciality'],
-                room_type=data['room_type'],
-                status__in=['open', 'in_progress']  # Check for open or in-progress status
-            ).exists()
-
-            if existing_complaint:
-                raise serializers.ValidationError(
-                    'A complaint with the same issue type is already open or in progress for this room.'
-                )
+        if duplicate:
+            raise serializers.ValidationError(
+                'A complaint with the same issue type is already open or in progress for this room.'
+            )
 
         return data
 
@@ -230,7 +328,7 @@ class ComplaintCreateSerializer(serializers.ModelSerializer):
 
    
 
-class ComplaintSerializer(serializers.ModelSerializer):
+class ComplaintSerializer(TimedModelSerializer):
     images = ComplaintImageSerializer(many=True, read_only=True)
     class Meta:
         model = Complaint
@@ -259,7 +357,7 @@ class ComplaintSerializer(serializers.ModelSerializer):
         return data
 
 
-class ComplaintUpdateSerializer(serializers.ModelSerializer):
+class ComplaintUpdateSerializer(TimedModelSerializer):
     images = ComplaintImageSerializer(many=True, write_only=True, required=False)
 
     class Meta:
@@ -280,16 +378,11 @@ class ComplaintUpdateSerializer(serializers.ModelSerializer):
 
         return complaint
 
-class ComplaintImageSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = ComplaintImage
-        fields = ['image']
-
-class ReportDepartment(serializers.ModelSerializer):
+class ReportDepartment(TimedModelSerializer):
     class Meta:
         model = Complaint
         fields = ['ticket_id', 'assigned_department', 'priority', 'status', 'submitted_at', 'issue_type', 'room_number', 'ward']
-class TATserializer(serializers.ModelSerializer):
+class TATserializer(TimedModelSerializer):
     class Meta:
         model = Complaint
         fields = ['ticket_id','submitted_at','resolved_at','priority','status']
\ No newline at end of file
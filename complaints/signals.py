@@ -0,0 +1,62 @@
+from functools import partial
+from django.db import transaction
+from django.core.files.storage import default_storage
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .catalog import issue_catalog
+from .images import submit_image
+from .metrics import time_query
+from .models import ArchivedComplaintImage, Complaint, ComplaintImage, ComplaintSearchEntry, Department, Issue_Category
+from .rollups import complaint_state, move_complaint
+from .search import get_search_backend
+from .storage import MEDIA_FIELDS, is_content_addressed
+
+
+@receiver([post_save, post_delete], sender=Issue_Category)
+@receiver([post_save, post_delete], sender=Department)
+def invalidate_issue_catalog(sender, **kwargs):
+    # Drop this process's copy right away, and bump the shared version once the
+    # change is committed so other workers don't reload the old rows.
+    issue_catalog.invalidate()
+    transaction.on_commit(issue_catalog.invalidate)
+
+
+@receiver(post_save, sender=Complaint)
+def index_complaint(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index(instance, created=created)
+
+
+@receiver(post_delete, sender=ComplaintSearchEntry)
+def remove_complaint_from_index(sender, instance, **kwargs):
+    get_search_backend().remove(instance.id)
+
+
+@receiver(post_delete, sender=Complaint)
+def remove_complaint_from_rollups(sender, instance, **kwargs):
+    # Runs inside the delete's transaction
+    move_complaint(complaint_state(instance), None)
+
+
+@receiver(post_save, sender=ComplaintImage)
+def process_uploaded_image(sender, instance, created=False, raw=False, **kwargs):
+    # Resized in the background once the upload is committed, so the request doesn't wait on it
+    if created and not raw:
+        transaction.on_commit(partial(submit_image, instance.pk))
+
+
+@receiver(post_delete, sender=ArchivedComplaintImage)
+@receiver(post_delete, sender=ComplaintImage)
+def release_stored_files(sender, instance, **kwargs):
+    # Every content addressed name a row holds is one reference; older names
+    # were never counted and are left to collect_orphaned_media
+    names = {getattr(instance, field).name for field in MEDIA_FIELDS[sender.__name__]}
+    default_storage.release(name for name in names if is_content_addressed(name))
+
+
+@receiver(connection_created)
+def time_connection_queries(sender, connection, **kwargs):
+    # First in line, so execute_wrapper() blocks entered later still pop their own wrapper
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
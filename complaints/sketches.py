@@ -0,0 +1,87 @@
+import math
+
+# Quantiles come back within 1% of the true value
+RELATIVE_ACCURACY = 0.01
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+# Turnaround times under a second are all counted as zero
+MIN_VALUE = 1.0
+
+# Upper bounds (in hours) of the TAT histogram buckets; the last bucket is open ended
+HISTOGRAM_HOURS = (1, 4, 8, 24, 72, 168)
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with logarithmically sized buckets (DDSketch).
+
+    A value x lands in bucket ceil(log_gamma(x)), so every bucket spans the
+    same relative range and any quantile is answered within RELATIVE_ACCURACY.
+    Sketches merge (and subtract) by adding bucket counts, which lets per-day
+    sketches be combined into any date range without the raw values.
+    """
+
+    def __init__(self, bins=None, zero_count=0):
+        self.bins = {int(index): count for index, count in (bins or {}).items() if count}
+        self.zero_count = zero_count
+
+    @classmethod
+    def from_json(cls, data):
+        data = data or {}
+        return cls(data.get('bins'), data.get('zero', 0))
+
+    def to_json(self):
+        return {'bins': {str(index): count for index, count in sorted(self.bins.items())}, 'zero': self.zero_count}
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.bins.values())
+
+    def add(self, value, count=1):
+        if value < MIN_VALUE:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / _LOG_GAMMA)
+        self.bins[index] = self.bins.get(index, 0) + count
+        if not self.bins[index]:
+            del self.bins[index]
+
+    def remove(self, value):
+        self.add(value, -1)
+
+    def merge(self, other):
+        self.zero_count += other.zero_count
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        return self
+
+    def _values(self):
+        # (representative value, count) pairs in ascending order
+        if self.zero_count:
+            yield 0.0, self.zero_count
+        for index in sorted(self.bins):
+            yield 2 * _GAMMA ** index / (_GAMMA + 1), self.bins[index]
+
+    def quantile(self, q):
+        total = self.count
+        if total <= 0:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for value, count in self._values():
+            seen += count
+            if seen > rank:
+                return value
+        return value
+
+    def histogram(self, bounds_hours=HISTOGRAM_HOURS):
+        """Counts per TAT bucket, e.g. [{'bucket': '1-4h', 'count': 3}, ...]."""
+        edges = [0, *bounds_hours]
+        counts = [0] * (len(bounds_hours) + 1)
+        for value, count in self._values():
+            hours = value / 3600
+            position = next((i for i, bound in enumerate(bounds_hours) if hours < bound), len(bounds_hours))
+            counts[position] += count
+        labels = [f'{low}-{high}h' for low, high in zip(edges, bounds_hours)] + [f'{bounds_hours[-1]}h+']
+        return [{'bucket': label, 'count': count} for label, count in zip(labels, counts)]
@@ -0,0 +1,103 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Complaint, ComplaintEscalation, ComplaintStatusEvent, ScanWatermark
+
+logger = logging.getLogger(__name__)
+
+# Tickets still waiting on someone; resolved, closed and on-hold tickets are not escalated
+ACTIVE_STATUSES = ('open', 'in_progress')
+WATERMARK = 'sla_monitor'
+
+
+def scan_sla_breaches(now=None):
+    """
+    Escalates every unresolved ticket whose SLA deadline (submitted_at plus
+    COMPLAINT_SLA_HOURS for its priority) passed since the previous scan, and
+    returns the new ComplaintEscalation rows.
+
+    Each scan reads only the submitted_at slice between the last watermark
+    and `now`, shifted back by each priority's SLA, through
+    complaint_sla_scan_idx. That slice misses tickets that weren't active
+    when their deadline went by (reopened, or taken off hold, afterwards), so
+    the tickets with status history recorded since the last scan are checked
+    again. That history is read by event id rather than changed_at, so a
+    change committed after a scan that its timestamp predates is still seen.
+    The first scan has no watermark and escalates every ticket already past
+    its deadline.
+
+    A priority change without a status change leaves no history, so a ticket
+    whose priority is raised after its new deadline was scanned past is not
+    escalated.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        # Locking the watermark keeps two monitors from scanning the same slice
+        watermark, _ = ScanWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+        since = watermark.position
+        if since is not None and since >= now:
+            return []
+        last_event_id = ComplaintStatusEvent.objects.order_by('-pk').values_list('pk', flat=True).first()
+
+        candidates = []
+        for priority, hours in settings.COMPLAINT_SLA_HOURS.items():
+            sla = timedelta(hours=hours)
+            window = Complaint.objects.filter(status__in=ACTIVE_STATUSES, priority=priority, submitted_at__lte=now - sla)
+            if since is not None:
+                window = window.filter(submitted_at__gt=since - sla)
+            candidates += [
+                ComplaintEscalation(
+                    ticket_id=ticket_id, assigned_department=department or '', priority=priority, status=status,
+                    submitted_at=submitted_at, due_at=submitted_at + sla, escalated_at=now
+                )
+                for ticket_id, department, status, submitted_at in window.order_by().values_list(
+                    'ticket_id', 'assigned_department', 'status', 'submitted_at'
+                )
+            ]
+
+        if since is not None:
+            # Tickets that became active again after the slices had passed their deadline
+            if watermark.last_event_id is not None:
+                changed = ComplaintStatusEvent.objects.filter(pk__gt=watermark.last_event_id, pk__lte=last_event_id)
+            else:
+                # Watermark saved before event ids were kept
+                changed = ComplaintStatusEvent.objects.filter(changed_at__gt=since, changed_at__lte=now)
+            changed = changed.values('ticket_id')
+            found = {breach.ticket_id for breach in candidates}
+            rows = Complaint.objects.filter(ticket_id__in=changed, status__in=ACTIVE_STATUSES).values_list(
+                'ticket_id', 'assigned_department', 'priority', 'status', 'submitted_at'
+            )
+            for ticket_id, department, priority, status, submitted_at in rows:
+                hours = settings.COMPLAINT_SLA_HOURS.get(priority)
+                if ticket_id in found or hours is None or submitted_at + timedelta(hours=hours) > now:
+                    continue
+                candidates.append(ComplaintEscalation(
+                    ticket_id=ticket_id, assigned_department=department or '', priority=priority, status=status,
+                    submitted_at=submitted_at, due_at=submitted_at + timedelta(hours=hours), escalated_at=now
+                ))
+
+        # Each ticket is escalated at most once, whatever happens to it afterwards
+        escalated = set(
+            ComplaintEscalation.objects.filter(ticket_id__in=[breach.ticket_id for breach in candidates])
+            .values_list('ticket_id', flat=True)
+        ) if candidates else set()
+        breaches = [breach for breach in candidates if breach.ticket_id not in escalated]
+        ComplaintEscalation.objects.bulk_create(breaches, ignore_conflicts=True)
+
+        watermark.position = now
+        watermark.last_event_id = last_event_id or 0
+        watermark.save(update_fields=['position', 'last_event_id'])
+
+    for breach in breaches:
+        escalate(breach)
+    return breaches
+
+
+def escalate(breach):
+    logger.warning(
+        'SLA breach: %s (%s priority, %s, %s) was due at %s',
+        breach.ticket_id, breach.priority, breach.assigned_department or 'unassigned', breach.status,
+        breach.due_at.isoformat()
+    )
@@ -0,0 +1,99 @@
+from datetime import timedelta, timezone as dt_timezone
+from django.db import connections, router
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .events import publish_status_event
+
+
+def record_status_change(complaint, previous_status):
+    """Appends a ComplaintStatusEvent if the complaint's status changed (or it was just created)."""
+    from .models import ComplaintStatusEvent
+
+    if previous_status == complaint.status:
+        return
+    if previous_status is None:
+        changed_at = complaint.submitted_at
+    elif complaint.status == 'resolved' and complaint.resolved_at:
+        # Same instant the TAT figures use
+        changed_at = complaint.resolved_at
+    else:
+        changed_at = timezone.now()
+    event = ComplaintStatusEvent.objects.create(
+        ticket_id=complaint.ticket_id,
+        assigned_department=complaint.assigned_department or '',
+        priority=complaint.priority,
+        from_status=previous_status,
+        to_status=complaint.status,
+        changed_at=changed_at,
+        remarks=complaint.remarks,
+    )
+    publish_status_event(event, complaint.ward)
+
+
+# Every status span that ended inside the window: LAG() pairs each event with the
+# one before it on the same ticket, which is when the ticket entered `from_status`.
+# Only the tickets that changed status inside the window are read, so the cost
+# follows the size of the window rather than the whole history.
+TIME_IN_STATUS_SQL = '''
+SELECT assigned_department, from_status, started_at, changed_at FROM (
+    SELECT
+        assigned_department, priority, from_status, changed_at,
+        LAG(changed_at) OVER (PARTITION BY ticket_id ORDER BY changed_at, id) AS started_at
+    FROM {table}
+    WHERE ticket_id IN (
+        SELECT ticket_id FROM {table} WHERE changed_at >= %s AND changed_at < %s
+    )
+) spans
+WHERE changed_at >= %s AND changed_at < %s AND started_at IS NOT NULL{filters}
+'''
+
+
+def time_in_status(start, end, department=None, priority=None):
+    """
+    How long tickets spent in each status before leaving it, for status
+    changes between `start` and `end`, per department and status.
+    """
+    from .models import ComplaintStatusEvent
+
+    filters, extra = '', []
+    if department:
+        filters += ' AND assigned_department = %s'
+        extra.append(department)
+    if priority:
+        filters += ' AND priority = %s'
+        extra.append(priority)
+    # Raw SQL isn't routed by itself; read from wherever the ORM would (the replica for reports)
+    connection = connections[router.db_for_read(ComplaintStatusEvent)]
+    window = [connection.ops.adapt_datetimefield_value(value) for value in (start, end)]
+    sql = TIME_IN_STATUS_SQL.format(table=connection.ops.quote_name(ComplaintStatusEvent._meta.db_table), filters=filters)
+
+    groups = {}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, window + window + extra)
+        for department_name, status, started_at, ended_at in cursor.fetchall():
+            seconds = max((_as_datetime(ended_at) - _as_datetime(started_at)).total_seconds(), 0.0)
+            group = groups.setdefault((department_name, status), [0, 0.0, 0.0])
+            group[0] += 1
+            group[1] += seconds
+            group[2] = max(group[2], seconds)
+
+    return [
+        {
+            'assigned_department': department_name or None,
+            'status': status,
+            'tickets': count,
+            'average_time': str(timedelta(seconds=round(total / count))),
+            'max_time': str(timedelta(seconds=round(longest))),
+            'total_time': str(timedelta(seconds=round(total))),
+        }
+        for (department_name, status), (count, total, longest) in sorted(groups.items())
+    ]
+
+
+def _as_datetime(value):
+    # SQLite hands raw query datetimes back as text
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, dt_timezone.utc)
+    return value
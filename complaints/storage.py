@@ -0,0 +1,253 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+# <directory>/<ab>/<cd>/<sha256><ext>: two levels of 256 shards keep every
+# directory small, even with millions of files
+HASHED_NAME = re.compile(r'(?:.*/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?')
+
+_released = ContextVar('stored_file_releases', default=None)
+
+
+def is_content_addressed(name):
+    return bool(name) and HASHED_NAME.fullmatch(name) is not None
+
+
+def hashed_name(name, digest):
+    """
+    Where content with the given SHA-256 hex digest is stored, keeping the
+    directory and (lower-cased) extension of the requested name.
+    """
+    directory, basename = posixpath.split(name)
+    extension = os.path.splitext(basename)[1].lower()
+    return posixpath.join(directory, digest[:2], digest[2:4], f'{digest}{extension}')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores files under the SHA-256 hash of their content, so uploading the same
+    bytes twice keeps a single file. StoredFile counts how many saves share
+    each file; delete() only removes it from disk once the last one is gone.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content in _save(), never from a suffix
+        return name
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        with transaction.atomic():
+            # Counted before the file is looked for, so a delete of the last other
+            # reference can't remove the file this save is reusing
+            add_references(name, 1, size=content.size)
+            self.put(name, content)
+        return name
+
+    def store(self, name, content):
+        """
+        Writes the file under its hashed name without counting a reference, and
+        returns that name. Touches no database, so it can run on any thread.
+        The caller counts the reference with add_references() and then calls
+        put() again in the same transaction, which writes the file back if the
+        last other reference was deleted in between. A file that never gets
+        a reference is left to collect_orphaned_media.
+        """
+        name = self.content_name(name, content)
+        self.put(name, content)
+        return name
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+        return hashed_name(name, digest.hexdigest())
+
+    def put(self, name, content):
+        """Makes sure the file for a hashed name is on disk, writing it if it isn't."""
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            # Saved again: the orphan collector goes by when a file was last saved
+            os.utime(full_path)
+        else:
+            self._write(full_path, content)
+
+    def _write(self, full_path, content):
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Written under a temporary name and linked into place, so a reader never
+        # sees half a file and two writers of the same content can't clash
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                content.seek(0)
+                for chunk in content.chunks():
+                    temp.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            try:
+                os.link(temp_path, full_path)
+            except FileExistsError:
+                pass
+        finally:
+            os.unlink(temp_path)
+
+    def delete(self, name):
+        from .models import StoredFile
+
+        if not name:
+            raise ValueError('The name must be given to delete().')
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(name=name).first()
+            if stored is None:
+                # Not counted (stored before this backend): nothing else can share it
+                return super().delete(name)
+            if stored.references > 1:
+                StoredFile.objects.filter(name=name).update(references=F('references') - 1)
+                return
+            stored.delete()
+            # The file has to outlive a rollback that would bring the row back
+            transaction.on_commit(partial(self._delete_unreferenced, name))
+
+    def release(self, names):
+        """
+        Drops one reference per occurrence of each name, and deletes the files
+        left without any once the transaction commits. Names that were never
+        counted are left alone. Inside batched_releases() the references are
+        only collected, and dropped when the block exits.
+        """
+        from .models import StoredFile
+
+        counts = Counter(names)
+        batch = _released.get()
+        if batch is not None:
+            batch.update(counts)
+            return
+        if not counts:
+            return
+        with transaction.atomic(savepoint=False):
+            stored = StoredFile.objects.select_for_update().filter(name__in=counts).values_list('name', 'references')
+            last, remaining = [], {}
+            for name, references in stored:
+                if references <= counts[name]:
+                    last.append(name)
+                else:
+                    remaining.setdefault(counts[name], []).append(name)
+            if last:
+                StoredFile.objects.filter(name__in=last).delete()
+            for count, group in remaining.items():
+                StoredFile.objects.filter(name__in=group).update(references=F('references') - count)
+        for name in last:
+            transaction.on_commit(partial(self._delete_unreferenced, name))
+
+    def discard(self, names):
+        """
+        Deletes files written with store() whose save was abandoned, unless a
+        reference to them has been counted in the meantime.
+        """
+        for name in names:
+            self._delete_unreferenced(name)
+
+    def _delete_unreferenced(self, name):
+        from .models import StoredFile
+
+        # Checked and removed while holding the write lock (transactions begin
+        # IMMEDIATE), so a save counting a new reference either commits first
+        # and keeps the file, or comes after and puts it back
+        with transaction.atomic():
+            if not StoredFile.objects.filter(name=name).exists():
+                super().delete(name)
+
+
+@contextmanager
+def batched_releases():
+    """
+    Collects the file references released inside the block (see
+    ContentAddressedStorage.release) and drops them when it exits, once per
+    file instead of once per row. The block must run inside a transaction.
+    """
+    from django.core.files.storage import default_storage
+
+    batch = Counter()
+    token = _released.set(batch)
+    try:
+        yield
+    finally:
+        _released.reset(token)
+    default_storage.release(batch.elements())
+
+
+def add_references(name, count, size=None):
+    """
+    Adds count references to a stored file, recording it if it isn't yet
+    (files written before this backend, or left behind by a rollback).
+    """
+    from .models import StoredFile
+
+    rows = StoredFile.objects.filter(name=name)
+    for attempt in range(2):
+        if rows.update(references=F('references') + count):
+            return
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, size=size or 0, references=count)
+            return
+        except IntegrityError:
+            # Another transaction recorded it first, add to that row instead
+            if attempt:
+                raise
+
+
+# Every field that holds a name in the default storage
+MEDIA_FIELDS = {
+    'ComplaintImage': ('image', 'preview', 'thumbnail'),
+    'ArchivedComplaintImage': ('image', 'preview', 'thumbnail'),
+}
+
+
+def rehash_media(batch_size=500):
+    """
+    Moves files saved before ContentAddressedStorage to their content hashed
+    names and points the rows at them, merging duplicates along the way.
+    Returns the number of files moved and the names whose file was missing.
+    """
+    from django.apps import apps
+    from django.core.files.storage import default_storage
+
+    moved, missing = 0, []
+    for model_name, fields in MEDIA_FIELDS.items():
+        model = apps.get_model('complaints', model_name)
+        last = 0
+        while True:
+            rows = list(model.objects.filter(pk__gt=last).order_by('pk').values_list('pk', *fields)[:batch_size])
+            if not rows:
+                break
+            last = rows[-1][0]
+            for name in {name for row in rows for name in row[1:] if name and not is_content_addressed(name)}:
+                if not default_storage.exists(name):
+                    missing.append(name)
+                    continue
+                with default_storage.open(name) as file:
+                    new_name = default_storage.save(name, file)
+                with transaction.atomic():
+                    # Rows of any model may share the old name; save() counted one of them
+                    updated = sum(
+                        apps.get_model('complaints', other).objects.filter(**{field: name}).update(**{field: new_name})
+                        for other, other_fields in MEDIA_FIELDS.items()
+                        for field in other_fields
+                    )
+                    if updated > 1:
+                        add_references(new_name, updated - 1)
+                if not updated:
+                    default_storage.delete(new_name)
+                default_storage.delete(name)
+                moved += 1
+    return moved, missing
@@ -0,0 +1,84 @@
+import csv
+import json
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.utils import encoders
+from .renderers import csv_row
+
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class _Echo:
+    # File-like object for csv.writer that hands the formatted line straight back
+    def write(self, value):
+        return value
+
+
+def iter_serialized(queryset, serializer_class, context):
+    # Fetch and serialize the rows one chunk at a time; images are prefetched per chunk
+    chunk_size = settings.COMPLAINT_STREAM_CHUNK_SIZE
+    rows = queryset.prefetch_related('images').iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from serializer_class(chunk, many=True, context=context).data
+
+
+def _json_array(rows):
+    yield '['
+    for index, row in enumerate(rows):
+        yield (',' if index else '') + json.dumps(row, cls=encoders.JSONEncoder)
+    yield ']'
+
+
+def _ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=encoders.JSONEncoder) + '\n'
+
+
+def _csv(rows):
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(_Echo(), fieldnames=list(row))
+            yield writer.writeheader()
+        yield writer.writerow(csv_row(row))
+
+
+async def _aiterate(content, size):
+    # Under ASGI Django reads a plain iterator to the end before sending anything,
+    # so the pieces are pulled `size` at a time on the request's worker thread
+    # (where the rows are fetched and serialized) and each batch is sent as it comes
+    take = sync_to_async(lambda: list(islice(content, size)))
+    while pieces := await take():
+        yield ''.join(pieces)
+
+
+def stream_complaints(queryset, serializer_class, export_format, context):
+    """
+    Streams serialized complaints as a JSON array, NDJSON or CSV with constant
+    memory, under WSGI and ASGI alike.
+    """
+    rows = iter_serialized(queryset, serializer_class, context)
+    if export_format == 'ndjson':
+        content = _ndjson(rows)
+    elif export_format == 'csv':
+        content = _csv(rows)
+    else:
+        content = _json_array(rows)
+    request = context.get('request')
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        content = _aiterate(content, settings.COMPLAINT_STREAM_CHUNK_SIZE)
+
+    response = StreamingHttpResponse(content, content_type=STREAM_CONTENT_TYPES.get(export_format, 'application/json'))
+    if export_format == 'csv':
+        response['Content-Disposition'] = 'attachment; filename="complaints.csv"'
+    return response
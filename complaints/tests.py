@@ -1,3 +1,1911 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import Count, Q, Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_duration
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework.viewsets import GenericViewSet
+from .archive import archive_complaints
+from .catalog import IssueCatalog, issue_catalog
+from .dashboard import cached
+from .events import StatusEventBackend, hub
+from .models import Room, ArchivedComplaint, ArchivedComplaintImage, Complaint, ComplaintImage, ComplaintEscalation, ComplaintHotspot, ComplaintRollup, ComplaintStatusEvent, ComplaintTATSketch, Department, Issue_Category, StoredFile
+from .metrics import MetricsRegistry
+from .qr import QRImageCache, qr_image_cache, qr_image_etag
+from .query_budget import QueryLog
+from .serializers import ComplaintSerializer
+from .sketches import RELATIVE_ACCURACY, QuantileSketch
+from .sla import scan_sla_breaches
+from .storage import add_references, is_content_addressed
+from .urls import router
+from . import views
+from .ticket_ids import BlockTicketIdAllocator
 
-# Create your tests here.
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+METRICS_DIR = tempfile.mkdtemp()
+CACHE_DIR = tempfile.mkdtemp()
+
+# Every API request made by these tests is held to its viewset's query budget.
+# Reports read from the primary: a TestCase's rows sit in an uncommitted transaction
+# the replica connection can't see (ReplicaRoutingTests turns the router back on).
+# Images are processed in the request rather than on the worker pool.
+test_settings = override_settings(
+    QUERY_BUDGET_STRICT=True, METRICS_DIR=METRICS_DIR, DATABASE_ROUTERS=[], IMAGE_PIPELINE_WORKERS=0,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': CACHE_DIR}},
+)
+
+
+def setUpModule():
+    test_settings.enable()
+
+
+def tearDownModule():
+    test_settings.disable()
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def create_room(**kwargs):
+    data = {
+        'bed_no': 'BED01',
+        'room_no': 'Room_01',
+        'Block': 'A',
+        'Floor_no': 1,
+        'ward': 'General',
+        'speciality': 'Medicine',
+        'room_type': 'Private',
+        'status': 'active',
+    }
+    data.update(kwargs)
+    return Room.objects.create(**data)
+
+
+def complaint_payload(room, issue_type, **kwargs):
+    data = {
+        'bed_number': room.bed_no,
+        'room_number': room.room_no,
+        'block': room.Block,
+        'floor': room.Floor_no,
+        'ward': room.ward,
+        'speciality': room.speciality,
+        'room_type': room.room_type,
+        'issue_type': issue_type,
+        'description': 'Tap is leaking',
+        'priority': 'medium',
+        'room_status': room.status,
+    }
+    data.update(kwargs)
+    return data
+
+
+async def asgi_get(path, query_string='', on_body=None):
+    """
+    Runs a GET through Django's ASGIHandler, as an ASGI server would, and
+    returns the response's status and the body of each message it sent.
+    on_body(body) is called as each one is sent.
+    """
+    messages = []
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The handler listens for a disconnect while it streams; none comes
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+        if on_body is not None and message['type'] == 'http.response.body':
+            on_body(message.get('body', b''))
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query_string.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver')], 'client': ('127.0.0.1', 1234), 'server': ('testserver', 80),
+    }
+    # Like the test client: keep the test's connection (and its transaction) open
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        await ASGIHandler()(scope, receive, send)
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+    status = next(message['status'] for message in messages if message['type'] == 'http.response.start')
+    return status, [message.get('body', b'') for message in messages if message['type'] == 'http.response.body']
+
+
+class RoomQRPayloadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        qr_image_cache.clear()
+        self.client = APIClient()
+
+    def etag(self, room):
+        return self.client.get(f'/api/rooms/{room.pk}/qr.png/')['ETag']
+
+    def test_saving_an_unchanged_room_renders_and_writes_nothing(self):
+        with mock.patch('complaints.qr.render_qr_image') as render:
+            room = create_room()
+            payload = (room.dataenc, room.qr_hash)
+            room.save()
+            Room.objects.get(pk=room.pk).save()
+        render.assert_not_called()
+        room.refresh_from_db()
+        self.assertEqual((room.dataenc, room.qr_hash), payload)
+        # The image is never stored: it is rendered when asked for
+        self.assertEqual(os.listdir(self.media_root), [])
+
+    def test_a_changed_payload_replaces_the_served_image(self):
+        room = create_room()
+        etag = self.etag(room)
+        old_hash = room.qr_hash
+        room.ward = 'ICU'
+        room.save(update_fields=['ward'])
+
+        room.refresh_from_db()
+        self.assertNotEqual(room.qr_hash, old_hash)
+        self.assertEqual(json.loads(base64.b64decode(room.dataenc))['ward'], 'ICU')
+        self.assertNotEqual(self.etag(room), etag)
+        self.assertEqual(os.listdir(self.media_root), [])
+
+
+class RoomQRImageTests(TestCase):
+    def setUp(self):
+        qr_image_cache.clear()
+        self.addCleanup(qr_image_cache.clear)
+        self.client = APIClient()
+        self.room = create_room()
+
+    def test_png_and_svg_images(self):
+        png = self.client.get(f'/api/rooms/{self.room.pk}/qr.png/')
+        self.assertEqual(png['Content-Type'], 'image/png')
+        with Image.open(io.BytesIO(png.content)) as image:
+            self.assertEqual(image.format, 'PNG')
+        svg = self.client.get(f'/api/rooms/{self.room.pk}/qr.svg/?box_size=5&border=0')
+        self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', svg.content)
+        self.assertNotEqual(svg['ETag'], png['ETag'])
+
+    def test_matching_etag_is_answered_without_rendering(self):
+        url = f'/api/rooms/{self.room.pk}/qr.png/?box_size=8'
+        etag = self.client.get(url)['ETag']
+        # Another worker, or an evicted entry: nothing cached
+        qr_image_cache.clear()
+        with mock.patch('complaints.qr.render_qr_image') as render:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        render.assert_not_called()
+        self.assertEqual((response.status_code, response['ETag'], response.content), (304, etag, b''))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+        # Other rendering options are another image
+        self.assertNotEqual(self.client.get(f'/api/rooms/{self.room.pk}/qr.png/')['ETag'], etag)
+
+    def test_etag_comes_from_the_stored_payload_hash(self):
+        url = f'/api/rooms/{self.room.pk}/qr.png/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(etag, f'"{qr_image_etag(self.room.qr_hash)}"')
+        with mock.patch('complaints.views.build_qr_url') as build:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        build.assert_not_called()
+
+        # A room saved before the hash was stored gets the same image and ETag
+        Room.objects.filter(pk=self.room.pk).update(qr_hash=None, dataenc=None)
+        qr_image_cache.clear()
+        response = self.client.get(url)
+        self.assertEqual((response.status_code, response['ETag']), (200, etag))
+
+    def test_out_of_range_sizes_are_rejected(self):
+        for query in ['box_size=0', 'box_size=41', 'border=-1', 'border=11', 'box_size=big']:
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/rooms/{self.room.pk}/qr.png/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_cache_evicts_the_least_recently_used_image(self):
+        cache = QRImageCache(max_bytes=10)
+        cache.set('a', b'1234')
+        cache.set('b', b'1234')
+        cache.get('a')
+        cache.set('c', b'1234')
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (b'1234', None, b'1234'))
+        # Too big to cache at all
+        cache.set('d', b'x' * 11)
+        self.assertIsNone(cache.get('d'))
+
+
+class RoomBulkImportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.existing = create_room(bed_no='BED01')
+
+    def room(self, bed_no, **kwargs):
+        data = {
+            'bed_no': bed_no, 'room_no': 'Room_01', 'Block': 'A', 'Floor_no': 1, 'ward': 'General',
+            'speciality': 'Medicine', 'room_type': 'Private', 'status': 'active',
+        }
+        data.update(kwargs)
+        return data
+
+    def test_json_rooms_are_created(self):
+        response = self.client.post('/api/rooms/bulk_import/', [self.room('BED02'), self.room('BED03')], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 0))
+        created = Room.objects.get(bed_no='BED03')
+        self.assertEqual(response.data['results'][1], {'row': 2, 'status': 'created', 'id': created.pk})
+        # bulk_create skips save(), the payload is encoded all the same
+        self.assertEqual(created.dataenc, created.get_room_data())
+        self.assertIsNotNone(created.qr_hash)
+
+        response = self.client.post('/api/rooms/bulk_import/', {'rooms': [self.room('BED04')]}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_csv_rooms_are_created(self):
+        rows = ['bed_no,room_no,Block,Floor_no,ward,speciality,room_type,status']
+        rows += [f'BED1{i},Room_02,B,2,ICU,Cardiology,Shared,active' for i in range(3)]
+        upload = SimpleUploadedFile('rooms.csv', ('\ufeff' + '\n'.join(rows)).encode(), content_type='text/csv')
+        response = self.client.post('/api/rooms/bulk_import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            sorted(Room.objects.filter(ward='ICU').values_list('bed_no', 'Floor_no')),
+            [('BED10', 2), ('BED11', 2), ('BED12', 2)]
+        )
+
+    def test_invalid_and_duplicate_rows_are_reported_per_row(self):
+        rows = [
+            self.room('BED02'),
+            self.room('BED03', Floor_no='first', status='closed'),
+            self.room('BED01'),  # already exists
+            self.room('BED02'),  # repeats row 1
+            self.room('BED05'),
+        ]
+        response = self.client.post('/api/rooms/bulk_import/', rows, format='json')
+        self.assertEqual(response.status_code, 207, response.data)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 3))
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'error', 'error', 'created'])
+        self.assertEqual(set(results[1]['errors']), {'Floor_no', 'status'})
+        for result in results[2:4]:
+            self.assertIn('already exists', result['errors']['non_field_errors'][0])
+        self.assertEqual(Room.objects.filter(bed_no='BED02').count(), 1)
+
+    def test_nothing_valid_is_a_bad_request(self):
+        response = self.client.post('/api/rooms/bulk_import/', [self.room('BED01')], format='json')
+        self.assertEqual((response.status_code, response.data['created']), (400, 0))
+        for data in [[], {'rooms': 'BED02'}]:
+            with self.subTest(data=data):
+                response = self.client.post('/api/rooms/bulk_import/', data, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.data)
+
+    def test_uniqueness_is_checked_with_one_query_for_the_batch(self):
+        # The uniqueness SELECT plus the transaction around one bulk INSERT, however many rows
+        for start, count in [(10, 3), (20, 40)]:
+            rows = [self.room(f'BED{i}') for i in range(start, start + count)]
+            with self.subTest(rows=count), self.assertNumQueries(4):
+                response = self.client.post('/api/rooms/bulk_import/', rows, format='json')
+            self.assertEqual(response.data['created'], count)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ComplaintPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        room = create_room()
+        for i in range(25):
+            Complaint.objects.create(assigned_department='Electrical', **complaint_payload(room, 'Power cut'))
+        # Pairs submitted at the same instant, which the cursor has to step over
+        start = timezone.now() - timezone.timedelta(hours=1)
+        for i, ticket_id in enumerate(Complaint.objects.order_by('ticket_id').values_list('ticket_id', flat=True)):
+            Complaint.objects.filter(ticket_id=ticket_id).update(submitted_at=start + timezone.timedelta(minutes=i // 2))
+        self.tickets = list(
+            Complaint.objects.order_by('-submitted_at', '-ticket_id').values_list('ticket_id', flat=True)
+        )
+
+    def follow(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.data)
+            pages.append(response.data)
+            url = response.data['next']
+        return pages
+
+    def test_following_next_visits_every_complaint_once(self):
+        pages = self.follow('/api/complaints/?pagination=cursor&limit=4')
+
+        self.assertEqual(len(pages), 7)
+        self.assertEqual([row['ticket_id'] for page in pages for row in page['results']], self.tickets)
+        # And back again from the last page
+        previous = self.client.get(pages[-1]['previous']).data
+        self.assertEqual(previous['results'], pages[-2]['results'])
+
+    def test_ascending_cursor(self):
+        pages = self.follow('/api/complaints/?pagination=cursor&limit=10&ordering=submitted_at')
+        self.assertEqual([row['ticket_id'] for page in pages for row in page['results']], self.tickets[::-1])
+
+    def test_cursor_keys_on_low_cardinality_orderings(self):
+        Complaint.objects.filter(ticket_id__in=self.tickets[::3]).update(priority='high')
+        expected = list(Complaint.objects.order_by('priority', 'ticket_id').values_list('ticket_id', flat=True))
+
+        pages = self.follow('/api/complaints/?pagination=cursor&limit=4&ordering=priority')
+        self.assertEqual([row['ticket_id'] for page in pages for row in page['results']], expected)
+        # The cursor holds the row's values, never an offset into the ties
+        cursor = parse_qs(urlparse(pages[3]['next']).query)['cursor'][0]
+        self.assertNotIn('o=', base64.b64decode(cursor).decode())
+
+        # A cursor is only valid for the ordering it was made for
+        response = self.client.get(pages[0]['next'].replace('ordering=priority', 'ordering=-status'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_count_only_when_asked_for_in_cursor_mode(self):
+        response = self.client.get('/api/complaints/?pagination=cursor')
+        self.assertNotIn('count', response.data)
+
+        response = self.client.get('/api/complaints/?pagination=cursor&count=true')
+        self.assertEqual(response.data['count'], 25)
+
+    def test_limit_offset_stays_the_default(self):
+        response = self.client.get('/api/complaints/?limit=10&offset=20')
+
+        self.assertEqual(response.data['count'], 25)
+        self.assertIn('offset=10', response.data['previous'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual([row['ticket_id'] for row in response.data['results']], self.tickets[20:])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The full-text index is SQLite FTS5')
+class ComplaintSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.leaks = self.create('Room_02', 'BED02', 'Leaking tap, leaking pipe, leaking cistern in the washroom')
+        self.leak = self.create('Room_01', 'BED01', 'Tap is leaking')
+        self.fan = self.create('Room_03', 'BED03', 'Ceiling fan is noisy')
+
+    def create(self, room_no, bed_no, description):
+        room = create_room(room_no=room_no, bed_no=bed_no)
+        return Complaint.objects.create(
+            assigned_department='Plumbing', **complaint_payload(room, 'Leak', description=description)
+        )
+
+    def search(self, terms, **params):
+        response = self.client.get('/api/complaints/', {'search': terms, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['ticket_id'] for row in response.data['results']]
+
+    def test_terms_match_word_prefixes(self):
+        self.assertCountEqual(self.search('leak'), [self.leak.ticket_id, self.leaks.ticket_id])
+        self.assertEqual(self.search('ceil nois'), [self.fan.ticket_id])
+        self.assertEqual(self.search('ceiling leak'), [])
+
+    def test_results_are_ranked_by_relevance(self):
+        # The description that says "leaking" three times ranks above the newer one
+        self.assertEqual(self.search('leaking'), [self.leaks.ticket_id, self.leak.ticket_id])
+        # Unless the client orders them
+        self.assertEqual(self.search('leaking', ordering='-submitted_at'), [self.leak.ticket_id, self.leaks.ticket_id])
+
+    def test_ticket_id_room_and_bed_are_searchable(self):
+        self.assertEqual(self.search(self.fan.ticket_id), [self.fan.ticket_id])
+        self.assertEqual(self.search('Room_02'), [self.leaks.ticket_id])
+        self.assertEqual(self.search('BED03'), [self.fan.ticket_id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.fan.description = 'Ceiling fan is leaking oil'
+        self.fan.save()
+        self.assertIn(self.fan.ticket_id, self.search('leaking'))
+        self.assertEqual(self.search('noisy'), [])
+
+        self.leaks.delete()
+        self.assertEqual(self.search('cistern'), [])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM complaints_complaint_fts')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_matches_and_ranks_in_one_pass(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search('leaking')
+        searches = [query['sql'] for query in queries if 'MATCH' in query['sql']]
+        # The listing and its count, each running the MATCH once rather than per row
+        self.assertEqual(len(searches), 2)
+        self.assertEqual([sql.count('MATCH') for sql in searches], [1, 1])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, COMPLAINT_STREAM_CHUNK_SIZE=2)
+class ComplaintStreamingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for i, priority in enumerate(['high', 'low', 'high', 'medium', 'high']):
+            Complaint.objects.create(assigned_department='Electrical', **complaint_payload(
+                create_room(bed_no=f'BED{i:02}'), 'Power cut', priority=priority,
+                # Commas, quotes and line breaks for the CSV writer to escape
+                description=f'Sparks, then "smoke"\nfrom socket {i}'
+            ))
+        ComplaintImage.objects.create(complaint=Complaint.objects.first(), image=png_file())
+
+    def serialized(self, **filters):
+        # What by_status and by_priority returned before they streamed: the serializer's list
+        complaints = Complaint.objects.filter(**filters).prefetch_related('images').order_by('-submitted_at')
+        data = ComplaintSerializer(complaints, many=True, context={'request': RequestFactory().get('/')}).data
+        return json.loads(JSONRenderer().render(data))
+
+    def get(self, url):
+        # The whole body, through the WSGI style test client and through ASGIHandler
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        path, _, query_string = url.partition('?')
+        status, bodies = async_to_sync(asgi_get)(path, query_string)
+        self.assertEqual(status, 200)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(b''.join(bodies), body)
+        return response, body.decode()
+
+    def test_by_status_and_by_priority_return_the_same_json(self):
+        for url, filters in [
+            ('/api/complaints/by_status/?status=open', {'status': 'open'}),
+            ('/api/complaints/by_priority/?priority=high', {'priority': 'high'}),
+            ('/api/complaints/by_priority/?priority=medium', {'priority': 'medium'}),
+            ('/api/complaints/by_status/?status=closed', {'status': 'closed'}),
+        ]:
+            with self.subTest(url=url):
+                response, body = self.get(url)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(json.loads(body), self.serialized(**filters))
+
+    def test_ndjson_is_one_object_per_line(self):
+        response, body = self.get('/api/complaints/?format=ndjson')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertTrue(body.endswith('\n'))
+        self.assertEqual([json.loads(line) for line in body.splitlines()], self.serialized())
+
+    def test_csv_is_a_header_and_one_row_per_complaint(self):
+        response, body = self.get('/api/complaints/?format=csv')
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(body, newline='')))
+        expected = self.serialized()
+        self.assertEqual(rows[0], list(expected[0]))
+        self.assertEqual(len(rows), len(expected) + 1)
+        for row, complaint in zip(rows[1:], expected):
+            record = dict(zip(rows[0], row))
+            self.assertEqual(record['ticket_id'], complaint['ticket_id'])
+            self.assertEqual(record['description'], complaint['description'])
+            self.assertEqual(json.loads(record['images']), complaint['images'])
+
+    async def test_asgi_streams_the_rows_a_chunk_at_a_time(self):
+        for path, query_string in [
+            ('/api/complaints/by_priority/', 'priority=high'),
+            ('/api/complaints/by_status/', 'status=open'),
+            ('/api/complaints/', 'format=ndjson'),
+            ('/api/complaints/', 'format=csv'),
+        ]:
+            with self.subTest(path=path, query_string=query_string):
+                expected = await sync_to_async(lambda: b''.join(self.client.get(f'{path}?{query_string}')))()
+                serialized = []
+                with mock.patch.object(
+                    ComplaintSerializer, 'to_representation', autospec=True,
+                    side_effect=ComplaintSerializer.to_representation
+                ) as to_representation:
+                    status, bodies = await asgi_get(
+                        path, query_string, on_body=lambda body: body and serialized.append(to_representation.call_count)
+                    )
+                self.assertEqual(status, 200)
+                self.assertEqual(b''.join(bodies), expected)
+                # The first rows went out before the last ones were even read
+                self.assertLess(serialized[0], serialized[-1])
+
+    async def test_asgi_response_is_async(self):
+        response = await self.async_client.get('/api/complaints/by_status/?status=open')
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(json.loads(body)), 5)
+
+
+class TicketIdAllocatorTests(TransactionTestCase):
+    def setUp(self):
+        department = Department.objects.create(department_code='PLB', department_name='Plumbing', status='active')
+        self.issue_types = [f'Issue {i}' for i in range(10)]
+        for i, name in enumerate(self.issue_types):
+            Issue_Category.objects.create(
+                issue_category_code=f'IC{i}', department=department, issue_category_name=name, status='active'
+            )
+        self.rooms = [create_room(bed_no=f'BED{i:02}') for i in range(8)]
+
+    def run_threads(self, target, count):
+        errors = []
+
+        def worker(index):
+            try:
+                target(index)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_creates_get_unique_ticket_ids(self):
+        ticket_ids = []
+        # A tiny block size makes the threads lease new blocks all the time
+        allocator = BlockTicketIdAllocator(block_size=3)
+
+        def submit(index):
+            client = APIClient()
+            room = self.rooms[index]
+            for issue_type in self.issue_types:
+                response = client.post('/api/complaints/', complaint_payload(room, issue_type), format='json')
+                self.assertEqual(response.status_code, 201, response.data)
+                ticket_ids.append(response.data['ticket_id'])
+
+        with mock.patch('complaints.models.get_ticket_id_allocator', return_value=allocator):
+            self.run_threads(submit, len(self.rooms))
+
+        self.assertEqual(len(ticket_ids), 80)
+        self.assertEqual(len(set(ticket_ids)), 80)
+        self.assertEqual(Complaint.objects.count(), 80)
+        self.assertTrue(all(ticket_id.startswith('SVN') for ticket_id in ticket_ids))
+
+    def test_concurrent_status_updates_keep_the_rollups_in_step(self):
+        complaints = [Complaint.objects.create(**complaint_payload(room, 'Issue 0')) for room in self.rooms[:4]]
+        statuses = ['in_progress', 'on_hold', 'resolved', 'open']
+
+        def update(index):
+            client = APIClient()
+            for step in range(15):
+                complaint = complaints[(index + step) % len(complaints)]
+                response = client.post(
+                    f'/api/complaints/{complaint.ticket_id}/update_status/',
+                    {'status': statuses[(3 * index + step) % len(statuses)]}, format='json'
+                )
+                self.assertEqual(response.status_code, 200, response.data)
+
+        self.run_threads(update, 8)
+
+        rollups = sorted(ComplaintRollup.objects.filter(count__gt=0).values_list('status', 'count'))
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(sorted(ComplaintRollup.objects.filter(count__gt=0).values_list('status', 'count')), rollups)
+        # Each ticket's history is one unbroken chain of changes, ending at its current status
+        for complaint in complaints:
+            events = ComplaintStatusEvent.objects.filter(ticket_id=complaint.ticket_id).order_by('id')
+            current = None
+            for from_status, to_status in events.values_list('from_status', 'to_status'):
+                self.assertEqual(from_status, current)
+                current = to_status
+            self.assertEqual(current, Complaint.objects.get(pk=complaint.pk).status)
+
+    def test_allocators_in_separate_workers_never_overlap(self):
+        # One allocator per thread stands in for one allocator per gunicorn worker
+        allocated = []
+
+        def allocate(index):
+            allocator = BlockTicketIdAllocator(block_size=7)
+            allocated.extend(allocator.allocate() for _ in range(50))
+
+        self.run_threads(allocate, 8)
+
+        self.assertEqual(len(allocated), 400)
+        self.assertEqual(len(set(allocated)), 400)
+
+    def test_taken_ticket_id_is_skipped_instead_of_overwritten(self):
+        Complaint.objects.create(ticket_id='SVN100000', **complaint_payload(self.rooms[0], 'Issue 0'))
+        allocator = BlockTicketIdAllocator(block_size=5)
+
+        with mock.patch('complaints.models.get_ticket_id_allocator', return_value=allocator):
+            complaint = Complaint.objects.create(**complaint_payload(self.rooms[1], 'Issue 1'))
+
+        self.assertEqual(complaint.ticket_id, 'SVN100005')
+        self.assertEqual(Complaint.objects.get(pk='SVN100000').room_number, self.rooms[0].room_no)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class IssueCatalogTests(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        self.category = Issue_Category.objects.create(
+            issue_category_code='IC1', department=self.department, issue_category_name='Power cut', status='active'
+        )
+        self.room = create_room()
+        self.client = APIClient()
+
+    def test_create_path_does_not_query_the_catalog_tables(self):
+        issue_catalog.department_for('Power cut')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/complaints/', complaint_payload(self.room, 'Power cut'), format='json')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['assigned_department'], 'Electrical')
+        catalog_tables = ('complaints_issue_category', 'complaints_department')
+        self.assertFalse([q for q in queries if any(table in q['sql'] for table in catalog_tables)])
+
+    def test_catalog_follows_category_and_department_changes(self):
+        self.assertEqual(issue_catalog.department_for('Power cut'), 'Electrical')
+
+        self.department.department_name = 'Maintenance'
+        self.department.save()
+        self.assertEqual(issue_catalog.department_for('Power cut'), 'Maintenance')
+
+        self.category.status = 'inactive'
+        self.category.save()
+        response = self.client.post('/api/complaints/', complaint_payload(self.room, 'Power cut'), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('issue_type', response.data)
+
+    def test_invalidation_reaches_catalogs_with_their_own_state(self):
+        # Two workers: each catalog holds its own copy, only the cache is shared
+        first, second = IssueCatalog(), IssueCatalog()
+        self.assertEqual(first.department_for('Power cut'), 'Electrical')
+        self.assertEqual(second.department_for('Power cut'), 'Electrical')
+
+        # Changed without the signals, then invalidated by the second worker only
+        Department.objects.filter(pk=self.department.pk).update(department_name='Maintenance')
+        second.invalidate()
+        self.assertEqual(first.department_for('Power cut'), 'Maintenance')
+        self.assertEqual(second.department_for('Power cut'), 'Maintenance')
+
+    def test_invalidation_reaches_other_processes(self):
+        catalog = IssueCatalog()
+        self.assertEqual(catalog.department_for('Power cut'), 'Electrical')
+        Department.objects.filter(pk=self.department.pk).update(department_name='Maintenance')
+
+        script = 'import django; django.setup(); from complaints.catalog import issue_catalog; issue_catalog.invalidate()'
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'complaintsystem.settings', 'CACHE_DIR': CACHE_DIR}
+        subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, check=True)
+        self.assertEqual(catalog.department_for('Power cut'), 'Maintenance')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ComplaintRollupTests(TestCase):
+    def setUp(self):
+        for code, name in [('ELE', 'Electrical'), ('PLB', 'Plumbing')]:
+            department = Department.objects.create(department_code=code, department_name=name, status='active')
+            Issue_Category.objects.create(
+                issue_category_code=f'{code}1', department=department, issue_category_name=f'{name} issue', status='active'
+            )
+        self.client = APIClient()
+        self.ticket_ids = []
+        for i in range(6):
+            room = create_room(bed_no=f'BED{i:02}')
+            issue_type = 'Electrical issue' if i % 2 else 'Plumbing issue'
+            priority = ['low', 'medium', 'high'][i % 3]
+            response = self.client.post('/api/complaints/', complaint_payload(room, issue_type, priority=priority), format='json')
+            self.assertEqual(response.status_code, 201, response.data)
+            self.ticket_ids.append(response.data['ticket_id'])
+
+    def counted_from_complaints(self):
+        # What the reports used to compute straight from the complaint table
+        return list(
+            Complaint.objects.values('assigned_department', 'priority').annotate(
+                open_tickets=Count('ticket_id', filter=Q(status='open')),
+                resolved_tickets=Count('ticket_id', filter=Q(status='resolved')),
+                total_tickets=Count('ticket_id')
+            ).order_by('assigned_department', 'priority')
+        )
+
+    def department_stats(self):
+        response = self.client.get('/api/report/all_department_stats/?limit=100')
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_rollups_follow_creates_status_changes_and_deletes(self):
+        self.client.post(f'/api/complaints/{self.ticket_ids[0]}/update_status/', {'status': 'resolved'}, format='json')
+        self.client.post(f'/api/complaints/{self.ticket_ids[1]}/update_status/', {'status': 'in_progress'}, format='json')
+        self.client.patch(f'/api/complaints/{self.ticket_ids[2]}/', {'priority': 'low'}, format='json')
+        self.client.delete(f'/api/complaints/{self.ticket_ids[3]}/')
+
+        self.assertEqual(self.department_stats(), self.counted_from_complaints())
+        response = self.client.get('/api/report/department_priority_stats/?department=Plumbing&priority=low')
+        self.assertEqual(response.data, {
+            'open_tickets': 1, 'resolved_tickets': 1, 'total_tickets': 2, 'department': 'Plumbing', 'priority': 'low'
+        })
+
+    def test_reports_do_not_read_the_complaint_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.department_stats()
+            self.client.get('/api/report/department_priority_stats/?department=Plumbing&priority=low')
+        self.assertFalse([q for q in queries if 'complaints_complaint"' in q['sql']])
+
+    def test_empty_report_keeps_its_message(self):
+        response = self.client.get('/api/report/all_department_stats/?department=Housekeeping')
+        self.assertEqual(response.data['message'], 'No data found for the specified filters')
+
+    def test_invalid_submitted_at_is_rejected(self):
+        for query in ['submitted_at=2025-13-40', 'submitted_at=yesterday', 'submitted_at=2025-13-40&start_time=09:00']:
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/report/all_department_stats/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['error'], 'Invalid submitted_at value. Use YYYY-MM-DD')
+
+    def test_rebuild_command_recounts_from_scratch(self):
+        expected = self.department_stats()
+        ComplaintRollup.objects.update(count=0)
+
+        call_command('rebuild_rollups', stdout=io.StringIO())
+
+        self.assertEqual(self.department_stats(), expected)
+
+
+class QuantileSketchTests(TestCase):
+    def test_quantiles_stay_within_relative_accuracy(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(9, 1.5) for _ in range(5000)]
+        sketch = QuantileSketch()
+        for value in values:
+            sketch.add(value)
+
+        values.sort()
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q), exact, delta=exact * RELATIVE_ACCURACY * 1.01)
+
+    def test_merged_sketches_match_one_sketch_and_removal_undoes_add(self):
+        first, second, combined = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        for value in range(1, 500):
+            (first if value % 3 else second).add(value * 60)
+            combined.add(value * 60)
+        merged = QuantileSketch.from_json(first.to_json()).merge(second)
+        self.assertEqual(merged.to_json(), combined.to_json())
+
+        merged.remove(60)
+        combined.add(60, -1)
+        self.assertEqual(merged.to_json(), combined.to_json())
+        self.assertEqual(merged.count, 498)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, COMPLAINT_SLA_HOURS={'high': 4, 'medium': 24, 'low': 72})
+class TATStatsTests(TestCase):
+    def setUp(self):
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='ELE1', department=department, issue_category_name='Power cut', status='active'
+        )
+        self.client = APIClient()
+        self.complaints = [
+            Complaint.objects.create(assigned_department='Electrical', **complaint_payload(
+                create_room(bed_no=f'BED{i:02}'), 'Power cut', priority='high'
+            ))
+            for i in range(10)
+        ]
+
+    def resolve(self, complaint, hours):
+        complaint.status = 'resolved'
+        complaint.resolved_at = complaint.submitted_at + timezone.timedelta(hours=hours)
+        complaint.save()
+
+    def test_percentiles_histogram_and_sla_breaches(self):
+        for complaint, hours in zip(self.complaints, [1, 1, 2, 2, 2, 3, 3, 5, 6, 30]):
+            self.resolve(complaint, hours)
+
+        response = self.client.get('/api/TATView/all_department_TATS/?priority=high')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['resolved_tickets'], 10)
+        self.assertEqual(response.data['sla_breaches'], 3)
+        self.assertEqual(response.data['average_tat'], '5:30:00')
+        for field, hours in [('p50_tat', 2), ('p90_tat', 6), ('p99_tat', 6)]:
+            seconds = parse_duration(response.data[field]).total_seconds()
+            self.assertAlmostEqual(seconds, hours * 3600, delta=hours * 3600 * RELATIVE_ACCURACY)
+        [department] = response.data['department_tats']
+        self.assertEqual(department['assigned_department'], 'Electrical')
+        self.assertEqual(department['p99_tat'], response.data['p99_tat'])
+        histogram = {row['bucket']: row['count'] for row in response.data['histogram']}
+        self.assertEqual(histogram['1-4h'], 7)
+        self.assertEqual(histogram['24-72h'], 1)
+
+    def test_reopened_complaint_leaves_the_sketch(self):
+        self.resolve(self.complaints[0], 10)
+        self.assertEqual(ComplaintTATSketch.objects.get().sla_breaches, 1)
+
+        self.complaints[0].status = 'open'
+        self.complaints[0].save()
+
+        sketch = ComplaintTATSketch.objects.get()
+        self.assertEqual((sketch.count, sketch.sla_breaches, sketch.total_seconds), (0, 0, 0))
+        response = self.client.get('/api/TATView/all_department_TATS/')
+        self.assertEqual(response.data['p90_tat'], '-')
+
+    def test_time_windows_agree_with_daily_sketches(self):
+        for complaint, hours in zip(self.complaints, range(1, 11)):
+            self.resolve(complaint, hours)
+
+        whole_day = self.client.get('/api/TATView/all_department_TATS/').data
+        window = self.client.get('/api/TATView/all_department_TATS/?start_time=00:00&end_time=23:59').data
+        for field in ('resolved_tickets', 'average_tat', 'p50_tat', 'p90_tat', 'sla_breaches', 'histogram'):
+            self.assertEqual(window[field], whole_day[field], field)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class StatusHistoryTests(TestCase):
+    def setUp(self):
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='ELE1', department=department, issue_category_name='Power cut', status='active'
+        )
+        self.client = APIClient()
+        self.complaint = Complaint.objects.create(
+            assigned_department='Electrical', **complaint_payload(create_room(), 'Power cut', priority='high')
+        )
+
+    def test_every_status_change_is_recorded_once(self):
+        self.complaint.remarks = 'Checked the breaker'
+        self.complaint.save()
+        self.client.post(f'/api/complaints/{self.complaint.ticket_id}/update_status/', {'status': 'in_progress'})
+        self.client.post(f'/api/complaints/{self.complaint.ticket_id}/update_status/', {'status': 'resolved'})
+
+        events = ComplaintStatusEvent.objects.filter(ticket_id=self.complaint.ticket_id).order_by('changed_at', 'id')
+        self.assertEqual(
+            [(event.from_status, event.to_status) for event in events],
+            [(None, 'open'), ('open', 'in_progress'), ('in_progress', 'resolved')]
+        )
+        self.complaint.refresh_from_db()
+        self.assertEqual(events.last().changed_at, self.complaint.resolved_at)
+
+    def test_time_in_status_per_department(self):
+        submitted_at = timezone.now() - timezone.timedelta(hours=10)
+        ComplaintStatusEvent.objects.bulk_create([
+            ComplaintStatusEvent(
+                ticket_id='ELE-OLD', assigned_department='Electrical', priority='high',
+                from_status=from_status, to_status=to_status, changed_at=submitted_at + timezone.timedelta(hours=hours)
+            )
+            for from_status, to_status, hours in [(None, 'open', 0), ('open', 'in_progress', 2), ('in_progress', 'resolved', 5)]
+        ])
+
+        response = self.client.get('/api/report/time_in_status/')
+        self.assertEqual(response.status_code, 200)
+        results = {row['status']: row for row in response.data['results']}
+        self.assertEqual(results['open']['average_time'], '2:00:00')
+        self.assertEqual(results['in_progress']['max_time'], '3:00:00')
+        self.assertEqual(results['in_progress']['assigned_department'], 'Electrical')
+        response = self.client.get('/api/report/time_in_status/?department=Plumbing')
+        self.assertEqual(response.data['results'], [])
+
+    def test_invalid_dates_are_rejected(self):
+        for query in ['start_date=2025-13-01', 'start_date=2025-06-30&end_date=2025-06-01', 'end_date=yesterday']:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/report/time_in_status/?{query}').status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ArchiveTests(TestCase):
+    def setUp(self):
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='ELE1', department=department, issue_category_name='Power cut', status='active'
+        )
+        self.client = APIClient()
+        self.complaints = [
+            Complaint.objects.create(assigned_department='Electrical', **complaint_payload(
+                create_room(bed_no=f'BED{i:02}'), 'Power cut', priority='high'
+            ))
+            for i in range(4)
+        ]
+        for complaint, status in zip(self.complaints, ['resolved', 'closed', 'resolved']):
+            complaint.status = status
+            complaint.resolved_at = complaint.submitted_at + timezone.timedelta(hours=2)
+            complaint.save()
+        ComplaintImage.objects.create(complaint=self.complaints[0], image=png_file())
+        # A year on, everything but the open complaint is old enough
+        self.later = timezone.now() + timezone.timedelta(days=400)
+
+    def rollup_rows(self):
+        return sorted(ComplaintRollup.objects.filter(count__gt=0).values_list(
+            'day', 'assigned_department', 'priority', 'status', 'archived', 'count'
+        ))
+
+    def test_old_closed_complaints_move_with_their_images(self):
+        image = ComplaintImage.objects.get().image.name
+        self.assertEqual(archive_complaints(30, now=timezone.now()), 0)
+        self.assertEqual(archive_complaints(30, batch_size=2, now=self.later), 3)
+
+        self.assertEqual(list(Complaint.objects.values_list('ticket_id', flat=True)), [self.complaints[3].ticket_id])
+        archived = ArchivedComplaint.objects.get(pk=self.complaints[0].ticket_id)
+        self.assertEqual(archived.submitted_at, self.complaints[0].submitted_at)
+        self.assertEqual(archived.images.get().image.name, image)
+        self.assertFalse(ComplaintImage.objects.exists())
+        # Counted in the archived rollup rows, the same as a rebuild would
+        incremental = self.rollup_rows()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rollup_rows(), incremental)
+        self.assertEqual(ArchivedComplaintImage.objects.count(), 1)
+
+    def test_archived_images_keep_their_files(self):
+        image = ComplaintImage.objects.get().image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_complaints(30, now=self.later)
+        # The archived row took over the reference the live row released
+        self.assertEqual(StoredFile.objects.get(name=image).references, 1)
+        self.assertTrue(default_storage.exists(image))
+
+    def test_reports_include_archived_complaints_when_asked(self):
+        archive_complaints(30, now=self.later)
+
+        for query in ['', '?start_time=00:00&end_time=23:59']:
+            with self.subTest(query=query):
+                live = self.client.get(f'/api/report/all_department_stats/{query}').data['results']
+                self.assertEqual([row['total_tickets'] for row in live], [1])
+                separator = '&' if query else '?'
+                both = self.client.get(f'/api/report/all_department_stats/{query}{separator}include_archived=true').data
+                self.assertEqual([(row['total_tickets'], row['resolved_tickets']) for row in both['results']], [(4, 2)])
+
+                tats = self.client.get(f'/api/TATView/all_department_TATS/{query}').data
+                self.assertEqual((tats['resolved_tickets'], tats['total_tickets']), (0, 1))
+                tats = self.client.get(f'/api/TATView/all_department_TATS/{query}{separator}include_archived=true').data
+                self.assertEqual((tats['resolved_tickets'], tats['total_tickets'], tats['count']), (2, 4, 4))
+                self.assertEqual(tats['average_tat'], '2:00:00')
+
+        stats = self.client.get('/api/report/department_priority_stats/?department=Electrical&priority=high&include_archived=true')
+        self.assertEqual(stats.data['total_tickets'], 4)
+        response = self.client.get('/api/report/?include_archived=true&status=resolved')
+        self.assertEqual(
+            [row['ticket_id'] for row in response.data['results']],
+            [self.complaints[2].ticket_id, self.complaints[0].ticket_id]
+        )
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='ELE1', department=department, issue_category_name='Power cut', status='active'
+        )
+        self.client = APIClient()
+        for i, (priority, ward) in enumerate([('high', 'General'), ('low', 'General'), ('low', 'ICU')]):
+            Complaint.objects.create(assigned_department='Electrical', **complaint_payload(
+                create_room(bed_no=f'BED{i:02}', ward=ward), 'Power cut', priority=priority
+            ))
+        complaint = Complaint.objects.first()
+        complaint.status = 'resolved'
+        complaint.save()
+
+    def test_summary_counts_every_dimension_in_one_query(self):
+        with self.assertNumQueries(1):
+            summary = self.client.get('/api/dashboard/summary/').data
+        self.assertEqual((summary['total_tickets'], summary['today']), (3, 3))
+        self.assertEqual(summary['by_status']['open'], 2)
+        self.assertEqual(summary['by_priority'], {'low': 2, 'medium': 0, 'high': 1})
+        self.assertEqual(
+            summary['by_department'], [{'assigned_department': 'Electrical', 'total': 3, 'today': 3, 'open_tickets': 2}]
+        )
+        self.assertEqual([(row['ward'], row['total']) for row in summary['by_ward']], [('General', 2), ('ICU', 1)])
+        self.assertEqual(summary['backlog_age'][0], {'bucket': '0-4h', 'count': 2})
+
+        # Served from the cache until the TTL runs out
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/dashboard/summary/').data, summary)
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return len(calls)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cached('test:summary', 60, compute))) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, [1] * 20))
+
+        # Once stale, the caller that refreshes it is the only one to compute
+        with mock.patch('complaints.dashboard.time.time', return_value=time.time() + 120):
+            self.assertEqual(cached('test:summary', 60, compute), 2)
+        self.assertEqual(len(calls), 2)
+
+    def test_other_workers_share_the_cached_value(self):
+        self.assertEqual(cached('test:shared', 60, lambda: 'computed here'), 'computed here')
+
+        script = (
+            'import django; django.setup(); from complaints.dashboard import cached; '
+            "print(cached('test:shared', 60, lambda: 'computed there'))"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'complaintsystem.settings', 'CACHE_DIR': CACHE_DIR}
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, check=True, capture_output=True, text=True
+        )
+        self.assertEqual(result.stdout.strip(), 'computed here')
+
+
+class HotspotTests(TestCase):
+    def setUp(self):
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        for code, name in [('ELE1', 'Power cut'), ('ELE2', 'Fan')]:
+            Issue_Category.objects.create(
+                issue_category_code=code, department=department, issue_category_name=name, status='active'
+            )
+        self.client = APIClient()
+        rooms = [create_room(bed_no='BED01'), create_room(bed_no='BED02', room_no='Room_02', ward='ICU')]
+        for room, issue_type in [(rooms[0], 'Power cut'), (rooms[0], 'Fan'), (rooms[1], 'Power cut')]:
+            Complaint.objects.create(assigned_department='Electrical', **complaint_payload(room, issue_type))
+
+    def test_created_complaints_are_counted_per_hour_and_day(self):
+        self.assertEqual(
+            sorted(ComplaintHotspot.objects.filter(period='day').values_list('room_number', 'issue_type', 'count')),
+            [('Room_01', 'Fan', 1), ('Room_01', 'Power cut', 1), ('Room_02', 'Power cut', 1)]
+        )
+        self.assertEqual(ComplaintHotspot.objects.filter(period='hour').aggregate(Sum('count'))['count__sum'], 3)
+
+        rows = sorted(ComplaintHotspot.objects.values_list('period', 'bucket_start', 'room_number', 'issue_type', 'count'))
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(
+            sorted(ComplaintHotspot.objects.values_list('period', 'bucket_start', 'room_number', 'issue_type', 'count')),
+            rows
+        )
+
+    def test_top_rooms_and_heatmap(self):
+        top = self.client.get('/api/hotspots/top/?limit=1').data['results']
+        self.assertEqual(top, [{'block': 'A', 'ward': 'General', 'room_number': 'Room_01', 'complaints': 2}])
+        wards = self.client.get('/api/hotspots/top/?level=ward&issue_type=Power cut').data['results']
+        self.assertEqual([(row['ward'], row['complaints']) for row in wards], [('General', 1), ('ICU', 1)])
+
+        today = timezone.localdate().isoformat()
+        heatmap = self.client.get(f'/api/hotspots/heatmap/?granularity=hour&start={today}&end={today}').data
+        self.assertEqual(heatmap['count'], 2)
+        self.assertEqual(sum(cell['complaints'] for cell in heatmap['results']), 3)
+        yesterday = (timezone.localdate() - timezone.timedelta(days=1)).isoformat()
+        self.assertEqual(self.client.get(f'/api/hotspots/heatmap/?end={yesterday}').data['count'], 0)
+
+        for query in ['granularity=week', 'start=soon', 'level=floor', 'limit=ten']:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/hotspots/top/?{query}').status_code, 400)
+
+
+@override_settings(COMPLAINT_EVENTS_BACKEND='complaints.events.LocalBackend', COMPLAINT_FEED_HEARTBEAT=0.05)
+class ComplaintFeedTests(TestCase):
+    def setUp(self):
+        self.room = create_room()
+
+    def file_complaint(self, department, **kwargs):
+        # Events go out once the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return Complaint.objects.create(
+                assigned_department=department, **complaint_payload(self.room, 'Power cut', **kwargs)
+            )
+
+    def set_status(self, complaint, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            complaint.status = status
+            complaint.save()
+
+    def parse(self, chunk):
+        lines = dict(line.split(': ', 1) for line in chunk.decode().strip().split('\n'))
+        return lines['event'], json.loads(lines['data'])
+
+    def test_feed_is_refused_under_wsgi(self):
+        response = APIClient().get('/api/complaints/feed/')
+        self.assertEqual(response.status_code, 501)
+        self.assertIn('ASGI', response.json()['detail'])
+        self.assertFalse(response.streaming)
+
+    async def test_matching_events_are_streamed_as_they_happen(self):
+        response = await self.async_client.get('/api/complaints/feed/?department=Electrical&priority=high,medium')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b': connected\n\n')
+
+        await sync_to_async(self.file_complaint)('Plumbing')
+        await sync_to_async(self.file_complaint)('Electrical', priority='low')
+        complaint = await sync_to_async(self.file_complaint)('Electrical')
+        event, data = self.parse(await anext(stream))
+        self.assertEqual((event, data['ticket_id'], data['ward'], data['status']), ('created', complaint.ticket_id, 'General', 'open'))
+
+        await sync_to_async(self.set_status)(complaint, 'in_progress')
+        event, data = self.parse(await anext(stream))
+        self.assertEqual((event, data['from_status'], data['status']), ('status_changed', 'open', 'in_progress'))
+        self.assertEqual(await anext(stream), b': keepalive\n\n')
+
+        # The server cancels the stream when the client goes away
+        self.assertEqual(len(hub), 1)
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(len(hub), 0)
+
+    async def test_reconnecting_clients_catch_up_from_last_event_id(self):
+        first = await sync_to_async(self.file_complaint)('Electrical')
+        await sync_to_async(self.set_status)(first, 'resolved')
+        second = await sync_to_async(self.file_complaint)('Electrical')
+        last_seen = await ComplaintStatusEvent.objects.filter(ticket_id=first.ticket_id).order_by('pk').afirst()
+
+        response = await self.async_client.get('/api/complaints/feed/', headers={'Last-Event-ID': str(last_seen.pk)})
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+        missed = [self.parse(await anext(stream)) for _ in range(2)]
+        self.assertEqual(
+            [(event, data['ticket_id']) for event, data in missed],
+            [('status_changed', first.ticket_id), ('created', second.ticket_id)]
+        )
+        await stream.aclose()
+
+        response = await self.async_client.get('/api/complaints/feed/?priority=urgent')
+        self.assertEqual(response.status_code, 400)
+
+    def test_status_event_backend_tails_the_history_table(self):
+        received = []
+        backend = StatusEventBackend(mock.Mock(dispatch=received.append))
+        self.file_complaint('Electrical')
+        backend.poll()
+        self.assertEqual(received, [])
+
+        complaint = self.file_complaint('Electrical', priority='high')
+        self.set_status(complaint, 'in_progress')
+        backend.poll()
+        self.assertEqual(
+            [(event['type'], event['ticket_id'], event['ward'], event['priority']) for event in received],
+            [('created', complaint.ticket_id, 'General', 'high'), ('status_changed', complaint.ticket_id, 'General', 'high')]
+        )
+        backend.poll()
+        self.assertEqual(len(received), 2)
+
+
+class SLAMonitorTests(TestCase):
+    def setUp(self):
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='ELE1', department=department, issue_category_name='Power cut', status='active'
+        )
+        self.high, self.low, self.resolved = [
+            Complaint.objects.create(assigned_department='Electrical', **complaint_payload(
+                create_room(bed_no=f'BED{i:02}'), 'Power cut', priority=priority
+            ))
+            for i, priority in enumerate(['high', 'low', 'high'])
+        ]
+        self.resolved.status = 'resolved'
+        self.resolved.resolved_at = timezone.now()
+        self.resolved.save()
+        self.start = timezone.now()
+
+    def scan(self, hours):
+        with mock.patch('complaints.sla.logger') as logger:
+            breaches = [breach.ticket_id for breach in scan_sla_breaches(self.start + timezone.timedelta(hours=hours))]
+        self.assertEqual(logger.warning.call_count, len(breaches))
+        return breaches
+
+    def test_each_breach_is_escalated_once(self):
+        self.assertEqual(self.scan(1), [])
+        self.assertEqual(self.scan(5), [self.high.ticket_id])
+        self.assertEqual(self.scan(6), [])
+        self.assertEqual(self.scan(80), [self.low.ticket_id])
+        self.assertEqual(
+            set(ComplaintEscalation.objects.values_list('ticket_id', flat=True)), {self.high.ticket_id, self.low.ticket_id}
+        )
+
+    def test_first_scan_catches_up_and_later_scans_only_read_their_slice(self):
+        self.assertEqual(sorted(self.scan(100)), sorted([self.high.ticket_id, self.low.ticket_id]))
+        with CaptureQueriesContext(connection) as queries:
+            self.scan(101)
+        scans = [query['sql'] for query in queries if 'FROM "complaints_complaint"' in query['sql']]
+        # One slice per priority, then the tickets whose status changed
+        self.assertEqual(len(scans), len(settings.COMPLAINT_SLA_HOURS) + 1)
+        indexes = ['complaint_sla_scan_idx'] * len(settings.COMPLAINT_SLA_HOURS) + ['INTEGER PRIMARY KEY']
+        for sql, index in zip(scans, indexes):
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql.replace('%', '%%'))
+                plan = ' '.join(row[3] for row in cursor.fetchall())
+            self.assertIn(index, plan)
+            self.assertNotIn('SCAN complaints_', plan)
+
+    def test_tickets_reactivated_after_their_deadline_are_escalated(self):
+        on_hold = Complaint.objects.create(assigned_department='Electrical', **complaint_payload(
+            create_room(bed_no='BED09'), 'Power cut', priority='high'
+        ))
+        on_hold.status = 'on_hold'
+        on_hold.save()
+        self.assertEqual(sorted(self.scan(5)), sorted([self.high.ticket_id]))
+
+        # Reopened and taken off hold long after their 4 hour deadline was scanned past
+        with mock.patch('complaints.status_history.timezone.now', return_value=self.start + timezone.timedelta(hours=7)):
+            self.resolved.status = 'open'
+            self.resolved.save()
+            on_hold.status = 'in_progress'
+            on_hold.save()
+        self.assertEqual(sorted(self.scan(8)), sorted([self.resolved.ticket_id, on_hold.ticket_id]))
+        self.assertEqual(self.scan(9), [])
+
+    def test_status_change_committed_after_a_scan_it_predates_is_checked(self):
+        on_hold = Complaint.objects.create(assigned_department='Electrical', **complaint_payload(
+            create_room(bed_no='BED09'), 'Power cut', priority='high'
+        ))
+        on_hold.status = 'on_hold'
+        on_hold.save()
+        self.assertEqual(self.scan(5), [self.high.ticket_id])
+
+        # Taken off hold at 4.5 hours in a transaction that only committed after the 5 hour scan
+        with mock.patch('complaints.status_history.timezone.now', return_value=self.start + timezone.timedelta(hours=4.5)):
+            on_hold.status = 'in_progress'
+            on_hold.save()
+        self.assertEqual(self.scan(6), [on_hold.ticket_id])
+
+    def test_monitor_command_runs_a_scan(self):
+        out = io.StringIO()
+        call_command('run_sla_monitor', '--once', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Escalated 0 SLA breaches')
+
+
+class ShiftWindowTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.ticket_ids = {}
+        day = timezone.make_aware(timezone.datetime(2025, 6, 16))
+        for i, (hour, minute) in enumerate([(2, 30), (9, 0), (13, 15), (17, 0), (22, 45), (23, 59)]):
+            complaint = Complaint.objects.create(
+                assigned_department='Electrical', **complaint_payload(create_room(bed_no=f'BED{i:02}'), 'Power cut')
+            )
+            complaint.submitted_at = day + timezone.timedelta(hours=hour, minutes=minute)
+            complaint.save()
+            self.ticket_ids[f'{hour:02}:{minute:02}'] = complaint.ticket_id
+
+    def listed(self, query):
+        response = self.client.get(f'/api/complaints/?limit=100&{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        ids = {ticket_id: time for time, ticket_id in self.ticket_ids.items()}
+        return sorted(ids[row['ticket_id']] for row in response.data['results'])
+
+    def test_minute_of_day_is_stored_on_save(self):
+        complaint = Complaint.objects.get(pk=self.ticket_ids['22:45'])
+        self.assertEqual(complaint.submitted_minute, 22 * 60 + 45)
+
+    def test_complaint_list_filters_on_shift_windows(self):
+        self.assertEqual(self.listed('start_time=09:00&end_time=17:00'), ['09:00', '13:15', '17:00'])
+        # Night shift wraps past midnight
+        self.assertEqual(self.listed('start_time=22:00&end_time=06:00'), ['02:30', '22:45', '23:59'])
+        self.assertEqual(self.listed('start_time=23:00'), ['23:59'])
+        self.assertEqual(self.client.get('/api/complaints/?start_time=25:00').status_code, 400)
+
+    def test_tat_and_report_endpoints_use_the_same_window(self):
+        response = self.client.get('/api/TATView/all_department_TATS/?start_time=22:00&end_time=06:00')
+        self.assertEqual(response.data['total_tickets'], 3)
+        response = self.client.get('/api/TATView/all_department_TATS/?date=2025-06-16&start_time=09:00&end_time=17:00')
+        self.assertEqual(response.data['total_tickets'], 3)
+        response = self.client.get('/api/report/all_department_stats/?start_time=22:00&end_time=06:00')
+        self.assertEqual(response.data['results'][0]['total_tickets'], 3)
+        response = self.client.get('/api/report/all_department_stats/?start_time=9')
+        self.assertEqual(response.status_code, 400)
+
+
+def png_file(name='photo.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='ELE1', department=department, issue_category_name='Power cut', status='active'
+        )
+        self.room = create_room()
+        self.client = APIClient()
+
+    def phone_photo(self):
+        # Portrait photo stored sideways, with its rotation and location in the EXIF data
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees
+        exif[0x010F] = 'PhoneMaker'
+        buffer = io.BytesIO()
+        Image.new('RGB', (4000, 3000), 'red').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('IMG_0001.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_uploads_are_resized_and_stripped_after_commit(self):
+        data = {**complaint_payload(self.room, 'Power cut'), 'images': [self.phone_photo()]}
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/complaints/', data, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        image = ComplaintImage.objects.get()
+        self.assertIsNone(image.processed_at)
+        upload = image.image.path
+
+        # The raw upload's file is removed once the pipeline's own changes commit
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        image.refresh_from_db()
+        self.assertIsNotNone(image.processed_at)
+        self.assertFalse(os.path.exists(upload))
+        for field, size in [('image', (1536, 2048)), ('preview', (768, 1024)), ('thumbnail', (192, 256))]:
+            with self.subTest(field=field), Image.open(getattr(image, field).path) as stored:
+                self.assertEqual((stored.format, stored.size), ('JPEG', size))
+                self.assertEqual(dict(stored.getexif()), {})
+
+        complaint = self.client.get(f'/api/complaints/{image.complaint_id}/').data
+        [urls] = complaint['images']
+        self.assertTrue(urls['thumbnail'].endswith(image.thumbnail.url))
+
+    def test_pending_images_are_picked_up_by_the_command(self):
+        complaint = Complaint.objects.create(assigned_department='Electrical', **complaint_payload(self.room, 'Power cut'))
+        ComplaintImage.objects.create(complaint=complaint, image=png_file())
+        out = io.StringIO()
+        call_command('process_images', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Processed 1 images (0 failed)')
+        self.assertTrue(ComplaintImage.objects.get().thumbnail.name.endswith('.jpg'))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AsyncSubmissionTests(TestCase):
+    def setUp(self):
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='ELE1', department=department, issue_category_name='Power cut', status='active'
+        )
+        self.room = create_room()
+        self.closed_room = create_room(bed_no='BED02', status='inactive')
+        self.client = APIClient()
+
+    async def compare(self, data, **kwargs):
+        # The async view answers exactly as ComplaintViewSet.create does
+        expected = await sync_to_async(self.client.post)('/api/complaints/', data, **kwargs)
+        response = await self.async_client.post('/api/complaints/submit/', data, **kwargs)
+        self.assertEqual((response.status_code, response.json()), (expected.status_code, expected.json()))
+        return response
+
+    async def test_rejected_submissions_match_the_viewset(self):
+        payload = complaint_payload(self.room, 'Power cut')
+        for data in [
+            complaint_payload(self.room, 'Leaking roof'),
+            complaint_payload(self.room, 'Power cut', bed_number='BED99'),
+            complaint_payload(self.closed_room, 'Power cut'),
+            complaint_payload(self.room, 'Power cut', priority='urgent'),
+            {**payload, 'qr_data_from_qr': 'data', 'qr_signature_from_qr': 'forged'},
+            {**payload, 'qr_data_from_qr': 'data'},
+        ]:
+            with self.subTest(data=data):
+                self.assertEqual((await self.compare(data, format='multipart')).status_code, 400)
+        response = await self.compare('{"issue_type": ', content_type='application/json')
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+    async def test_rejected_submission_leaves_no_photos_behind(self):
+        kept = await sync_to_async(ComplaintImage.objects.create)(
+            complaint=await sync_to_async(Complaint.objects.create)(**complaint_payload(self.room, 'Power cut')),
+            image=png_file()
+        )
+        buffer = io.BytesIO()
+        Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+        rejected = SimpleUploadedFile('red.png', buffer.getvalue(), content_type='image/png')
+        digest = hashlib.sha256(buffer.getvalue()).hexdigest()
+
+        data = {**complaint_payload(self.room, 'Leaking roof'), 'images': [rejected, png_file()]}
+        response = await self.async_client.post('/api/complaints/submit/', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await sync_to_async(default_storage.exists)(
+            f'complaint_images/{digest[:2]}/{digest[2:4]}/{digest}.png'
+        ))
+        # A file some row already references stays
+        self.assertTrue(await sync_to_async(default_storage.exists)(kept.image.name))
+        self.assertEqual((await StoredFile.objects.aget(name=kept.image.name)).references, 1)
+
+    async def test_submission_stores_the_complaint_and_its_photos(self):
+        data = {**complaint_payload(self.room, 'Power cut'), 'images': [png_file(), png_file('second.png')]}
+        response = await self.async_client.post('/api/complaints/submit/', data)
+        self.assertEqual(response.status_code, 201, response.json())
+        complaint = await Complaint.objects.aget(pk=response.json()['ticket_id'])
+        self.assertEqual((complaint.assigned_department, complaint.submitted_by), ('Electrical', 'Anonymous'))
+
+        # The same photo twice: one file, referenced by both rows
+        names = [image.image.name async for image in ComplaintImage.objects.filter(complaint=complaint)]
+        self.assertEqual(len(names), 2)
+        self.assertEqual(len(set(names)), 1)
+        self.assertTrue(is_content_addressed(names[0]) and default_storage.exists(names[0]))
+        self.assertEqual((await StoredFile.objects.aget(name=names[0])).references, 2)
+
+        # Now a duplicate, rejected like the viewset does
+        await self.compare(complaint_payload(self.room, 'Power cut'), format='multipart')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='ELE1', department=department, issue_category_name='Power cut', status='active'
+        )
+        self.complaint = Complaint.objects.create(
+            assigned_department='Electrical', **complaint_payload(create_room(), 'Power cut')
+        )
+
+    def test_identical_files_are_stored_once_until_the_last_is_deleted(self):
+        first = default_storage.save('complaint_images/a.PNG', ContentFile(b'same bytes'))
+        second = default_storage.save('complaint_images/b.png', ContentFile(b'same bytes'))
+        digest = hashlib.sha256(b'same bytes').hexdigest()
+        self.assertEqual(first, f'complaint_images/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertEqual(second, first)
+        self.assertEqual(StoredFile.objects.get(name=first).references, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(first)
+        self.assertTrue(default_storage.exists(first))
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(first)
+        self.assertFalse(default_storage.exists(first))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_deleting_image_rows_releases_their_files(self):
+        shared = ComplaintImage.objects.create(complaint=self.complaint, image=png_file('a.png'))
+        other = Complaint.objects.create(
+            assigned_department='Electrical', **complaint_payload(create_room(bed_no='BED02'), 'Power cut')
+        )
+        ComplaintImage.objects.create(complaint=other, image=png_file('b.png'))
+        name = shared.image.name
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shared.delete()
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+        self.assertTrue(default_storage.exists(name))
+
+        # Deleting the complaint cascades to its image rows
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().delete(f'/api/complaints/{other.ticket_id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_stored_file_is_put_back_when_its_last_reference_went_in_between(self):
+        first = default_storage.save('complaint_images/a.png', ContentFile(b'same bytes'))
+        # Written by the async submission view, not counted yet
+        upload = ContentFile(b'same bytes')
+        name = default_storage.store('complaint_images/b.png', upload)
+        self.assertEqual(name, first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(first)
+        self.assertFalse(default_storage.exists(name))
+
+        with transaction.atomic():
+            add_references(name, 1, size=upload.size)
+            default_storage.put(name, upload)
+        with default_storage.open(name) as file:
+            self.assertEqual(file.read(), b'same bytes')
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+
+    def test_rehash_moves_old_files_and_merges_duplicates(self):
+        os.makedirs(os.path.join(MEDIA_ROOT, 'complaint_images'), exist_ok=True)
+        for name in ['old_one.png', 'old_one_AbC123.png']:
+            with open(os.path.join(MEDIA_ROOT, 'complaint_images', name), 'wb') as file:
+                file.write(b'duplicate upload')
+        live = ComplaintImage.objects.create(complaint=self.complaint, image='complaint_images/old_one.png')
+        archived = ArchivedComplaint.objects.create(
+            ticket_id='ARCH01', assigned_department='Electrical', submitted_at=timezone.now(), archived_at=timezone.now(),
+            **complaint_payload(create_room(bed_no='BED02'), 'Power cut')
+        )
+        ArchivedComplaintImage.objects.create(complaint=archived, image='complaint_images/old_one_AbC123.png')
+        ArchivedComplaintImage.objects.create(complaint=archived, image='complaint_images/gone.png')
+
+        out, err = io.StringIO(), io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rehash_media', batch_size=1, stdout=out, stderr=err)
+        self.assertEqual(out.getvalue().strip(), 'Moved 2 files (1 missing)')
+        self.assertIn('complaint_images/gone.png', err.getvalue())
+
+        live.refresh_from_db()
+        self.assertTrue(is_content_addressed(live.image.name))
+        self.assertEqual(ArchivedComplaintImage.objects.filter(image=live.image.name).count(), 1)
+        self.assertEqual(StoredFile.objects.get(name=live.image.name).references, 2)
+        for name in ['old_one.png', 'old_one_AbC123.png']:
+            self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, 'complaint_images', name)))
+        with live.image.open('rb') as file:
+            self.assertEqual(file.read(), b'duplicate upload')
+
+
+class OrphanedMediaTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='ELE1', department=department, issue_category_name='Power cut', status='active'
+        )
+        complaint = Complaint.objects.create(
+            assigned_department='Electrical', **complaint_payload(create_room(), 'Power cut')
+        )
+        self.kept = [ComplaintImage.objects.create(complaint=complaint, image=png_file()).image.name]
+        # Its complaint was deleted: the row is gone but the reference count is not
+        self.orphans = [default_storage.save('complaint_images/old.png', ContentFile(b'deleted complaint'))]
+        for name in ['complaint_images/a.png', 'complaint_images/a/b.png', 'qr_codes/room_1.png']:
+            os.makedirs(os.path.dirname(default_storage.path(name)), exist_ok=True)
+            with open(default_storage.path(name), 'wb') as file:
+                file.write(b'legacy')
+        ComplaintImage.objects.create(complaint=complaint, image='complaint_images/a.png')
+        self.kept.append('complaint_images/a.png')
+        self.orphans += ['complaint_images/a/b.png', 'qr_codes/room_1.png']
+        two_days_ago = time.time() - 2 * 24 * 3600
+        for name in self.kept + self.orphans:
+            os.utime(default_storage.path(name), (two_days_ago, two_days_ago))
+        # Too recent to tell from an upload whose row isn't committed yet
+        self.kept.append(default_storage.save('complaint_images/new.png', ContentFile(b'just uploaded')))
+
+    def existing(self, names):
+        return [name for name in names if default_storage.exists(name)]
+
+    def test_dry_run_only_reports(self):
+        out = io.StringIO()
+        call_command('collect_orphaned_media', dry_run=True, stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[-1], 'Would delete 3 orphaned files (29 bytes)')
+        self.assertEqual(self.existing(self.orphans), self.orphans)
+
+    def test_unreferenced_old_files_are_deleted_in_batches(self):
+        out = io.StringIO()
+        call_command('collect_orphaned_media', batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'Deleted 2 files so far (23 bytes)',
+            'Deleted 3 files so far (29 bytes)',
+            'Deleted 3 orphaned files (29 bytes)',
+        ])
+        self.assertEqual(self.existing(self.orphans), [])
+        self.assertEqual(self.existing(self.kept), self.kept)
+        self.assertFalse(StoredFile.objects.filter(name=self.orphans[0]).exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryBudgetTests(TestCase):
+    """
+    Calls every action of every viewset with several rows in each table, so a
+    query per row pushes the request over its @query_budget and fails.
+    """
+    rows = 6
+
+    def setUp(self):
+        for i in range(self.rows):
+            department = Department.objects.create(department_code=f'D{i}', department_name=f'Dept {i}', status='active')
+            Issue_Category.objects.create(
+                issue_category_code=f'I{i}', department=department, issue_category_name=f'Issue {i}', status='active'
+            )
+            room = create_room(bed_no=f'BED{i:02}')
+            complaint = Complaint.objects.create(assigned_department=f'Dept {i}', **complaint_payload(room, f'Issue {i}'))
+            for _ in range(2):
+                ComplaintImage.objects.create(complaint=complaint, image=png_file())
+        self.room = room
+        self.complaint = complaint
+        self.client = APIClient()
+
+    def endpoint_calls(self):
+        room, ticket_id = self.room.pk, self.complaint.ticket_id
+        room_data = {
+            'bed_no': 'BED99', 'room_no': 'Room_09', 'Block': 'B', 'Floor_no': 2,
+            'ward': 'General', 'speciality': 'Medicine', 'room_type': 'Private', 'status': 'active',
+        }
+        complaint_data = complaint_payload(create_room(bed_no='BED50'), 'Issue 0')
+        return [
+            ('get', '/api/rooms/', None),
+            ('get', f'/api/rooms/{room}/', None),
+            ('post', '/api/rooms/', room_data),
+            ('put', f'/api/rooms/{room}/', {**room_data, 'bed_no': 'BED98'}),
+            ('patch', f'/api/rooms/{room}/', {'ward': 'ICU'}),
+            ('post', f'/api/rooms/{room}/update_status/', {'status': 'inactive'}),
+            ('post', '/api/rooms/bulk_import/', [{**room_data, 'bed_no': f'BED7{i}'} for i in range(5)]),
+            ('get', f'/api/rooms/{room}/qr.png/', None),
+            ('get', '/api/departments/', None),
+            ('get', '/api/departments/D0/', None),
+            ('post', '/api/departments/', {'department_code': 'D99', 'department_name': 'Dept 99', 'status': 'active'}),
+            ('put', '/api/departments/D1/', {'department_name': 'Dept 1b', 'status': 'active'}),
+            ('patch', '/api/departments/D1/', {'status': 'inactive'}),
+            ('get', '/api/issue-category/', None),
+            ('get', '/api/issue-category/I0/', None),
+            ('post', '/api/issue-category/', {
+                'issue_category_code': 'I99', 'department': 'D0', 'issue_category_name': 'Issue 99', 'status': 'active'
+            }),
+            ('put', '/api/issue-category/I2/', {'department': 'D0', 'issue_category_name': 'Issue 2b', 'status': 'active'}),
+            ('patch', '/api/issue-category/I2/', {'status': 'inactive'}),
+            ('get', '/api/complaints/', None),
+            ('get', f'/api/complaints/{ticket_id}/', None),
+            ('post', '/api/complaints/', complaint_data),
+            ('put', f'/api/complaints/{ticket_id}/', {**complaint_payload(self.room, 'Issue 5'), 'status': 'in_progress'}),
+            ('patch', f'/api/complaints/{ticket_id}/', {'priority': 'high'}),
+            ('post', f'/api/complaints/{ticket_id}/update_status/', {'status': 'resolved'}),
+            ('get', '/api/complaints/by_status/?status=open', None),
+            ('get', '/api/complaints/by_priority/?priority=medium', None),
+            ('get', '/api/report/', None),
+            ('get', '/api/report/department_priority_stats/?department=Dept 0&priority=medium', None),
+            ('get', '/api/report/all_department_stats/', None),
+            ('get', '/api/TATView/', None),
+            ('get', '/api/TATView/all_department_TATS/', None),
+            ('get', '/api/dashboard/summary/', None),
+            ('get', '/api/hotspots/heatmap/?granularity=hour', None),
+            ('get', '/api/hotspots/top/?level=ward', None),
+            ('get', '/api/report/time_in_status/', None),
+            ('get', '/api/report/?include_archived=true', None),
+            ('get', '/api/report/all_department_stats/?start_time=08:00&end_time=20:00&include_archived=true', None),
+            ('get', '/api/TATView/?include_archived=true', None),
+            ('get', '/api/TATView/all_department_TATS/?start_time=08:00&end_time=20:00&include_archived=true', None),
+            ('delete', f'/api/complaints/{ticket_id}/', None),
+            ('delete', '/api/issue-category/I3/', None),
+            ('delete', '/api/departments/D4/', None),
+            ('delete', f'/api/rooms/{room}/', None),
+        ]
+
+    def test_every_viewset_action_has_a_budget(self):
+        for name in dir(views):
+            viewset = getattr(views, name)
+            if not (isinstance(viewset, type) and issubclass(viewset, GenericViewSet)) or viewset is GenericViewSet:
+                continue
+            actions = {
+                action for route in router.get_routes(viewset)
+                for action in route.mapping.values() if hasattr(viewset, action)
+            }
+            with self.subTest(viewset=name):
+                self.assertEqual(set(getattr(viewset, 'query_budgets', {})), actions)
+
+    def test_every_action_stays_within_its_budget(self):
+        # Strict budgets are on for the whole module; any overrun raises QueryBudgetExceeded
+        for method, url, data in self.endpoint_calls():
+            with self.subTest(method=method, url=url):
+                response = getattr(self.client, method)(url, data, format='json')
+                self.assertLess(response.status_code, 400, getattr(response, 'data', None))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.registry = MetricsRegistry(self.directory, flush_interval=60)
+        patcher = mock.patch('complaints.middleware.get_metrics_registry', return_value=self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        create_room()
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/rooms/')
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'total', 'db', 'serialize'})
+        self.assertIn('desc="2 queries"', timing['db'])
+
+    async def test_async_views_run_without_the_sync_adapter(self):
+        room = await Room.objects.afirst()
+        # Django logs (in DEBUG) every handler it has to wrap for the other mode
+        with self.settings(DEBUG=True), self.assertLogs('django.request', 'DEBUG') as logs:
+            response = await self.async_client.post(
+                '/api/complaints/submit/', complaint_payload(room, 'Unknown issue'), content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([line for line in logs.output if 'adapted' in line], [])
+        # The async ORM's queries are counted like any others
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertNotIn('desc="0 queries"', timing['db'])
+
+    def test_metrics_are_labelled_by_viewset_action(self):
+        self.client.get('/api/rooms/')
+        self.client.get('/api/rooms/')
+        self.client.get('/api/report/all_department_stats/')
+
+        with mock.patch('complaints.views.get_metrics_registry', return_value=self.registry):
+            body = self.client.get('/metrics').content.decode()
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_count{view="RoomViewSet.list",method="GET",status="200"} 2', body)
+        self.assertIn('http_request_db_queries_bucket{view="RoomViewSet.list",method="GET",status="200",le="2"} 2', body)
+        self.assertIn('http_request_db_queries_count{view="ReportViewSet.all_department_stats",method="GET",status="200"} 1', body)
+
+    def test_metrics_add_up_every_workers_file(self):
+        labels = {'view': 'ComplaintViewSet.create', 'method': 'POST', 'status': 201}
+        self.registry.observe(labels, {'http_request_duration_seconds': 0.02})
+        # Another worker process sharing the metrics directory
+        with mock.patch('complaints.metrics.os.getpid', return_value=999999):
+            other_worker = MetricsRegistry(self.directory)
+            other_worker.observe(labels, {'http_request_duration_seconds': 0.3})
+
+        body = self.registry.render()
+
+        series = 'view="ComplaintViewSet.create",method="POST",status="201"'
+        self.assertIn(f'http_request_duration_seconds_bucket{{{series},le="0.025"}} 1', body)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{series},le="0.5"}} 2', body)
+        self.assertIn(f'http_request_duration_seconds_count{{{series}}} 2', body)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+@override_settings(DATABASE_ROUTERS=['complaints.routers.ReplicaRouter'])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='ELE1', department=department, issue_category_name='Power cut', status='active'
+        )
+        self.room = create_room()
+        self.client = APIClient()
+
+    def queries_per_alias(self, method, url, data=None):
+        logs = {alias: QueryLog() for alias in self.databases}
+        with ExitStack() as stack:
+            for alias, log in logs.items():
+                stack.enter_context(connections[alias].execute_wrapper(log))
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400)
+        return {alias: len(log) for alias, log in logs.items()}
+
+    def test_reports_read_from_the_replica_and_submissions_write_to_the_primary(self):
+        submit = self.queries_per_alias('post', '/api/complaints/', complaint_payload(self.room, 'Power cut'))
+        self.assertEqual(submit['replica'], 0)
+        for url in ['/api/report/all_department_stats/', '/api/report/time_in_status/', '/api/TATView/all_department_TATS/']:
+            with self.subTest(url=url):
+                report = self.queries_per_alias('get', url)
+                self.assertEqual(report['default'], 0)
+                self.assertGreater(report['replica'], 0)
+        self.assertEqual(self.queries_per_alias('get', '/api/complaints/')['replica'], 0)
+
+    def test_stale_replica_falls_back_to_the_primary(self):
+        with mock.patch('complaints.routers.replica_lag', return_value=settings.DATABASE_REPLICA_MAX_LAG + 1):
+            report = self.queries_per_alias('get', '/api/report/all_department_stats/')
+        self.assertEqual(report['replica'], 0)
+
+
+class QueryPlanTests(TestCase):
+    """Runs EXPLAIN QUERY PLAN on every query an endpoint issues and fails on full table scans."""
+
+    # Small lookup tables that are read whole on purpose (e.g. by the issue catalog),
+    # and the daily rollups that unfiltered reports add up (live rows only by default)
+    lookup_tables = {
+        'complaints_department', 'complaints_issue_category', 'complaints_complaintrollup', 'complaints_complainttatsketch'
+    }
+
+    def setUp(self):
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='IC1', department=department, issue_category_name='Power cut', status='active'
+        )
+        self.room = create_room()
+        self.complaint = Complaint.objects.create(
+            assigned_department='Electrical', **complaint_payload(self.room, 'Power cut')
+        )
+        # One complaint in each shift window, so the filtered lists are queried whatever the time of day
+        day = timezone.make_aware(timezone.datetime(2025, 6, 16))
+        for i, hour in enumerate([3, 12]):
+            complaint = Complaint.objects.create(
+                assigned_department='Electrical', **complaint_payload(create_room(bed_no=f'SHIFT{i}'), 'Power cut')
+            )
+            complaint.submitted_at = day + timezone.timedelta(hours=hour)
+            complaint.save()
+        self.client = APIClient()
+
+    def get_plans(self, method, url, data=None):
+        executed = []
+
+        def record(execute, sql, params, many, context):
+            executed.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = getattr(self.client, method)(url, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 500)
+
+        plans = []
+        for sql, params in executed:
+            if not sql.startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plans.append((sql, [row[3] for row in cursor.fetchall()]))
+        return plans
+
+    def assertNoFullScans(self, method, url, data=None):
+        for sql, plan in self.get_plans(method, url, data):
+            # Unfiltered listings are bounded by pagination; filtered queries must search an index
+            if ' WHERE ' not in sql:
+                continue
+            scans = [
+                step for step in plan
+                if re.match(r'SCAN complaints_\w+', step)
+                and step.split()[1] not in self.lookup_tables
+                # Full-text MATCH lookups show up as a SCAN of the virtual table
+                and 'VIRTUAL TABLE INDEX' not in step
+            ]
+            self.assertEqual(scans, [], f'{method.upper()} {url} scans a whole table:\n{sql}')
+
+    def test_complaint_endpoints(self):
+        ticket_id = self.complaint.ticket_id
+        for url in [
+            '/api/complaints/',
+            '/api/complaints/?status=open',
+            '/api/complaints/?priority=high',
+            '/api/complaints/?issue_type=Power%20cut',
+            '/api/complaints/?ward=General',
+            '/api/complaints/?block=A',
+            '/api/complaints/?assigned_department=Electrical',
+            '/api/complaints/?pagination=cursor',
+            '/api/complaints/?pagination=cursor&status=open&count=true',
+            f'/api/complaints/{ticket_id}/',
+            '/api/complaints/by_status/?status=open',
+            '/api/complaints/by_priority/?priority=high',
+            '/api/complaints/?format=ndjson&status=open',
+            '/api/complaints/?search=leak',
+            '/api/complaints/?search=Room_01&status=open',
+            '/api/complaints/?start_time=09:00&end_time=17:00',
+            '/api/complaints/?start_time=22:00&end_time=06:00',
+        ]:
+            with self.subTest(url=url):
+                self.assertNoFullScans('get', url)
+
+    def test_complaint_submission(self):
+        # Room lookup and the duplicate open complaint check
+        self.assertNoFullScans('post', '/api/complaints/', complaint_payload(self.room, 'Power cut'))
+
+    def test_report_endpoints(self):
+        for url in [
+            '/api/report/',
+            '/api/report/?assigned_department=Electrical&priority=medium',
+            '/api/report/department_priority_stats/?department=Electrical&priority=medium',
+            '/api/report/all_department_stats/',
+            '/api/report/all_department_stats/?department=Electrical',
+            '/api/report/all_department_stats/?submitted_at=2025-06-16',
+            '/api/TATView/',
+            '/api/TATView/all_department_TATS/',
+            '/api/TATView/all_department_TATS/?priority=high',
+            '/api/TATView/all_department_TATS/?date=2025-06-16',
+            '/api/TATView/all_department_TATS/?date=2025-06-16&start_time=09:00&end_time=17:00',
+            '/api/TATView/all_department_TATS/?start_time=22:00&end_time=06:00',
+            '/api/report/all_department_stats/?start_time=09:00&end_time=17:00',
+            '/api/report/time_in_status/',
+            '/api/hotspots/heatmap/',
+            '/api/hotspots/top/?granularity=hour&ward=General',
+            '/api/report/time_in_status/?start_date=2025-06-01&end_date=2025-06-30&department=Electrical',
+        ]:
+            with self.subTest(url=url):
+                self.assertNoFullScans('get', url)
+
+    def test_room_endpoints(self):
+        self.assertNoFullScans('get', '/api/rooms/')
+        self.assertNoFullScans('get', f'/api/rooms/{self.room.pk}/')
+        self.assertNoFullScans('post', '/api/rooms/', {
+            'bed_no': 'BED02', 'room_no': 'Room_01', 'Block': 'A', 'Floor_no': 1,
+            'ward': 'General', 'speciality': 'Medicine', 'room_type': 'Private',
+        })
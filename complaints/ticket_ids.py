@@ -0,0 +1,89 @@
+import os
+import threading
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+
+class BaseTicketIdAllocator:
+    prefix = 'SVN'
+
+    def allocate(self):
+        raise NotImplementedError('Ticket ID allocators must implement allocate()')
+
+    def discard(self):
+        # Called when an allocated ID turned out to be taken already
+        pass
+
+
+class BlockTicketIdAllocator(BaseTicketIdAllocator):
+    """
+    Hands out ticket IDs from blocks leased from the TicketSequence table.
+
+    Each process leases `block_size` numbers in one UPDATE and then allocates
+    from memory, so inserts don't need a round trip of their own. Sequence
+    numbers start at 100000, which keeps them clear of the legacy five digit
+    IDs, and `SVN` plus nine digits still fits in the ticket_id column.
+    """
+    sequence_name = 'ticket_id'
+    start = 100000
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size or settings.TICKET_ID_BLOCK_SIZE
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._pid = None
+
+    def allocate(self):
+        with self._lock:
+            # A forked worker must never reuse the block it inherited from its parent
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._lease_block()
+            value = self._next
+            self._next += 1
+        return f'{self.prefix}{value}'
+
+    def discard(self):
+        with self._lock:
+            self._end = self._next
+
+    def _lease_block(self):
+        from .models import TicketSequence
+
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    # Update first so the write lock is taken before the read
+                    updated = TicketSequence.objects.filter(name=self.sequence_name).update(
+                        next_value=F('next_value') + self.block_size
+                    )
+                    if not updated:
+                        TicketSequence.objects.create(
+                            name=self.sequence_name,
+                            next_value=self.start + self.block_size
+                        )
+                    end = TicketSequence.objects.values_list('next_value', flat=True).get(name=self.sequence_name)
+                break
+            except IntegrityError:
+                # Another process created the sequence row at the same time
+                if attempt:
+                    raise
+
+        self._next = end - self.block_size
+        self._end = end
+        self._pid = os.getpid()
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_ticket_id_allocator():
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = import_string(settings.TICKET_ID_ALLOCATOR)()
+    return _allocator
@@ -11,11 +11,19 @@ router.register(r'report',views.ReportViewSet)
 router.register(r'departments', views.DepartmentViewSet)
 router.register(r'issue-category', views.IssueCatViewset)
 router.register(r'TATView', views.TATViewSet)
+router.register(r'dashboard', views.DashboardViewSet, basename='dashboard')
+router.register(r'hotspots', views.HotspotViewSet)
 
 urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics, name='metrics'),
+    # Ahead of each router include, whose complaint detail route would take 'feed' for a ticket id
+    path('complaints/feed/', views.complaint_feed, name='complaint-feed'),
+    path('complaints/submit/', views.submit_complaint, name='complaint-submit'),
     path('', include(router.urls)),
+    path('api/complaints/feed/', views.complaint_feed),
+    path('api/complaints/submit/', views.submit_complaint),
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
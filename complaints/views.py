@@ -1,20 +1,75 @@
+import asyncio
+import csv
+import io
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags
 from django.utils import timezone
-from rest_framework import generics, status, filters
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, generics, status, filters
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.mixins import ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin,DestroyModelMixin
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Room, Complaint, Department, Issue_Category
-from .serializers import RoomSerializer, ComplaintSerializer, ComplaintCreateSerializer, ComplaintUpdateSerializer, DepartmentSerializer,IssueCatSerializer,ReportDepartment,TATserializer
-from .pagination import CustomLimitOffsetPagination
-from django.db.models import Count, Q
-from django.db.models import Avg, F, ExpressionWrapper, DurationField
-from datetime import timedelta, time
+from .models import Room, ArchivedComplaint, Complaint, ComplaintHotspot, ComplaintImage, ComplaintRollup, ComplaintTATSketch, Department, Issue_Category
+from .serializers import RoomSerializer, RoomBulkImportSerializer, ComplaintSerializer, ComplaintCreateSerializer, ComplaintUpdateSerializer, DepartmentSerializer,IssueCatSerializer,ReportDepartment,TATserializer
+from .pagination import CustomLimitOffsetPagination, ComplaintPagination
+from .dashboard import get_dashboard_summary
+from .events import FEED_FILTERS, feed_stream, hub, status_events_after
+from .query_budget import query_budget
+from .routers import ReplicaReadMixin
+from .metrics import get_metrics_registry
+from .qr import QR_IMAGE_CONTENT_TYPES, build_qr_url, get_qr_image, payload_hash, qr_image_etag
+from .renderers import PassthroughRenderer, NDJSONRenderer, CSVRenderer
+from .streaming import stream_complaints
+from .search import ComplaintSearchFilter
+from .filters import ComplaintFilter, ReportFilter, TATFilter, parse_time_of_day, submitted_time_window
+from .rollups import complaint_ticket_counts, merge_ticket_counts, tat_stats_from_complaints, tat_stats_from_sketches, ticket_counts
+from .status_history import time_in_status
+from .storage import batched_releases
+from datetime import datetime, timedelta, time
 from dateutil.parser import parse
 
+
+def day_range(day):
+    # Index friendly bounds for a whole calendar day, instead of filtering on __date
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1) - timedelta(microseconds=1)
+
+
+def include_archived(request):
+    # Reports leave out archived complaints unless asked with ?include_archived=true
+    return request.query_params.get('include_archived') == 'true'
+
+
+def with_archived(view, queryset):
+    """
+    The filtered live complaints plus the archived ones matching the same
+    filters, as one newest first list of the serializer's fields.
+    """
+    archived = view.filterset_class(
+        view.request.query_params, queryset=ArchivedComplaint.objects.all(), request=view.request
+    ).qs
+    fields = view.get_serializer_class().Meta.fields
+    return queryset.order_by().values(*fields).union(
+        archived.order_by().values(*fields), all=True
+    ).order_by('-submitted_at', '-ticket_id')
+
 # Create your views here.
+@query_budget(list=2, retrieve=1, create=2, update=3, partial_update=3, destroy=2, update_status=2, bulk_import=4, qr=1)
 class RoomViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin,DestroyModelMixin):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
@@ -36,9 +91,121 @@ class RoomViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveMode
             
         room.status = new_status
         room.save()
-        return Response(RoomSerializer(room).data)
+        return Response(self.get_serializer(room).data)
+
+    @action(detail=False, methods=['post'])
+    def bulk_import(self, request):
+        # Rooms come either as an uploaded CSV file or as a JSON list
+        csv_file = request.FILES.get('file')
+        if csv_file:
+            rows = list(csv.DictReader(io.StringIO(csv_file.read().decode('utf-8-sig'))))
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            rows = request.data.get('rooms')
 
+        if not isinstance(rows, list) or not rows:
+            return Response(
+                {'error': 'Provide a CSV file or a non-empty JSON list of rooms'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
+        key_fields = ['bed_no', 'room_no', 'Block', 'Floor_no', 'ward', 'speciality', 'room_type']
+        results = []
+        valid_rows = []
+        for row_number, row in enumerate(rows, start=1):
+            serializer = RoomBulkImportSerializer(data=row)
+            if serializer.is_valid():
+                valid_rows.append((row_number, serializer.validated_data))
+            else:
+                results.append({'row': row_number, 'status': 'error', 'errors': serializer.errors})
+
+        # Check uniqueness for the whole batch with a single query
+        existing_keys = set(Room.objects.filter(
+            bed_no__in={data['bed_no'] for _, data in valid_rows},
+            room_no__in={data['room_no'] for _, data in valid_rows},
+        ).values_list(*key_fields))
+
+        rooms = []
+        room_rows = []
+        for row_number, data in valid_rows:
+            key = tuple(data[field] for field in key_fields)
+            if key in existing_keys:
+                results.append({
+                    'row': row_number,
+                    'status': 'error',
+                    'errors': {'non_field_errors': ['A room with these exact details already exists. All fields (except status) must be unique together.']}
+                })
+                continue
+            existing_keys.add(key)
+            rooms.append(Room(**data))
+            room_rows.append(row_number)
+
+        # bulk_create skips save(), so encode the payloads here
+        for room in rooms:
+            room.refresh_qr_payload()
+
+        with transaction.atomic():
+            Room.objects.bulk_create(rooms, batch_size=500)
+
+        for row_number, room in zip(room_rows, rooms):
+            results.append({'row': row_number, 'status': 'created', 'id': room.pk})
+        results.sort(key=lambda result: result['row'])
+
+        failed = len(results) - len(rooms)
+        if not failed:
+            response_status = status.HTTP_201_CREATED
+        elif rooms:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response({
+            'created': len(rooms),
+            'failed': failed,
+            'results': results
+        }, status=response_status)
+
+    @action(detail=True, methods=['get'], url_path=r'qr\.(?P<image_format>png|svg)',
+            renderer_classes=[JSONRenderer, PassthroughRenderer])
+    def qr(self, request, pk=None, image_format='png'):
+        room = self.get_object()
+
+        try:
+            box_size = int(request.query_params.get('box_size', 10))
+            border = int(request.query_params.get('border', 4))
+        except ValueError:
+            return Response(
+                {'error': 'box_size and border must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (1 <= box_size <= 40 and 0 <= border <= 10):
+            return Response(
+                {'error': 'box_size must be between 1 and 40 and border between 0 and 10'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Room.save() keeps the payload and its hash current, so the ETag needs no signing or
+        # hashing; rooms last saved before the hash was stored are encoded here instead
+        dataenc, qr_hash = room.dataenc, room.qr_hash
+        if not (dataenc and qr_hash):
+            dataenc = room.get_room_data()
+            qr_hash = payload_hash(build_qr_url(dataenc))
+        etag = f'"{qr_image_etag(qr_hash, image_format, box_size, border)}"'
+
+        # Let browsers and print stations revalidate without downloading the image again,
+        # answered before rendering so a cache miss costs nothing either
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            _, image = get_qr_image(build_qr_url(dataenc), image_format, box_size, border, qr_hash=qr_hash)
+            response = HttpResponse(image, content_type=QR_IMAGE_CONTENT_TYPES[image_format])
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+@query_budget(list=2, retrieve=1, create=3, update=4, partial_update=4, destroy=4)
 class DepartmentViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
@@ -48,8 +215,9 @@ class DepartmentViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, Retrie
     filterset_fields = ['department_name','status']
     search_fields = ['department_code', 'department_name']
 
+@query_budget(list=2, retrieve=1, create=4, update=5, partial_update=5, destroy=2)
 class IssueCatViewset(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin):
-    queryset = Issue_Category.objects.all()
+    queryset = Issue_Category.objects.select_related('department')
     serializer_class = IssueCatSerializer
     pagination_class = CustomLimitOffsetPagination
     lookup_field = 'issue_category_code'
@@ -57,15 +225,21 @@ class IssueCatViewset(GenericViewSet, ListModelMixin, CreateModelMixin, Retrieve
     filterset_fields = ['issue_category_code', 'department', 'issue_category_name', 'status']
     search_fields = ['issue_category_code', 'department__department_name', 'issue_category_name']
 
+# Writes also keep the search index, report rollups and TAT sketches up to date,
+# and each uploaded photo counts a reference to its stored file.
+# by_status/by_priority stream, so their queries run after the view returns.
+@query_budget(list=3, retrieve=2, create=22, update=17, partial_update=17, destroy=18, update_status=21, by_status=2, by_priority=2)
 class ComplaintViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin):
-    queryset = Complaint.objects.all().order_by('-submitted_at')
+    queryset = Complaint.objects.prefetch_related('images').order_by('-submitted_at')
     lookup_field = 'ticket_id'
-    pagination_class = CustomLimitOffsetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['status', 'priority', 'issue_type', 'ward', 'block','assigned_department']
+    pagination_class = ComplaintPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, ComplaintSearchFilter]
+    filterset_class = ComplaintFilter
     search_fields = ['ticket_id', 'room_number', 'bed_number', 'description']
     ordering_fields = ['submitted_at', 'priority', 'status']
     ordering = ['-submitted_at']  # default ordering
+    # ?format=ndjson or ?format=csv streams the whole (filtered) list as an export
+    renderer_classes = [JSONRenderer, BrowsableAPIRenderer, NDJSONRenderer, CSVRenderer]
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -74,9 +248,23 @@ class ComplaintViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, Retriev
             return ComplaintUpdateSerializer
         return ComplaintSerializer
 
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format in ('ndjson', 'csv'):
+            return self.stream(self.filter_queryset(self.get_queryset()))
+        return super().list(request, *args, **kwargs)
+
+    def stream(self, queryset):
+        export_format = self.request.accepted_renderer.format
+        return stream_complaints(queryset, self.get_serializer_class(), export_format, self.get_serializer_context())
+
     def perform_create(self, serializer):
         serializer.save(submitted_by=self.request.user.username if self.request.user.is_authenticated else "Anonymous")
 
+    def perform_destroy(self, instance):
+        # The deleted image rows release their files together, not one row at a time
+        with transaction.atomic(), batched_releases():
+            instance.delete()
+
     @action(detail=True, methods=['post'])
     def update_status(self, request, ticket_id=None):
         complaint = self.get_object()
@@ -116,8 +304,7 @@ class ComplaintViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, Retriev
             )
             
         complaints = self.queryset.filter(status=status_filter)
-        serializer = self.get_serializer(complaints, many=True)
-        return Response(serializer.data)
+        return self.stream(complaints)
 
     @action(detail=False, methods=['get'])
     def by_priority(self, request):
@@ -129,15 +316,21 @@ class ComplaintViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, Retriev
             )
             
         complaints = self.queryset.filter(priority=priority_filter)
-        serializer = self.get_serializer(complaints, many=True)
-        return Response(serializer.data)
+        return self.stream(complaints)
 
-class ReportViewSet(GenericViewSet, ListModelMixin):
+@query_budget(list=2, department_priority_stats=1, all_department_stats=2, time_in_status=1)
+class ReportViewSet(ReplicaReadMixin, GenericViewSet, ListModelMixin):
     queryset = Complaint.objects.all()
     serializer_class = ReportDepartment
-    pagination_class = CustomLimitOffsetPagination
+    pagination_class = ComplaintPagination
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['assigned_department', 'priority', 'status', 'submitted_at']
+    filterset_class = ReportFilter
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and include_archived(self.request):
+            return with_archived(self, queryset)
+        return queryset
 
     @action(detail=False, methods=['get'])
     def department_priority_stats(self, request):
@@ -158,15 +351,11 @@ class ReportViewSet(GenericViewSet, ListModelMixin):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Get counts for the specific department and priority
-        stats = self.queryset.filter(
-            assigned_department=department,
-            priority=priority
-        ).aggregate(
-            open_tickets=Count('ticket_id', filter=Q(status='open')),
-            resolved_tickets=Count('ticket_id', filter=Q(status='resolved')),
-            total_tickets=Count('ticket_id')
-        )
+        # Get counts for the specific department and priority from the rollups
+        rollups = ComplaintRollup.objects.filter(assigned_department=department, priority=priority)
+        if not include_archived(request):
+            rollups = rollups.filter(archived=False)
+        stats = rollups.aggregate(**ticket_counts())
 
         # Add department and priority to the response
         stats['department'] = department
@@ -181,61 +370,155 @@ class ReportViewSet(GenericViewSet, ListModelMixin):
         department = request.query_params.get('department')
         status_filter = request.query_params.get('status')  # Renamed to avoid conflict
         submitted_at = request.query_params.get('submitted_at')
-
-        # Start with base queryset
-        queryset = self.queryset
+        start_time = request.query_params.get('start_time')  # Format: HH:MM (24-hour)
+        end_time = request.query_params.get('end_time')  # Format: HH:MM (24-hour)
+        archived = include_archived(request)
+
+        if start_time or end_time:
+            # Shift windows can't be read from the daily rollups, count the complaints
+            # submitted inside the window instead (indexed on the stored minute of day)
+            try:
+                window = submitted_time_window(
+                    parse_time_of_day(start_time) if start_time else None,
+                    parse_time_of_day(end_time) if end_time else None
+                )
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            querysets = [Complaint.objects.filter(window)]
+            if archived:
+                querysets.append(ArchivedComplaint.objects.filter(window))
+            counts = complaint_ticket_counts()
+        else:
+            # Start with the rollups, one row per day, department, priority and status
+            querysets = [ComplaintRollup.objects.all() if archived else ComplaintRollup.objects.filter(archived=False)]
+            counts = ticket_counts()
 
         # Apply filters if provided
+        filters = {}
         if priority:
             if priority not in dict(Complaint.PRIORITY_CHOICES):
                 return Response(
                     {'error': 'Invalid priority value'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            queryset = queryset.filter(priority=priority)
+            filters['priority'] = priority
 
         if department:
-            queryset = queryset.filter(assigned_department=department)
+            filters['assigned_department'] = department
 
         if status_filter:
-            queryset = queryset.filter(status=status_filter)
+            filters['status'] = status_filter
 
         if submitted_at:
-            queryset = queryset.filter(submitted_at__date=submitted_at)
+            try:
+                submitted_on = parse_date(submitted_at)
+            except ValueError:
+                # Well formed but not a real date, e.g. 2025-13-40
+                submitted_on = None
+            if submitted_on is None:
+                return Response(
+                    {'error': 'Invalid submitted_at value. Use YYYY-MM-DD'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if start_time or end_time:
+                filters['submitted_at__range'] = day_range(submitted_on)
+            else:
+                filters['day'] = submitted_on
 
         # Get all combinations of department and priority with their counts
-        stats = queryset.values('assigned_department', 'priority').annotate(
-            open_tickets=Count('ticket_id', filter=Q(status='open')),
-            resolved_tickets=Count('ticket_id', filter=Q(status='resolved')),
-            total_tickets=Count('ticket_id')
-        ).order_by('assigned_department', 'priority')
+        # (rollup rows can be left at zero once their complaints moved on)
+        grouped = [
+            queryset.filter(**filters).values('assigned_department', 'priority').annotate(
+                **counts
+            ).filter(total_tickets__gt=0).order_by('assigned_department', 'priority')
+            for queryset in querysets
+        ]
+        # Live and archived complaints are counted separately and added up here
+        stats = grouped[0] if len(grouped) == 1 else merge_ticket_counts(*grouped)
+
+        # Paginate the results; the page count doubles as the emptiness check
+        page = self.paginate_queryset(stats)
+        if page is not None:
+            page = [self.department_stats_row(row) for row in page]
 
         # If no results found before pagination, return empty response with message
-        if not stats.exists():
+        if not (self.paginator.count if page is not None else stats):
             return Response({
                 'message': 'No data found for the specified filters',
                 'filters_applied': {
                     'priority': priority,
                     'department': department,
                     'status': status_filter,
-                    'submitted_at': submitted_at
+                    'submitted_at': submitted_at,
+                    'start_time': start_time,
+                    'end_time': end_time,
+                    'include_archived': archived
                 }
             }, status=status.HTTP_200_OK)
 
-        # Paginate the results
-        page = self.paginate_queryset(stats)
         if page is not None:
-            return self.get_paginated_response(list(page))
+            return self.get_paginated_response(page)
 
-        return Response(stats)
+        return Response([self.department_stats_row(row) for row in stats])
+
+    @action(detail=False, methods=['get'])
+    def time_in_status(self, request):
+        # Window of status changes, inclusive dates; the last 30 days by default
+        priority = request.query_params.get('priority')
+        department = request.query_params.get('department')
+        end_date = request.query_params.get('end_date')
+        start_date = request.query_params.get('start_date')
+
+        try:
+            end_on = parse_date(end_date) if end_date else timezone.localdate()
+            start_on = parse_date(start_date) if start_date else (end_on and end_on - timedelta(days=29))
+        except ValueError:
+            end_on = start_on = None
+        if start_on is None or end_on is None or start_on > end_on:
+            return Response(
+                {'error': 'Invalid start_date/end_date. Use YYYY-MM-DD, with start_date on or before end_date'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if priority and priority not in dict(Complaint.PRIORITY_CHOICES):
+            return Response(
+                {'error': 'Invalid priority value'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = time_in_status(
+            day_range(start_on)[0],
+            day_range(end_on)[0] + timedelta(days=1),
+            department=department,
+            priority=priority
+        )
+        return Response({
+            'filters_applied': {
+                'start_date': start_on,
+                'end_date': end_on,
+                'department': department,
+                'priority': priority
+            },
+            'results': results
+        })
+
+    def department_stats_row(self, row):
+        # Complaints without a department are counted under '' in the rollups
+        return {**row, 'assigned_department': row['assigned_department'] or None}
 
     
-class TATViewSet(GenericViewSet, ListModelMixin):
+@query_budget(list=2, all_department_TATS=5)
+class TATViewSet(ReplicaReadMixin, GenericViewSet, ListModelMixin):
     queryset = Complaint.objects.all()
     serializer_class = TATserializer
-    pagination_class = CustomLimitOffsetPagination
+    pagination_class = ComplaintPagination
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['priority', 'status']
+    filterset_class = TATFilter
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and include_archived(self.request):
+            return with_archived(self, queryset)
+        return queryset
 
     @action(detail=False, methods=['get'])
     def all_department_TATS(self, request):
@@ -244,9 +527,11 @@ class TATViewSet(GenericViewSet, ListModelMixin):
         date = request.query_params.get('date')  # Format: YYYY-MM-DD
         start_time = request.query_params.get('start_time')  # Format: HH:MM (24-hour)
         end_time = request.query_params.get('end_time')  # Format: HH:MM (24-hour)
+        archived = include_archived(request)
 
-        # Start with base queryset
-        queryset = self.queryset
+        # Filters for the complaints, and the daily TAT sketches for the same filters
+        conditions = Q()
+        sketches = ComplaintTATSketch.objects.all() if archived else ComplaintTATSketch.objects.filter(archived=False)
 
         # Apply priority filter if provided
         if priority:
@@ -255,69 +540,32 @@ class TATViewSet(GenericViewSet, ListModelMixin):
                     {'error': 'Invalid priority value'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            queryset = queryset.filter(priority=priority)
+            conditions &= Q(priority=priority)
+            sketches = sketches.filter(priority=priority)
 
         # Handle date and time filtering
         try:
+            # Validate time format
+            start_time_obj = end_time_obj = None
+            if start_time:
+                start_time_obj = parse_time_of_day(start_time, 'Invalid start time format. Use HH:MM (24-hour)')
+            if end_time:
+                end_time_obj = parse_time_of_day(end_time, 'Invalid end time format. Use HH:MM (24-hour)')
+
             if date:
                 # Parse the date
                 parsed_date = parse(date)
                 if not parsed_date:
                     raise ValueError("Invalid date format")
 
-                # If time range is provided
-                if start_time or end_time:
-                    # Validate time format
-                    if start_time:
-                        try:
-                            # Parse start time
-                            start_hour, start_minute = map(int, start_time.split(':'))
-                            if not (0 <= start_hour <= 23 and 0 <= start_minute <= 59):
-                                raise ValueError("Invalid time format")
-                            start_datetime = parsed_date.replace(hour=start_hour, minute=start_minute)
-                        except ValueError:
-                            raise ValueError("Invalid start time format. Use HH:MM (24-hour)")
-                    else:
-                        # If no start time, use start of day
-                        start_datetime = parsed_date.replace(hour=0, minute=0)
-
-                    if end_time:
-                        try:
-                            # Parse end time
-                            end_hour, end_minute = map(int, end_time.split(':'))
-                            if not (0 <= end_hour <= 23 and 0 <= end_minute <= 59):
-                                raise ValueError("Invalid time format")
-                            end_datetime = parsed_date.replace(hour=end_hour, minute=end_minute)
-                        except ValueError:
-                            raise ValueError("Invalid end time format. Use HH:MM (24-hour)")
-                    else:
-                        # If no end time, use end of day
-                        end_datetime = parsed_date.replace(hour=23, minute=59)
-
-                    # Apply datetime range filter
-                    queryset = queryset.filter(
-                        submitted_at__gte=start_datetime,
-                        submitted_at__lte=end_datetime
-                    )
-                else:
-                    # If no time range, filter for the entire day
-                    queryset = queryset.filter(submitted_at__date=parsed_date)
-            elif start_time or end_time:
-                # Only time filtering, across all dates
-                if start_time:
-                    start_hour, start_minute = map(int, start_time.split(':'))
-                    start_time_obj = time(start_hour, start_minute)
-                else:
-                    start_time_obj = time(0, 0)
-                if end_time:
-                    end_hour, end_minute = map(int, end_time.split(':'))
-                    end_time_obj = time(end_hour, end_minute)
-                else:
-                    end_time_obj = time(23, 59)
-                queryset = queryset.filter(
-                    submitted_at__time__gte=start_time_obj,
-                    submitted_at__time__lte=end_time_obj
-                )
+                # Filter for the entire day
+                conditions &= Q(submitted_at__range=day_range(parsed_date.date()))
+                sketches = sketches.filter(day=parsed_date.date())
+
+            # If time range is provided, keep the complaints submitted inside it (on any
+            # date unless one is given). Uses the stored minute of day so it can be indexed.
+            if start_time or end_time:
+                conditions &= submitted_time_window(start_time_obj, end_time_obj)
         except ValueError as e:
             return Response({
                 'error': str(e),
@@ -332,24 +580,25 @@ class TATViewSet(GenericViewSet, ListModelMixin):
                 }
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Calculate TAT for resolved tickets
-        resolved_tickets = queryset.filter(
-            status='resolved',
-            resolved_at__isnull=False
-        ).annotate(
-            tat=ExpressionWrapper(
-                F('resolved_at') - F('submitted_at'),
-                output_field=DurationField()
+        queryset = self.queryset.filter(conditions)
+        archived_queryset = ArchivedComplaint.objects.filter(conditions)
+
+        # TAT statistics per department and priority. Whole days merge the stored
+        # daily sketches; time of day windows have to look at the resolved tickets.
+        if start_time or end_time:
+            tat_summary, department_tats = tat_stats_from_complaints(queryset, *([archived_queryset] if archived else []))
+        else:
+            tat_summary, department_tats = tat_stats_from_sketches(sketches)
+        tat_stats = {**tat_summary.as_dict(), 'department_tats': department_tats}
+
+        if archived:
+            fields = self.get_serializer_class().Meta.fields
+            queryset = queryset.values(*fields).union(archived_queryset.values(*fields), all=True).order_by(
+                '-submitted_at', '-ticket_id'
             )
-        )
 
         # Get total tickets count
         total_tickets = queryset.count()
-        
-        # Calculate average TAT for resolved tickets
-        avg_tat = resolved_tickets.aggregate(
-            avg_tat=Avg('tat')
-        )['avg_tat']
 
         # Add individual ticket TATs
         # for ticket in queryset:
@@ -379,12 +628,13 @@ class TATViewSet(GenericViewSet, ListModelMixin):
 
             response_data = {
                 'total_tickets': total_tickets,
-                'average_tat': str(avg_tat) if avg_tat else '-',
+                **tat_stats,
                 'filters_applied': {
                     'priority': priority,
                     'date': date,
                     'start_time': start_time,
-                    'end_time': end_time
+                    'end_time': end_time,
+                    'include_archived': archived
                 },
                 'count': count,
                 'next': next_link,
@@ -398,13 +648,215 @@ class TATViewSet(GenericViewSet, ListModelMixin):
             serializer = self.get_serializer(queryset, many=True)
             response_data = {
                 'total_tickets': total_tickets,
-                'average_tat': str(avg_tat) if avg_tat else '-',
+                **tat_stats,
                 'filters_applied': {
                     'priority': priority,
                     'date': date,
                     'start_time': start_time,
-                    'end_time': end_time
+                    'end_time': end_time,
+                    'include_archived': archived
                 },
                 'results': serializer.data  # Unpaginated results
             }
-            return Response(response_data)
\ No newline at end of file
+            return Response(response_data)
+
+
+# Levels the hotspot ranking can group by, and the location fields each one keeps apart
+HOTSPOT_LEVELS = {
+    'block': ['block'],
+    'ward': ['block', 'ward'],
+    'room': ['block', 'ward', 'room_number'],
+}
+
+
+def parse_bound(value, end=False):
+    # A date means the whole day: midnight for a start, the next midnight for an end
+    day = parse_date(value)
+    if day is not None:
+        return day_range(day)[0] + timedelta(days=1 if end else 0)
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+
+@query_budget(heatmap=2, top=1)
+class HotspotViewSet(ReplicaReadMixin, GenericViewSet):
+    queryset = ComplaintHotspot.objects.all()
+    pagination_class = CustomLimitOffsetPagination
+
+    def get_hotspots(self, request):
+        """
+        Counter rows for ?granularity=hour|day (default day) whose bucket starts
+        between ?start and ?end (dates or ISO datetimes; the last 7 days by
+        default), narrowed by ?block, ?ward, ?room_number and ?issue_type.
+        """
+        params = request.query_params
+        granularity = params.get('granularity', 'day')
+        if granularity not in dict(ComplaintHotspot.PERIOD_CHOICES):
+            raise ValueError('Invalid granularity. Use hour or day')
+        try:
+            end = parse_bound(params['end'], end=True) if params.get('end') else timezone.now()
+            start = parse_bound(params['start']) if params.get('start') else end - timedelta(days=7)
+        except ValueError:
+            raise ValueError('Invalid start/end. Use YYYY-MM-DD or an ISO 8601 date and time')
+        hotspots = self.get_queryset().filter(period=granularity, bucket_start__gte=start, bucket_start__lt=end)
+        for field in ('block', 'ward', 'room_number', 'issue_type'):
+            if params.get(field):
+                hotspots = hotspots.filter(**{field: params[field]})
+        filters_applied = {
+            'granularity': granularity, 'start': start, 'end': end,
+            **{field: params.get(field) for field in ('block', 'ward', 'room_number', 'issue_type')}
+        }
+        return hotspots, filters_applied
+
+    @action(detail=False, methods=['get'])
+    def heatmap(self, request):
+        # Complaints per room and time bucket, oldest bucket first
+        try:
+            hotspots, filters_applied = self.get_hotspots(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        cells = hotspots.values('bucket_start', 'block', 'ward', 'room_number').annotate(
+            complaints=Sum('count')
+        ).order_by('bucket_start', 'block', 'ward', 'room_number')
+        page = self.paginate_queryset(cells)
+        if page is not None:
+            response = self.get_paginated_response(page)
+            response.data['filters_applied'] = filters_applied
+            return response
+        return Response({'filters_applied': filters_applied, 'results': list(cells)})
+
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        # The ?limit (default 10) hottest rooms, or wards or blocks with ?level=
+        level = request.query_params.get('level', 'room')
+        if level not in HOTSPOT_LEVELS:
+            return Response({'error': 'Invalid level. Use room, ward or block'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            hotspots, filters_applied = self.get_hotspots(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        fields = HOTSPOT_LEVELS[level]
+        ranking = hotspots.values(*fields).annotate(complaints=Sum('count')).order_by('-complaints', *fields)[:limit]
+        return Response({'filters_applied': {**filters_applied, 'level': level}, 'results': list(ranking)})
+
+
+@query_budget(summary=1)
+class DashboardViewSet(ReplicaReadMixin, GenericViewSet):
+    queryset = Complaint.objects.all()
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        # Everything the dashboard shows in one call, cached for a few seconds
+        return Response(get_dashboard_summary())
+
+
+def metrics(request):
+    # Prometheus scrape endpoint for the request metrics of all workers
+    return HttpResponse(get_metrics_registry().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def complaint_feed(request):
+    """
+    Server-Sent Events stream of new complaints and status changes, narrowed
+    with ?department=, ?ward= and ?priority= (comma separated for several).
+    Meant to be served over ASGI, where a connected client is a waiting
+    coroutine rather than a busy worker thread. A reconnecting client's
+    Last-Event-ID header replays what it missed. Under WSGI the endless stream
+    would hold a worker forever, so the feed answers 501 there instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'detail': 'The complaint feed is only served over ASGI (complaintsystem.asgi:application).'}, status=501
+        )
+    filters = {}
+    for param, field in FEED_FILTERS.items():
+        values = request.GET.get(param)
+        if values:
+            filters[field] = set(values.split(','))
+    unknown = filters.get('priority', set()) - {value for value, label in Complaint.PRIORITY_CHOICES}
+    if unknown:
+        return JsonResponse({'priority': [f"Unknown priority: {', '.join(sorted(unknown))}"]}, status=400)
+
+    # Subscribed before catching up, so nothing falls between the two
+    subscription = hub.subscribe(filters)
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    missed = []
+    if last_event_id.isdigit():
+        missed = await sync_to_async(status_events_after)(int(last_event_id), settings.COMPLAINT_FEED_MAX_PENDING)
+    response = StreamingHttpResponse(feed_stream(subscription, missed), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Don't let nginx buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def submission_data(request):
+    # What DRF's request.data holds for the JSON and form bodies ComplaintViewSet.create accepts
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError as exc:
+            raise exceptions.ParseError(f'JSON parse error - {exc}')
+    if request.content_type not in ('', 'multipart/form-data', 'application/x-www-form-urlencoded'):
+        raise exceptions.UnsupportedMediaType(request.content_type)
+    data = request.POST.copy()
+    data.update(request.FILES)
+    return data
+
+
+def submitting_user(request):
+    # Authenticated the way ComplaintViewSet would be
+    return Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]).user
+
+
+def save_submission(serializer, user, stored_images):
+    with transaction.atomic():
+        serializer.save(
+            submitted_by=user.username if user.is_authenticated else "Anonymous", stored_images=stored_images
+        )
+    return serializer.data
+
+
+@csrf_exempt
+async def submit_complaint(request):
+    """
+    POST /api/complaints/ as a native async view, for the public QR
+    submission form under ASGI. The catalog, room and duplicate lookups run
+    side by side through the async ORM, and the photos are written to storage
+    on other threads while they do, instead of one after another on a
+    blocked worker thread. The photos of a rejected submission are deleted
+    again. Accepts the same fields and answers with the same payloads and
+    status codes.
+    """
+    try:
+        if request.method != 'POST':
+            raise exceptions.MethodNotAllowed(request.method)
+        user = await sync_to_async(submitting_user)(request)
+        data = await sync_to_async(submission_data, thread_sensitive=False)(request)
+    except exceptions.APIException as exc:
+        # SessionAuthentication comes first, so DRF answers authentication failures with a 403 too
+        code = status.HTTP_403_FORBIDDEN if isinstance(exc, exceptions.AuthenticationFailed) else exc.status_code
+        return JsonResponse({'detail': exc.detail}, status=code)
+
+    images = data.getlist('images') if hasattr(data, 'getlist') else []
+    upload_to = ComplaintImage._meta.get_field('image')
+    stores = asyncio.gather(*(
+        sync_to_async(default_storage.store, thread_sensitive=False)(upload_to.generate_filename(None, image.name), image)
+        for image in images
+    ))
+    serializer = ComplaintCreateSerializer(data=data, context={'request': request})
+    valid = await serializer.ais_valid()
+    names = await stores
+    if not valid:
+        await sync_to_async(default_storage.discard)(names)
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST, encoder=encoders.JSONEncoder)
+
+    stored_images = list(zip(names, images))
+    complaint = await sync_to_async(save_submission)(serializer, user, stored_images)
+    return JsonResponse(complaint, status=status.HTTP_201_CREATED, encoder=encoders.JSONEncoder)
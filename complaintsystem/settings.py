@@ -26,6 +26,74 @@ SECRET_KEY = 'django-insecure-_8&9w)pek%vf&9%w+)t9_@g$)s12m8&9n^330uda-lgg0*i+ir
 # Secret key for QR code HMAC
 QR_CODE_SECRET_KEY = 'YOUR_VERY_STRONG_RANDOM_QR_SECRET_KEY_HERE' # CHANGE THIS IN PRODUCTION
 
+# Upper bound for the in-process cache of rendered QR images (bytes)
+QR_IMAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Ticket IDs are allocated from blocks that each worker process leases from the database
+TICKET_ID_ALLOCATOR = 'complaints.ticket_ids.BlockTicketIdAllocator'
+TICKET_ID_BLOCK_SIZE = 100
+TICKET_ID_MAX_ATTEMPTS = 3
+
+# Active issue categories are cached per process and reloaded when the version in the
+# shared cache (CACHES below) changes; the max age is a safety net on top of that.
+ISSUE_CATALOG_MAX_AGE = 60
+
+# Rows fetched and serialized per batch when streaming complaint exports
+COMPLAINT_STREAM_CHUNK_SIZE = 500
+
+# Resolution SLA per priority, in hours from submission. Run `manage.py rebuild_rollups`
+# after changing these so the stored SLA breach counts are recounted.
+COMPLAINT_SLA_HOURS = {'high': 4, 'medium': 24, 'low': 72}
+
+# Resolved and closed complaints older than this many days are moved to the
+# archive tables by `manage.py archive_complaints`
+COMPLAINT_ARCHIVE_AFTER_DAYS = 365
+
+# Seconds between the run_sla_monitor command's scans for newly breached tickets
+SLA_MONITOR_INTERVAL = 60
+
+# Seconds the /api/dashboard/summary/ figures are cached for
+DASHBOARD_CACHE_TTL = 5
+
+# Live feed of complaint events at /api/complaints/feed/ (Server-Sent Events).
+# The default backend has each worker tail ComplaintStatusEvent every
+# COMPLAINT_EVENTS_POLL_INTERVAL seconds, so events reach clients on every
+# worker; complaints.events.LocalBackend only delivers within one process.
+COMPLAINT_EVENTS_BACKEND = 'complaints.events.StatusEventBackend'
+COMPLAINT_EVENTS_POLL_INTERVAL = 1
+# Seconds between keepalive comments on an idle stream, and how many events
+# may wait for a slow client before it is disconnected
+COMPLAINT_FEED_HEARTBEAT = 15
+COMPLAINT_FEED_MAX_PENDING = 100
+
+# Complaint photos are downscaled and recompressed after upload, on a pool of
+# IMAGE_PIPELINE_WORKERS threads per process (0 processes them in the request).
+# Longest side in pixels of the stored image and of each variant.
+IMAGE_PIPELINE_WORKERS = 2
+COMPLAINT_IMAGE_SIZES = {'image': 2048, 'preview': 1024, 'thumbnail': 256}
+COMPLAINT_IMAGE_QUALITY = 85
+
+# Viewsets declare how many queries each action may run (complaints/query_budget.py).
+# Going over budget logs a warning, or raises when strict (the test suite turns this on).
+QUERY_BUDGET_STRICT = False
+
+# Request metrics served at /metrics. Each worker process writes its totals to a
+# file in METRICS_DIR (at most every METRICS_FLUSH_INTERVAL seconds) and /metrics
+# adds them up. Clear the directory when the server is (re)started.
+METRICS_DIR = os.environ.get('METRICS_DIR', BASE_DIR / 'metrics')
+METRICS_FLUSH_INTERVAL = 5
+
+# The issue catalog version and the dashboard summary have to be seen by every worker,
+# so the cache is kept on disk rather than in each process's memory. Use Redis
+# (django.core.cache.backends.redis.RedisCache) when the workers span several hosts.
+CACHE_DIR = os.environ.get('CACHE_DIR', BASE_DIR / 'cache')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+    }
+}
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -48,6 +116,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'complaints.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -85,9 +154,39 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # SQLite tuning for one writer and many readers
+        'OPTIONS': {
+            # Write-ahead logging: readers (and the replica connection) don't block the writer
+            'init_command': 'PRAGMA journal_mode=WAL',
+            # Every transaction takes the write lock when it begins. SQLite ignores
+            # select_for_update, and a deferred transaction that reads before it writes
+            # fails with "database is locked" if another writer got in first, instead of
+            # waiting. Status changes, rollup and TAT sketch upserts, file reference
+            # counts, SLA escalations and archiving all read then write in one atomic().
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # A file based test database lets concurrency tests use several connections
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # Report and TAT reads (complaints/routers.py). By default a read only connection
+    # to the same file; point DATABASE_REPLICA_PATH at a snapshot kept fresh with
+    # `manage.py refresh_replica` to move report reads off the primary file entirely.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{os.environ.get('DATABASE_REPLICA_PATH', BASE_DIR / 'db.sqlite3')}?mode=ro",
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_ROUTERS = ['complaints.routers.ReplicaRouter']
+
+# Reports fall back to the primary while the replica is further behind than this (seconds)
+DATABASE_REPLICA_MAX_LAG = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -170,3 +269,11 @@ CORS_ALLOWED_ORIGINS = [
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Uploads are stored under their SHA-256 content hash in sharded directories
+# (complaint_images/ab/cd/<hash>.jpg), so identical files are kept once.
+# `manage.py rehash_media` moves files saved before this into place.
+STORAGES = {
+    'default': {'BACKEND': 'complaints.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}